@@ -112,7 +112,11 @@ class CarBrandLogoService {
 
     /// Check if local asset exists
     func hasLocalAsset(for make: String) -> Bool {
-        UIImage(named: assetName(for: make)) != nil
+        let name = assetName(for: make)
+        if let index = AssetIndex.shared {
+            return index.logos[name] != nil
+        }
+        return UIImage(named: name) != nil
     }
 }
 
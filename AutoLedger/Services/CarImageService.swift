@@ -1,6 +1,33 @@
 import SwiftUI
 import UIKit
 
+/// Index of the bundled car images and logos, generated by scripts/asset_index.py
+/// (AssetIndex.json) whenever the setup scripts change the asset catalog.
+/// Loaded once, so availability checks are dictionary lookups instead of
+/// `UIImage(named:)` probes.
+struct AssetIndex: Decodable {
+    struct Entry: Decodable {
+        let width: Double?
+        let height: Double?
+        let sha256: String
+        let thumbnail: Bool?
+        let vector: Bool?
+    }
+
+    let version: Int
+    let cars: [String: Entry]
+    let logos: [String: Entry]
+
+    /// nil when the resource is missing or unreadable; callers then probe the catalog
+    static let shared: AssetIndex? = {
+        guard let url = Bundle.main.url(forResource: "AssetIndex", withExtension: "json"),
+              let data = try? Data(contentsOf: url) else {
+            return nil
+        }
+        return try? JSONDecoder().decode(AssetIndex.self, from: data)
+    }()
+}
+
 /// Service for loading pre-generated car images from bundled assets
 enum CarImageService {
 
@@ -25,12 +52,47 @@ enum CarImageService {
 
     /// Check if a car image exists in assets
     static func hasImage(make: String, model: String) -> Bool {
-        UIImage(named: assetName(make: make, model: model)) != nil
+        let name = assetName(make: make, model: model)
+        if let index = AssetIndex.shared {
+            return index.cars[name] != nil
+        }
+        return UIImage(named: name) != nil
     }
 
     /// Load car image from assets
     static func loadImage(make: String, model: String) -> UIImage? {
-        UIImage(named: assetName(make: make, model: model))
+        let name = assetName(make: make, model: model)
+        if let index = AssetIndex.shared, index.cars[name] == nil {
+            return nil
+        }
+        return UIImage(named: name)
+    }
+
+    /// Views at most this tall use the list-thumbnail imageset ("<asset>_thumb")
+    static let thumbnailMaxHeight: CGFloat = 120
+
+    /// Load the car image sized for a view of the given height
+    /// - Parameters:
+    ///   - make: Vehicle manufacturer (e.g., "Hyundai")
+    ///   - model: Vehicle model (e.g., "Creta")
+    ///   - height: Display height in points
+    /// - Returns: The thumbnail imageset for small views (falling back to the hero one), else the hero image
+    static func loadImage(make: String, model: String, height: CGFloat) -> UIImage? {
+        let name = assetName(make: make, model: model)
+        guard let index = AssetIndex.shared else {
+            if height <= thumbnailMaxHeight, let thumbnail = UIImage(named: "\(name)_thumb") {
+                return thumbnail
+            }
+            return UIImage(named: name)
+        }
+        guard let entry = index.cars[name] else {
+            return nil
+        }
+        if height <= thumbnailMaxHeight, entry.thumbnail == true,
+           let thumbnail = UIImage(named: "\(name)_thumb") {
+            return thumbnail
+        }
+        return UIImage(named: name)
     }
 }
 
@@ -43,7 +105,7 @@ struct CarImageView: View {
     var cornerRadius: CGFloat = 16
 
     var body: some View {
-        if let uiImage = CarImageService.loadImage(make: make, model: model) {
+        if let uiImage = CarImageService.loadImage(make: make, model: model, height: size) {
             Image(uiImage: uiImage)
                 .resizable()
                 .scaledToFit()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Size budget for the bundled asset catalog.
+
+Nothing told us when Assets.xcassets grew — CarImages reached 26 MB and one
+logo SVG is over 23k lines before anyone looked. This script walks every
+imageset in the catalog and measures, per imageset:
+
+  bytes     on-disk size of its image files (what the app bundle ships)
+  size      pixel dimensions of the largest file; for vector logos (SVG,
+            PDF) the intrinsic size in points
+  decoded   memory of the bitmap UIKit creates when it is drawn: width x
+            height x 4 bytes for the largest scale a device loads, and for
+            vectors the intrinsic size rendered at @3x
+
+then rolls them up per catalog group (CarImages, CarLogos, top level) and
+per make (car images and logos; thumbnail imagesets count with their car).
+
+The measurements are compared with a baseline stored in asset_budget.json
+next to the Xcode project, which also holds the budgets:
+
+  total_bytes / group_bytes   hard caps for the catalog and each group
+  imageset_bytes              cap for any single imageset
+  imageset_decoded_bytes      cap for any single raster imageset's decoded bitmap
+  vector_decoded_bytes        the same for vector imagesets, whose intrinsic
+                              size is often an accident of the SVG export
+  max_growth                  allowed growth of the total over the baseline
+
+Any exceeded budget is printed and the script exits with status 1, so it
+can gate a build. The full measurements go to a JSON report; the console
+shows the top-N offenders by size, decoded memory and growth.
+
+Usage (after setup_car_images.py / setup_logos.py / setup_vector_logos.py):
+    python3 scripts/asset_budget.py                    # check, exit 1 if over budget
+    python3 scripts/asset_budget.py --top 20 --report /tmp/assets.json
+    python3 scripts/asset_budget.py --update-baseline  # accept the current catalog
+
+Dependencies: pip3 install Pillow
+"""
+
+import os
+import sys
+import json
+import argparse
+import unicodedata
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    print("Error: Pillow is required. Install with:")
+    print("  pip3 install Pillow")
+    exit(1)
+
+from asset_index import vector_size
+
+# Configuration
+PROJECT_DIR = Path("/Users/sohail/AutoLedger")
+ASSETS_ROOT = PROJECT_DIR / "AutoLedger/Resources/Assets.xcassets"
+BUDGET_FILE = PROJECT_DIR / "asset_budget.json"
+REPORT_FILE = PROJECT_DIR / "CarImages/asset_report.json"
+TOP_N = 10
+
+MB = 1024 * 1024
+DEFAULT_BUDGETS = {
+    "total_bytes": 32 * MB,
+    "group_bytes": {"CarImages": 28 * MB, "CarLogos": 2 * MB},
+    "imageset_bytes": 1 * MB,
+    "imageset_decoded_bytes": 4 * MB,  # a 1200x800 hero is 3.7 MB decoded
+    "vector_decoded_bytes": 32 * MB,   # a logo's intrinsic size at @3x (Xcode rasterizes at it)
+    "max_growth": 0.05,
+}
+
+RASTER_SUFFIXES = (".jpg", ".jpeg", ".png", ".heic", ".webp", ".avif")
+VECTOR_SUFFIXES = (".svg", ".pdf")
+VECTOR_RENDER_SCALE = 3
+BYTES_PER_PIXEL = 4
+
+# ---------------------------------------------------------------------------
+# Measuring
+# ---------------------------------------------------------------------------
+
+def measure_file(path: Path, scale: int) -> dict:
+    """Bytes, dimensions and decoded footprint of one image file."""
+    entry = {"file": path.name, "bytes": path.stat().st_size, "scale": scale,
+             "width": None, "height": None, "decoded_bytes": 0, "vector": False}
+    suffix = path.suffix.lower()
+    if suffix in VECTOR_SUFFIXES:
+        entry["vector"] = True
+        size = vector_size(path)
+        if size:
+            entry["width"], entry["height"] = round(size[0], 1), round(size[1], 1)
+            entry["decoded_bytes"] = int(size[0] * VECTOR_RENDER_SCALE * size[1] * VECTOR_RENDER_SCALE
+                                         * BYTES_PER_PIXEL)
+        return entry
+    try:
+        # Reads the header only
+        with Image.open(path) as img:
+            entry["width"], entry["height"] = img.size
+        entry["decoded_bytes"] = entry["width"] * entry["height"] * BYTES_PER_PIXEL
+    except Exception:
+        pass  # e.g. HEIC without the pillow-heif plugin; bytes are still counted
+    return entry
+
+
+def file_scales(imageset: Path) -> dict[str, int]:
+    """filename -> scale (1 for universal files) from an imageset's Contents.json."""
+    try:
+        with open(imageset / "Contents.json") as f:
+            images = json.load(f).get("images", [])
+    except (OSError, ValueError):
+        return {}
+    return {image["filename"]: int(image.get("scale", "1x").rstrip("x"))
+            for image in images if "filename" in image}
+
+
+def make_key(name: str) -> str:
+    """Normalized make/asset key: no diacritics, lowercase, underscores (Mercedes-Benz -> mercedes_benz)."""
+    plain = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return plain.lower().replace("-", "_").replace(" ", "_")
+
+
+def make_of(group: str, name: str, makes: list[str]) -> str | None:
+    """Make an imageset belongs to: logos are their make, car images start with it."""
+    key = make_key(name)
+    if group == "CarLogos":
+        return key
+    if group != "CarImages":
+        return None
+    # Longest known make first, so land_rover_* isn't filed under a make "land"
+    for make in makes:
+        if key.startswith(make + "_"):
+            return make
+    return key.split("_", 1)[0]
+
+
+def scan(root: Path) -> list[dict]:
+    """One record per imageset under `root`."""
+    imagesets = []
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames.sort()
+        for dirname in dirnames:
+            if not dirname.endswith(".imageset"):
+                continue
+            path = Path(dirpath) / dirname
+            scales = file_scales(path)
+            files = [measure_file(path / f, scales.get(f, 1)) for f in sorted(os.listdir(path))
+                     if f.lower().endswith(RASTER_SUFFIXES + VECTOR_SUFFIXES)]
+            group = Path(dirpath).relative_to(root).as_posix()
+            largest = max(files, key=lambda f: f["decoded_bytes"], default=None)
+            imagesets.append({
+                "group": group,
+                "name": dirname[:-len(".imageset")],
+                "bytes": sum(f["bytes"] for f in files),
+                # A device loads one scale, so the footprint is the largest file's
+                "decoded_bytes": largest["decoded_bytes"] if largest else 0,
+                "width": largest["width"] if largest else None,
+                "height": largest["height"] if largest else None,
+                "vector": any(f["vector"] for f in files),
+                "files": files,
+            })
+    makes = sorted((make_key(s["name"]) for s in imagesets if s["group"] == "CarLogos"),
+                   key=len, reverse=True)
+    for imageset in imagesets:
+        imageset["make"] = make_of(imageset["group"], imageset["name"], makes)
+    return imagesets
+
+
+def summarize(imagesets: list[dict]) -> dict:
+    """Totals for the catalog, each group and each make."""
+    def rollup(records):
+        return {"imagesets": len(records), "bytes": sum(r["bytes"] for r in records),
+                "decoded_bytes": sum(r["decoded_bytes"] for r in records)}
+
+    groups, makes = {}, {}
+    for record in imagesets:
+        groups.setdefault(record["group"], []).append(record)
+        if record["make"]:
+            makes.setdefault(record["make"], []).append(record)
+    return {
+        "total": rollup(imagesets),
+        "groups": {g: rollup(r) for g, r in sorted(groups.items())},
+        "makes": {m: rollup(r) for m, r in sorted(makes.items())},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Budgets and baseline
+# ---------------------------------------------------------------------------
+
+def imageset_key(record: dict) -> str:
+    return f"{record['group']}/{record['name']}"
+
+
+def load_budget_file(path: Path) -> tuple[dict, dict | None]:
+    """(budgets, baseline or None) — missing budget keys fall back to DEFAULT_BUDGETS."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    budgets = {**DEFAULT_BUDGETS, **data.get("budgets", {})}
+    return budgets, data.get("baseline")
+
+
+def save_budget_file(path: Path, budgets: dict, summary: dict, imagesets: list[dict]):
+    """Store `budgets` and the current measurements as the new baseline, atomically."""
+    payload = {
+        "budgets": budgets,
+        "baseline": {
+            "total": summary["total"],
+            "groups": summary["groups"],
+            "imagesets": {imageset_key(r): r["bytes"] for r in imagesets},
+        },
+    }
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(payload, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def compare(imagesets: list[dict], baseline: dict | None) -> dict:
+    """Per-imageset changes against the baseline: grown/shrunk (by bytes), added, removed."""
+    if not baseline:
+        return {"grown": [], "added": [], "removed": []}
+    before = baseline.get("imagesets", {})
+    now = {imageset_key(r): r["bytes"] for r in imagesets}
+    grown = sorted(((k, now[k] - before[k]) for k in now.keys() & before.keys() if now[k] != before[k]),
+                   key=lambda kv: -kv[1])
+    return {
+        "grown": [{"imageset": k, "delta_bytes": d} for k, d in grown],
+        "added": sorted(now.keys() - before.keys()),
+        "removed": sorted(before.keys() - now.keys()),
+    }
+
+
+def check(imagesets: list[dict], summary: dict, budgets: dict, baseline: dict | None) -> list[str]:
+    """Human-readable budget violations (empty when everything fits)."""
+    failures = []
+    total = summary["total"]["bytes"]
+    if total > budgets["total_bytes"]:
+        failures.append(f"catalog is {total / MB:.1f} MB, budget {budgets['total_bytes'] / MB:.1f} MB")
+    for group, limit in budgets["group_bytes"].items():
+        size = summary["groups"].get(group, {}).get("bytes", 0)
+        if size > limit:
+            failures.append(f"{group} is {size / MB:.1f} MB, budget {limit / MB:.1f} MB")
+    for record in imagesets:
+        if record["bytes"] > budgets["imageset_bytes"]:
+            failures.append(f"{imageset_key(record)} is {record['bytes'] // 1024} KB, "
+                            f"budget {budgets['imageset_bytes'] // 1024} KB")
+        limit = budgets["vector_decoded_bytes" if record["vector"] else "imageset_decoded_bytes"]
+        if record["decoded_bytes"] > limit:
+            failures.append(f"{imageset_key(record)} decodes to {record['decoded_bytes'] / MB:.1f} MB, "
+                            f"budget {limit / MB:.1f} MB")
+    if baseline and baseline.get("total", {}).get("bytes"):
+        before = baseline["total"]["bytes"]
+        growth = (total - before) / before
+        if growth > budgets["max_growth"]:
+            failures.append(f"catalog grew {growth * 100:.1f}% over the baseline "
+                            f"({before / MB:.1f} -> {total / MB:.1f} MB), "
+                            f"allowed {budgets['max_growth'] * 100:.0f}%")
+    return failures
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def top(records: list[dict], field: str, n: int) -> list[dict]:
+    return sorted(records, key=lambda r: r[field], reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the asset catalog against its size budget.")
+    parser.add_argument("--top", type=int, default=TOP_N, help=f"offenders to list (default {TOP_N})")
+    parser.add_argument("--report", type=Path, default=REPORT_FILE, help="JSON report path")
+    parser.add_argument("--budget-file", type=Path, default=BUDGET_FILE,
+                        help="budgets and baseline (default asset_budget.json in the project)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the current catalog as the baseline instead of failing on growth")
+    args = parser.parse_args()
+
+    if not ASSETS_ROOT.exists():
+        print(f"Error: Asset catalog not found: {ASSETS_ROOT}")
+        sys.exit(1)
+
+    imagesets = scan(ASSETS_ROOT)
+    summary = summarize(imagesets)
+    budgets, baseline = load_budget_file(args.budget_file)
+    changes = compare(imagesets, baseline)
+    failures = check(imagesets, summary, budgets, None if args.update_baseline else baseline)
+
+    report = {
+        "catalog": str(ASSETS_ROOT),
+        "budgets": budgets,
+        **summary,
+        "changes": changes,
+        "failures": failures,
+        "imagesets": imagesets,
+    }
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=1)
+
+    total = summary["total"]
+    print(f"Asset catalog: {ASSETS_ROOT}")
+    print("-" * 60)
+    print(f"  {'total':<12} {total['imagesets']:>4} imagesets  {total['bytes'] / MB:7.1f} MB  "
+          f"{total['decoded_bytes'] / MB:8.1f} MB decoded")
+    for group, s in summary["groups"].items():
+        print(f"  {group:<12} {s['imagesets']:>4} imagesets  {s['bytes'] / MB:7.1f} MB  "
+              f"{s['decoded_bytes'] / MB:8.1f} MB decoded")
+    if baseline:
+        before = baseline["total"]["bytes"]
+        print(f"  vs baseline  {(total['bytes'] - before) / MB:+7.2f} MB "
+              f"({len(changes['added'])} added, {len(changes['removed'])} removed, "
+              f"{len(changes['grown'])} changed)")
+
+    print("\nLargest imagesets:")
+    for r in top(imagesets, "bytes", args.top):
+        print(f"  {r['bytes'] // 1024:>6} KB  {imageset_key(r)}")
+    print("\nLargest decoded footprint:")
+    for r in top(imagesets, "decoded_bytes", args.top):
+        unit = "pt" if r["vector"] else "px"
+        print(f"  {r['decoded_bytes'] / MB:6.1f} MB  {imageset_key(r)} ({r['width']}x{r['height']}{unit})")
+    print("\nLargest makes:")
+    for make, s in sorted(summary["makes"].items(), key=lambda kv: -kv[1]["bytes"])[:args.top]:
+        print(f"  {s['bytes'] / MB:6.2f} MB  {make} ({s['imagesets']} imagesets)")
+    if changes["grown"]:
+        print("\nGrowth since baseline:")
+        for change in changes["grown"][:args.top]:
+            if change["delta_bytes"] > 0:
+                print(f"  {change['delta_bytes'] / 1024:+7.0f} KB  {change['imageset']}")
+    print(f"\nReport: {args.report}")
+
+    if args.update_baseline:
+        save_budget_file(args.budget_file, budgets, summary, imagesets)
+        print(f"Baseline updated: {args.budget_file}")
+    if failures:
+        print(f"\nOVER BUDGET ({len(failures)}):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nWithin budget")
+
+
+if __name__ == "__main__":
+    main()
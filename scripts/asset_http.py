@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for the asset scripts.
+
+urllib.request.urlopen opens a new connection (and TLS handshake) per call.
+This module keeps per-host pools of keep-alive http.client connections
+instead, so repeated calls to api.openai.com, carwale.com or
+upload.wikimedia.org reuse sockets:
+
+- at most POOL_SIZE connections per host, callers block when all are busy
+- separate connect and read timeouts
+- gzip responses decoded transparently (Accept-Encoding: gzip is sent)
+- redirects followed for GET/HEAD
+- non-2xx responses raise urllib.error.HTTPError, like urlopen, so existing
+  retry code that checks `e.code` keeps working
+- response hooks see the status and headers of every final response, e.g.
+  for rate-limit headers on successful calls (add_response_hook)
+
+Usage:
+    import asset_http
+
+    with asset_http.request("GET", url, headers={...}) as resp:
+        data = resp.read()
+"""
+
+import ssl
+import zlib
+import threading
+import http.client
+import urllib.error
+from io import BytesIO
+from urllib.parse import urlsplit, urljoin
+
+# Configuration
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+POOL_SIZE = 8
+MAX_REDIRECTS = 5
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class HostPool:
+    """Idle keep-alive connections for one (scheme, host, port), capped at `size` in use."""
+
+    def __init__(self, scheme: str, host: str, port: int | None, size: int,
+                 context: ssl.SSLContext | None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.context = context
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def new_connection(self, connect_timeout: float) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=connect_timeout,
+                                               context=self.context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=connect_timeout)
+
+    def checkout(self) -> http.client.HTTPConnection | None:
+        """Take a slot; return an idle connection if there is one."""
+        self.slots.acquire()
+        with self.lock:
+            return self.idle.pop() if self.idle else None
+
+    def checkin(self, conn: http.client.HTTPConnection | None, reusable: bool):
+        """Give the slot back, keeping the connection for reuse if it is still clean."""
+        if conn is not None:
+            if reusable:
+                with self.lock:
+                    self.idle.append(conn)
+            else:
+                conn.close()
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle.clear()
+
+
+class Response:
+    """A response whose connection goes back to the pool once the body is consumed."""
+
+    def __init__(self, url: str, raw: http.client.HTTPResponse, release):
+        self.url = url
+        self.raw = raw
+        self.status = raw.status
+        self.reason = raw.reason
+        self.headers = raw.headers
+        self._release = release
+        self._decoder = None
+        if (raw.headers.get("Content-Encoding") or "").lower() == "gzip":
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, amt: int | None = None) -> bytes:
+        """Read (and gunzip if needed) up to `amt` raw bytes, or everything if `amt` is None."""
+        if self._release is None and self.raw.isclosed():
+            return b""
+        while True:
+            data = self.raw.read() if amt is None else self.raw.read(amt)
+            if self._decoder is None:
+                out = data
+            elif amt is None:
+                out = self._decoder.decompress(data) + self._decoder.flush()
+            else:
+                out = self._decoder.decompress(data) if data else self._decoder.flush()
+            # A gzip header alone decodes to nothing — keep reading rather than signal EOF
+            if out or not data or amt is None:
+                break
+        if amt is None or self.raw.isclosed():
+            self._finish()
+        return out
+
+    def _finish(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            # A fully read response leaves the connection clean for the next request
+            release(self.raw.isclosed() and not self.raw.will_close)
+
+    def close(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            self.raw.close()
+            release(False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._release is not None and not exc[0]:
+            # Drain small leftovers so the connection can be reused
+            try:
+                self.raw.read()
+            except Exception:
+                pass
+            self._finish()
+        self.close()
+
+
+class Client:
+    """Pooled HTTP client shared by the asset scripts."""
+
+    def __init__(self, connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 pool_size: int = POOL_SIZE, context: ssl.SSLContext | None = None,
+                 default_headers: dict | None = None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.context = context
+        self.default_headers = {"Accept-Encoding": "gzip", **(default_headers or {})}
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def _pool(self, scheme: str, host: str, port: int | None) -> HostPool:
+        key = (scheme, host, port)
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = HostPool(scheme, host, port, self.pool_size, self.context)
+                self.pools[key] = pool
+            return pool
+
+    def request(self, method: str, url: str, headers: dict | None = None, body=None,
+                timeout: float | None = None) -> Response:
+        """Send a request and return a Response. Raises urllib.error.HTTPError for non-2xx."""
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(method, url, headers, body, timeout)
+            if resp.status in REDIRECT_CODES and method in ("GET", "HEAD") \
+                    and resp.headers.get("Location"):
+                resp.read()
+                url = urljoin(url, resp.headers["Location"])
+                continue
+            break
+
+        for hook in list(_response_hooks):
+            hook(url, resp.status, resp.headers)
+
+        if not 200 <= resp.status < 300:
+            error_body = resp.read()
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers,
+                                         BytesIO(error_body))
+        return resp
+
+    def _send(self, method: str, url: str, headers: dict | None, body,
+              timeout: float | None) -> Response:
+        parts = urlsplit(url)
+        pool = self._pool(parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+
+        all_headers = {**self.default_headers, **(headers or {})}
+        read_timeout = timeout if timeout is not None else self.read_timeout
+
+        conn = pool.checkout()
+        # A reused connection may have been closed by the server while idle — retry once fresh
+        for fresh in ((False, True) if conn is not None else (True,)):
+            if fresh:
+                conn = pool.new_connection(self.connect_timeout)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body=body, headers=all_headers)
+                raw = conn.getresponse()
+                break
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if fresh:
+                    pool.checkin(None, False)
+                    raise
+            except BaseException:
+                conn.close()
+                pool.checkin(None, False)
+                raise
+
+        held = conn
+        return Response(url, raw, lambda reusable: pool.checkin(held, reusable))
+
+    def close(self):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.close()
+
+
+# ---------------------------------------------------------------------------
+# Module-level default client
+# ---------------------------------------------------------------------------
+
+_client = None
+_client_lock = threading.Lock()
+_response_hooks = []
+
+
+def add_response_hook(hook):
+    """Call `hook(url, status, headers)` for every final response of any client."""
+    _response_hooks.append(hook)
+
+
+def remove_response_hook(hook):
+    if hook in _response_hooks:
+        _response_hooks.remove(hook)
+
+
+def configure(**kwargs) -> Client:
+    """Replace the shared client, e.g. configure(read_timeout=300, pool_size=16)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = Client(**kwargs)
+        return _client
+
+
+def get_client() -> Client:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client()
+        return _client
+
+
+def request(method: str, url: str, headers: dict | None = None, body=None,
+            timeout: float | None = None) -> Response:
+    """Send a request through the shared pooled client."""
+    return get_client().request(method, url, headers=headers, body=body, timeout=timeout)
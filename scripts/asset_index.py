@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Generated index of the car images and logos bundled in the asset catalog.
+
+CarImageService.hasImage() and BrandfetchService.hasLocalAsset() used to
+answer "is there an image for this car/make?" by calling UIImage(named:),
+an asset-catalog lookup (and, when found, a decode) on every row and card.
+The setup scripts already know exactly which imagesets they wrote, so they
+now also write AutoLedger/Resources/AssetIndex.json:
+
+  {"version": 1,
+   "cars":  {"maruti_suzuki_baleno": {"width": 900, "height": 600,
+                                      "sha256": "3f1c...", "thumbnail": true}, ...},
+   "logos": {"Maruti_Suzuki": {"width": 300.0, "height": 200.0,
+                               "sha256": "9b07...", "vector": true}, ...}}
+
+keyed by asset name (CarImageService.assetName() / BrandfetchService.assetName()),
+with the largest file's size (pixels; points for SVG/PDF), a short content
+hash over all files of the imageset (and the car's thumbnail imageset), and
+whether a list-thumbnail imageset exists. The app loads it once and answers
+availability with a dictionary lookup.
+
+setup_car_images.py rewrites the "cars" section, setup_logos.py and
+setup_vector_logos.py the "logos" section; the file is only written when it
+changed. Pixel sizes need Pillow; without it the sizes are left out.
+
+Usage:
+    python3 scripts/asset_index.py     # rebuild both sections from the catalog
+
+    import asset_index
+    asset_index.update("cars", ASSETS_DIR)
+"""
+
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from asset_inventory import sha256_file
+
+# Configuration
+CATALOG_DIR = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/Assets.xcassets")
+INDEX_FILE = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/AssetIndex.json")
+INDEX_VERSION = 1
+SECTIONS = {"cars": "CarImages", "logos": "CarLogos"}  # section -> catalog group
+HASH_LENGTH = 16  # hex digits; enough to tell versions apart
+
+RASTER_SUFFIXES = (".jpg", ".jpeg", ".png", ".heic", ".webp", ".avif")
+VECTOR_SUFFIXES = (".svg", ".pdf")
+THUMB_SUFFIX = "_thumb"
+
+SVG_WIDTH = re.compile(rb'<svg[^>]*?\swidth="\s*([\d.]+)\s*(px|pt|mm|cm|in)?\s*"')
+SVG_HEIGHT = re.compile(rb'<svg[^>]*?\sheight="\s*([\d.]+)\s*(px|pt|mm|cm|in)?\s*"')
+SVG_VIEWBOX = re.compile(rb'<svg[^>]*?\sviewBox="\s*[-\d.]+[\s,]+[-\d.]+[\s,]+([\d.]+)[\s,]+([\d.]+)')
+# CSS units in SVG px, which iOS draws as points
+SVG_UNITS = {None: 1.0, b"px": 1.0, b"pt": 96 / 72, b"mm": 96 / 25.4, b"cm": 96 / 2.54, b"in": 96.0}
+PDF_MEDIABOX = re.compile(rb"/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]")
+
+
+# ---------------------------------------------------------------------------
+# Measuring
+# ---------------------------------------------------------------------------
+
+def vector_size(path: Path) -> tuple[float, float] | None:
+    """Intrinsic (width, height) in points of an SVG or PDF, or None if it can't be read."""
+    data = path.read_bytes()
+    if path.suffix.lower() == ".pdf":
+        match = PDF_MEDIABOX.search(data)
+        if not match:
+            return None
+        x0, y0, x1, y1 = (float(v) for v in match.groups())
+        return abs(x1 - x0), abs(y1 - y0)
+    head = data[:64 * 1024]  # the root <svg> element, not 23k lines of paths
+    w, h = SVG_WIDTH.search(head), SVG_HEIGHT.search(head)
+    if w and h:
+        return float(w.group(1)) * SVG_UNITS[w.group(2)], float(h.group(1)) * SVG_UNITS[h.group(2)]
+    box = SVG_VIEWBOX.search(head)
+    return (float(box.group(1)), float(box.group(2))) if box else None
+
+
+def image_size(path: Path) -> tuple[float, float] | None:
+    """(width, height) of an image file — points for vectors, pixels (header only) otherwise."""
+    if path.suffix.lower() in VECTOR_SUFFIXES:
+        return vector_size(path)
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None  # e.g. HEIC without the pillow-heif plugin
+
+
+def image_files(imageset_dir: Path) -> list[Path]:
+    return sorted(p for p in imageset_dir.iterdir()
+                  if p.suffix.lower() in RASTER_SUFFIXES + VECTOR_SUFFIXES)
+
+
+def describe(imageset_dir: Path, hashes: dict[str, str] | None = None,
+             extra_files: list[Path] = ()) -> dict | None:
+    """Index entry for one imageset, or None if it holds no image.
+
+    `hashes` maps "<name>.imageset/<file>" to known SHA-256s (e.g. from the
+    asset inventory); other files are hashed. `extra_files` (a thumbnail
+    imageset's) count towards the content hash only.
+    """
+    files = image_files(imageset_dir)
+    if not files:
+        return None
+    digest = hashlib.sha256()
+    for path in files + list(extra_files):
+        known = (hashes or {}).get(f"{path.parent.name}/{path.name}")
+        digest.update((known or sha256_file(path)).encode())
+
+    entry = {"sha256": digest.hexdigest()[:HASH_LENGTH]}
+    vector = any(p.suffix.lower() in VECTOR_SUFFIXES for p in files)
+    sizes = [size for size in map(image_size, files) if size]
+    if sizes:
+        width, height = max(sizes, key=lambda s: s[0] * s[1])
+        entry["width"], entry["height"] = (round(width, 1), round(height, 1)) if vector else (width, height)
+    if vector:
+        entry["vector"] = True
+    return entry
+
+
+def build(group_dir: Path, hashes: dict[str, str] | None = None, thumbnails: bool = False) -> dict:
+    """{asset name: entry} for every imageset in `group_dir`.
+
+    With `thumbnails`, "<asset>_thumb" imagesets fold into their car's entry
+    as "thumbnail": true instead of being listed themselves.
+    """
+    try:
+        names = sorted(e.name[:-len(".imageset")] for e in os.scandir(group_dir)
+                       if e.is_dir() and e.name.endswith(".imageset"))
+    except FileNotFoundError:
+        return {}
+    present = set(names)
+    index = {}
+    for name in names:
+        if thumbnails and name.endswith(THUMB_SUFFIX) and name[:-len(THUMB_SUFFIX)] in present:
+            continue
+        has_thumb = thumbnails and f"{name}{THUMB_SUFFIX}" in present
+        thumb_files = image_files(group_dir / f"{name}{THUMB_SUFFIX}.imageset") if has_thumb else []
+        entry = describe(group_dir / f"{name}.imageset", hashes, thumb_files)
+        if entry is None:
+            continue
+        if has_thumb:
+            entry["thumbnail"] = True
+        index[name] = entry
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Index file
+# ---------------------------------------------------------------------------
+
+def load() -> dict:
+    try:
+        with open(INDEX_FILE, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_VERSION, **{section: {} for section in SECTIONS}}
+
+
+def update(section: str, group_dir: Path, hashes: dict[str, str] | None = None) -> bool:
+    """Rebuild one section from `group_dir` and write the index if it changed. Returns True if written."""
+    index = load()
+    index[section] = build(group_dir, hashes, thumbnails=section == "cars")
+    # Compact: it ships in the app bundle and is parsed at launch
+    text = json.dumps(index, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+    try:
+        if INDEX_FILE.read_text(encoding="utf-8") == text:
+            return False
+    except OSError:
+        pass
+    tmp = INDEX_FILE.with_name(f".{INDEX_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, INDEX_FILE)
+    return True
+
+
+def main():
+    for section, group in SECTIONS.items():
+        written = update(section, CATALOG_DIR / group)
+        count = len(load()[section])
+        print(f"  {section:<5} {count:>4} entries{' (written)' if written else ' (unchanged)'}")
+    print(f"Index: {INDEX_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Content-hash inventory of the CarImages tree and the bundled car imagesets.
+
+The asset scripts used to decide what to do by probing the filesystem
+(exists() per model, glob + re-read every PNG), and a half-written PNG from an
+interrupted run looked exactly like a finished one. This module keeps a
+persisted index (CarImages/inventory.json) of every file in four areas:
+
+  raw         CarImages/*.png                     generated originals
+  references  CarImages/references/*              CarWale reference photos
+  optimized   CarImages/optimized/*               optimize_car_images.py output and variants
+  imagesets   Assets.xcassets/CarImages/*.imageset/*  bundled images
+
+with size, mtime, SHA-256 and a cheap structural check (PNG IEND trailer,
+JPEG EOI marker, RIFF length) that flags truncated or corrupt files.
+refresh() does one os.scandir pass per directory and only re-hashes files
+whose size or mtime changed, so a warm refresh costs a few stat calls.
+
+Usage:
+    python3 scripts/asset_inventory.py            # refresh and summarize
+    python3 scripts/asset_inventory.py --corrupt  # list truncated/corrupt files
+
+    from asset_inventory import Inventory
+    inventory = Inventory()
+    inventory.refresh(["raw"])
+    if inventory.is_complete("raw", "tata_nexon.png"): ...
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+# Configuration
+CAR_IMAGES_DIR = Path("/Users/sohail/AutoLedger/CarImages")
+ASSETS_DIR = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/Assets.xcassets/CarImages")
+INVENTORY_FILE = CAR_IMAGES_DIR / "inventory.json"
+INVENTORY_VERSION = 1
+
+HASH_CHUNK = 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"IEND\xaeB`\x82"
+
+
+def area_dirs() -> dict:
+    """Directory and file suffixes scanned for each area."""
+    return {
+        "raw": (CAR_IMAGES_DIR, (".png",)),
+        "references": (CAR_IMAGES_DIR / "references", (".png", ".jpg", ".jpeg", ".webp", ".img")),
+        "optimized": (CAR_IMAGES_DIR / "optimized", (".jpg", ".webp", ".avif", ".heic")),
+        "imagesets": (ASSETS_DIR, (".jpg", ".jpeg", ".png", ".heic", ".webp", ".avif")),
+    }
+
+
+# ---------------------------------------------------------------------------
+# File checks
+# ---------------------------------------------------------------------------
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def looks_complete(path: Path, size: int) -> bool:
+    """Cheap truncation check from the first and last bytes of an image file."""
+    if size < 16:
+        return False
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(-12, os.SEEK_END)
+        tail = f.read(12)
+
+    if head.startswith(PNG_SIGNATURE):
+        return tail.endswith(PNG_IEND)
+    if head.startswith(b"\xff\xd8"):
+        # Some encoders pad after EOI; accept the marker anywhere in the tail
+        return b"\xff\xd9" in tail
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return int.from_bytes(head[4:8], "little") + 8 == size
+    # Unknown format (HEIC, SVG...) — nothing cheap to check
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Inventory
+# ---------------------------------------------------------------------------
+
+class Inventory:
+    """Persisted {area: {relative name: entry}} index with incremental refresh."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path or INVENTORY_FILE)
+        self.areas = {}
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == INVENTORY_VERSION:
+                self.areas = data.get("areas", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self.lock:
+            payload = json.dumps({"version": INVENTORY_VERSION, "areas": self.areas},
+                                 separators=(",", ":"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(payload)
+        os.replace(tmp, self.path)
+
+    def _entry_for(self, previous: dict | None, path: Path, st: os.stat_result) -> dict:
+        if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+            return previous
+        return {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": sha256_file(path),
+            "valid": looks_complete(path, st.st_size),
+        }
+
+    def _scan(self, directory: Path, suffixes: tuple, nested: bool) -> dict:
+        """name -> (path, stat) for one area, with one scandir per directory."""
+        found = {}
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if nested and entry.is_dir():
+                # imagesets: <asset>.imageset/<asset>.jpg
+                for child in os.scandir(entry.path):
+                    if child.is_file() and child.name.lower().endswith(suffixes):
+                        found[f"{entry.name}/{child.name}"] = (Path(child.path), child.stat())
+            elif not nested and entry.is_file() and entry.name.lower().endswith(suffixes):
+                found[entry.name] = (Path(entry.path), entry.stat())
+        return found
+
+    def refresh(self, areas: list[str] | None = None, save: bool = True) -> dict:
+        """Rescan `areas` (default all). Returns {area: {"hashed": n, "removed": n, "total": n}}."""
+        stats = {}
+        for area, (directory, suffixes) in area_dirs().items():
+            if areas is not None and area not in areas:
+                continue
+            with self.lock:
+                previous = self.areas.get(area, {})
+            current = {}
+            hashed = 0
+            for name, (path, st) in self._scan(directory, suffixes, area == "imagesets").items():
+                entry = self._entry_for(previous.get(name), path, st)
+                if entry is not previous.get(name):
+                    hashed += 1
+                current[name] = entry
+            with self.lock:
+                self.areas[area] = current
+            stats[area] = {
+                "hashed": hashed,
+                "removed": len(set(previous) - set(current)),
+                "total": len(current),
+            }
+        if save:
+            self.save()
+        return stats
+
+    def update_file(self, area: str, name: str, path: Path):
+        """Record a file a script just wrote, without rescanning its directory."""
+        st = path.stat()
+        with self.lock:
+            previous = self.areas.setdefault(area, {}).get(name)
+        entry = self._entry_for(previous, path, st)
+        with self.lock:
+            self.areas[area][name] = entry
+
+    def remove(self, area: str, name: str):
+        with self.lock:
+            self.areas.get(area, {}).pop(name, None)
+
+    # -- queries ------------------------------------------------------------
+
+    def entry(self, area: str, name: str) -> dict | None:
+        with self.lock:
+            return self.areas.get(area, {}).get(name)
+
+    def is_complete(self, area: str, name: str) -> bool:
+        """True if the file is present and passed the truncation check."""
+        entry = self.entry(area, name)
+        return bool(entry and entry["valid"])
+
+    def sha256(self, area: str, name: str) -> str | None:
+        entry = self.entry(area, name)
+        return entry["sha256"] if entry else None
+
+    def names(self, area: str, valid_only: bool = True) -> list[str]:
+        with self.lock:
+            files = self.areas.get(area, {})
+            return sorted(n for n, e in files.items() if e["valid"] or not valid_only)
+
+    def corrupt(self, area: str) -> list[str]:
+        with self.lock:
+            return sorted(n for n, e in self.areas.get(area, {}).items() if not e["valid"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh and summarize the CarImages inventory.")
+    parser.add_argument("--corrupt", action="store_true", help="list truncated or corrupt files")
+    args = parser.parse_args()
+
+    inventory = Inventory()
+    stats = inventory.refresh()
+
+    print(f"Inventory: {inventory.path}")
+    print("-" * 50)
+    for area, s in stats.items():
+        bad = len(inventory.corrupt(area))
+        total_bytes = sum(e["size"] for e in inventory.areas[area].values())
+        print(f"  {area:<11} {s['total']:>4} files  {total_bytes / (1024 * 1024):7.1f} MB  "
+              f"({s['hashed']} re-hashed, {s['removed']} removed, {bad} corrupt)")
+
+    if args.corrupt:
+        for area in stats:
+            for name in inventory.corrupt(area):
+                print(f"  CORRUPT {area}/{name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Display slots and scale variants of the bundled car images.
+
+Every imageset used to hold one universal 1200x800 JPEG, so a 120pt list
+row decoded the same hero-size bitmap as VehicleHeroCard, and every device
+shipped pixels for a scale it doesn't have. optimize_car_images.py now
+writes, next to CarImages/optimized/<asset>.jpg, one file per slot and
+scale:
+
+  slot    imageset            @2x       @3x       used by
+  hero    <asset>             600x400   900x600   CarImageView up to 200pt tall
+  thumb   <asset>_thumb       360x240   540x360   list rows and grids (<= 120pt)
+
+and setup_car_images.py turns them into imagesets with "scale" entries, so
+app thinning ships one scale per device and CarImageService loads the
+thumbnail imageset for small views. There is no @1x: the app targets
+iOS 17, which has no 1x devices.
+
+Variants are JPEG by default. With --format, optimize_car_images.py also
+writes webp or avif (if this Pillow build has the encoder) or heic (with
+the optional pillow-heif plugin), and setup_car_images.py --format puts
+those in the imagesets instead. HEIF is the modern format asset catalogs
+take natively; WebP and AVIF files are decoded by ImageIO at runtime
+(iOS 14+ and 16+).
+
+Usage:
+    from asset_variants import VARIANTS, variant_filename
+    for slot, scales in VARIANTS.items():
+        for scale, box in scales.items():
+            variant_filename("tata_nexon", slot, scale, "jpeg")  # tata_nexon_thumb@2x.jpg
+"""
+
+import re
+
+# slot -> {scale: max pixel box}; all frames are 3:2
+VARIANTS = {
+    "hero": {2: (600, 400), 3: (900, 600)},
+    "thumb": {2: (360, 240), 3: (540, 360)},
+}
+SLOT_SUFFIX = {"hero": "", "thumb": "_thumb"}  # imageset name = asset + suffix
+
+FORMATS = {"jpeg": ".jpg", "webp": ".webp", "avif": ".avif", "heic": ".heic"}
+DEFAULT_FORMAT = "jpeg"
+
+VARIANT_PATTERN = re.compile(r"^(?P<set>.+)@(?P<scale>\d)x\.(?P<ext>jpg|webp|avif|heic)$")
+
+
+def imageset_name(asset: str, slot: str) -> str:
+    return f"{asset}{SLOT_SUFFIX[slot]}"
+
+
+def variant_filename(asset: str, slot: str, scale: int, fmt: str = DEFAULT_FORMAT) -> str:
+    return f"{imageset_name(asset, slot)}@{scale}x{FORMATS[fmt]}"
+
+
+def is_variant(filename: str) -> bool:
+    """True for a scale variant (tata_nexon_thumb@2x.jpg), False for a base output (tata_nexon.jpg)."""
+    return VARIANT_PATTERN.match(filename) is not None
+
+
+def available_formats() -> list[str]:
+    """Formats this Python can encode variants in."""
+    try:
+        from PIL import features
+    except ImportError:
+        return []
+    formats = ["jpeg"]
+    formats += [fmt for fmt in ("webp", "avif") if features.check(fmt)]
+    try:
+        import pillow_heif  # noqa: F401 — optional HEIF encoder plugin
+        formats.append("heic")
+    except ImportError:
+        pass
+    return formats
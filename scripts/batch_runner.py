@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Shared batch runner for the image regeneration scripts.
+
+regenerate_plates.py, regenerate_from_refs.py, regen_single.py and
+regen_thar_roxx.py only differ in where their jobs come from (the has_plates/
+folder, the regenerate_refs/ folder, one ref/output pair, a custom prompt).
+Each builds a list of Jobs and hands it to run_batch(), which runs them all on
+the same engine as generate_car_images.py:
+
+  refs      load the reference (CarWale fetch, user file) and normalize it
+            for upload (reference_prep.py: crop, downscale, compact JPEG)
+  generate  rate-limited gpt-image-1 call with retry, results stream to disk
+
+with both stages on worker pools connected by bounded queues (pipeline.py),
+a requests/images-per-minute token bucket instead of a fixed 15 s sleep,
+optional job store tracking so finished jobs are skipped on the next run, and
+the generation result cache (result_cache.py): a request identical to one
+already answered — same reference bytes, prompt, model and size — is served
+from disk instead of the API (--no-cache to force a fresh image). These
+scripts exist to re-roll bad images, so the cache is only read when resuming
+a tracked batch: --redo, and the untracked one-off scripts, always call the
+API (the new result is still cached).
+
+Calls are gated by an AdaptiveController shared by all workers: it watches
+every OpenAI response (Retry-After, x-ratelimit-remaining-*/reset-*) and
+adjusts how many calls may be in flight AIMD-style — +1 per window of
+successes, halved on a 429/503 — pausing everyone until the reset when the
+server says the budget is spent. Retries use jittered exponential backoff.
+
+Usage:
+    from batch_runner import Job, add_runner_arguments, run_batch
+
+    parser = argparse.ArgumentParser()
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+    jobs = [Job("tata_sierra", "Tata Sierra", out_path, PROMPT, reference=ref_path)]
+    run_batch(jobs, args, batch="refs")
+"""
+
+import re
+import time
+import random
+import threading
+import urllib.error
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import asset_http
+import openai_images
+from job_store import JobStore
+from openai_images import images_edit, images_generate
+from pipeline import Pipeline, Stage
+from reference_prep import prepare_reference
+from result_cache import ResultCache, result_key
+
+# Configuration
+JOB_STORE_FILE = Path("/Users/sohail/AutoLedger/CarImages/jobs.sqlite3")
+
+REQUEST_DELAY = 15
+MAX_RETRIES = 3
+MAX_RATE_LIMIT_RETRIES = 8
+MAX_BACKOFF = 120
+COST_PER_IMAGE = 0.04
+
+# Statuses that mean "slow down" rather than "this request is broken"
+CONGESTION_CODES = (429, 503)
+# Ignore further 429s this long after halving — they were sent before the cut
+DECREASE_COOLDOWN = 5
+
+# Regeneration batches are small; run a few calls at once and let the token
+# bucket (and 429 backoff) keep us inside the account limits
+DEFAULT_WORKERS = 4
+DEFAULT_REF_WORKERS = 4
+DEFAULT_RPM = 12
+DEFAULT_IPM = 12
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`, holding up to `capacity`."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Gate OpenAI calls on both the requests-per-minute and images-per-minute limits."""
+
+    def __init__(self, rpm: float, ipm: float, burst: int = 1):
+        self.requests = TokenBucket(rpm, burst)
+        self.images = TokenBucket(ipm, burst)
+
+    def acquire(self, images: int = 1):
+        self.requests.acquire(1)
+        self.images.acquire(images)
+
+
+def parse_duration(value: str) -> float | None:
+    """Seconds from a rate-limit reset like "1s", "6m0s", "250ms" or "1h2m3.5s"."""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value or "")
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+def retry_after(headers) -> float | None:
+    """Seconds the server asked us to wait (retry-after-ms, Retry-After seconds or date)."""
+    if headers is None:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveController:
+    """AIMD in-flight limit plus a shared pause, driven by the API's rate-limit headers.
+
+    Workers call acquire() before and release() after each OpenAI call. The
+    configured RateLimiter still caps requests/images per minute; within that,
+    the in-flight limit grows by 1/limit per success and halves on congestion.
+    """
+
+    def __init__(self, max_concurrency: int, rpm: float, ipm: float, min_concurrency: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.last_decrease = 0.0
+        self.rate = RateLimiter(rpm, ipm, burst=self.max_concurrency)
+        self.host = urlsplit(openai_images.API_BASE).hostname
+        self.cond = threading.Condition()
+
+    def attach(self):
+        asset_http.add_response_hook(self.observe)
+
+    def detach(self):
+        asset_http.remove_response_hook(self.observe)
+
+    def acquire(self, images: int = 1):
+        with self.cond:
+            while True:
+                wait = self.pause_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    break
+                self.cond.wait(wait if wait > 0 else None)
+        self.rate.acquire(images)
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def _pause(self, seconds: float):
+        """Hold every worker for `seconds` (caller holds the lock)."""
+        until = time.monotonic() + seconds
+        if until > self.pause_until:
+            self.pause_until = until
+            self.cond.notify_all()
+
+    def observe(self, url: str, status: int, headers):
+        """asset_http response hook."""
+        if urlsplit(url).hostname != self.host:
+            return
+        now = time.monotonic()
+        with self.cond:
+            # Budget spent: wait for the reset instead of collecting 429s
+            for kind in ("requests", "tokens", "images"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is not None and remaining.strip() == "0":
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    if reset:
+                        self._pause(reset)
+
+            if status in CONGESTION_CODES:
+                wait = retry_after(headers)
+                if wait:
+                    self._pause(wait)
+                if now - self.last_decrease > DECREASE_COOLDOWN:
+                    before = self.limit
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self.last_decrease = now
+                    print(f"  [rate] HTTP {status}: concurrency {before:.1f} -> {self.limit:.1f}"
+                          + (f", pausing {wait:.0f}s" if wait else ""), flush=True)
+            elif 200 <= status < 300:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.cond.notify_all()
+
+    def backoff(self, attempt: int, headers=None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        ceiling = min(MAX_BACKOFF, REQUEST_DELAY * (2 ** (attempt - 1)))
+        return max(retry_after(headers) or 0.0, random.uniform(ceiling / 2, ceiling))
+
+    def status_line(self) -> str:
+        paused = max(0.0, self.pause_until - time.monotonic())
+        return (f"concurrency {self.limit:.1f}/{self.max_concurrency}, {self.in_flight} in flight"
+                + (f", paused {paused:.0f}s" if paused else ""))
+
+
+def with_retry(func, label: str, max_retries: int = MAX_RETRIES,
+               controller: AdaptiveController | None = None):
+    """Call `func()`, retrying rate limits (up to MAX_RATE_LIMIT_RETRIES) and other errors.
+
+    With a controller, waits honour Retry-After and are jittered so workers
+    that hit a 429 together don't retry together.
+    """
+    attempt = 0
+    rate_limited = 0
+    while True:
+        attempt += 1
+        try:
+            return func()
+        except urllib.error.HTTPError as e:
+            if e.code in CONGESTION_CODES and rate_limited + 1 < MAX_RATE_LIMIT_RETRIES:
+                rate_limited += 1
+                attempt -= 1  # congestion doesn't use up the error retries
+                if controller:
+                    wait = controller.backoff(rate_limited, e.headers)
+                else:
+                    wait = REQUEST_DELAY * (2 ** (rate_limited - 1))
+                print(f"  {label}: rate limited, waiting {wait:.0f}s "
+                      f"(attempt {rate_limited}/{MAX_RATE_LIMIT_RETRIES})...", flush=True)
+                time.sleep(wait)
+            elif e.code not in CONGESTION_CODES and attempt < max_retries:
+                wait = 5 * attempt * (random.uniform(0.5, 1.5) if controller else 1)
+                print(f"  {label}: HTTP {e.code}, retrying in {wait:.0f}s (attempt {attempt}/{max_retries})...",
+                      flush=True)
+                time.sleep(wait)
+            else:
+                raise
+        except Exception:
+            if attempt < max_retries:
+                wait = 5 * attempt * (random.uniform(0.5, 1.5) if controller else 1)
+                print(f"  {label}: error, retrying in {wait:.0f}s (attempt {attempt}/{max_retries})...",
+                      flush=True)
+                time.sleep(wait)
+            else:
+                raise
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+class Job:
+    """One image to (re)generate.
+
+    `reference` is image bytes, a path to an image, None, or a callable
+    returning one of those; callables and normalization run on the refs stage
+    so slow fetches/conversions overlap with generation. Without a reference, `fallback_prompt` is used
+    for text-only generation. `on_failure(job)` runs after the last retry
+    fails, e.g. to restore a backup.
+    """
+
+    def __init__(self, name: str, label: str, out_path: Path, prompt: str, reference=None,
+                 fallback_prompt: str | None = None, method: str = "ref", on_failure=None):
+        self.name = name
+        self.label = label
+        self.out_path = Path(out_path)
+        self.prompt = prompt
+        self.reference = reference
+        self.fallback_prompt = fallback_prompt
+        self.method = method
+        self.on_failure = on_failure
+        self.index = 0
+        self.cached = False
+
+    def request(self) -> tuple[str, object] | None:
+        """(prompt, reference) the API call would use, or None if there is nothing to send."""
+        if self.reference is not None:
+            return self.prompt, self.reference
+        if self.fallback_prompt:
+            return self.fallback_prompt, None
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def add_runner_arguments(parser, store: bool = True):
+    """Add the concurrency/rate flags (and --redo/--no-cache when jobs are tracked in the store)."""
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"generation calls kept in flight (default {DEFAULT_WORKERS})")
+    parser.add_argument("--ref-workers", type=int, default=DEFAULT_REF_WORKERS,
+                        help=f"reference load/convert threads (default {DEFAULT_REF_WORKERS})")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM,
+                        help=f"OpenAI requests per minute (default {DEFAULT_RPM:g})")
+    parser.add_argument("--ipm", type=float, default=DEFAULT_IPM,
+                        help=f"OpenAI images per minute (default {DEFAULT_IPM:g})")
+    parser.add_argument("--report-interval", type=float, default=30,
+                        help="seconds between queue-depth reports, 0 to disable (default 30)")
+    if store:
+        parser.add_argument("--redo", action="store_true",
+                            help="regenerate images the job store already marks as done "
+                                 "(always calls the API, bypassing the result cache)")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="always call the API, even for a request the result cache has "
+                                 "answered before (new results are still cached)")
+    else:
+        # Without a job store every run is a re-roll; a cached answer would be the same image
+        parser.set_defaults(no_cache=True)
+
+
+def run_batch(jobs: list[Job], args, batch: str | None = None) -> dict:
+    """Run `jobs` concurrently under the rate limits in `args`.
+
+    With `batch`, jobs are tracked in the job store under that batch name and
+    done jobs are skipped unless args.redo. The result cache is read only when
+    neither args.redo nor args.no_cache is set. Returns the summary counts.
+    """
+    workers = max(1, args.workers)
+    store = None
+    skipped = 0
+    if batch:
+        store = JobStore(JOB_STORE_FILE, batch=batch)
+        store.reset_in_flight()
+        if not getattr(args, "redo", False):
+            todo = [job for job in jobs if not store.is_done(job.name)]
+            skipped = len(jobs) - len(todo)
+            jobs = todo
+
+    total = len(jobs) + skipped
+    for index, job in enumerate(jobs, skipped + 1):
+        job.index = index
+
+    per_minute = min(args.rpm, args.ipm)
+    print(f"To generate: {len(jobs)}" + (f" ({skipped} already done)" if skipped else ""))
+    print(f"Estimated cost: ${len(jobs) * COST_PER_IMAGE:.2f}")
+    print(f"Estimated time: ~{len(jobs) / per_minute:.0f} minutes")
+    print(f"Concurrency: {args.ref_workers} ref / {workers} generate workers, "
+          f"{args.rpm:g} requests/min, {args.ipm:g} images/min")
+    print()
+
+    controller = AdaptiveController(workers, args.rpm, args.ipm)
+    controller.attach()
+    results = ResultCache()
+    # A redo asks for a new roll: the cache would hand back the same bytes
+    reuse_results = not (args.no_cache or getattr(args, "redo", False))
+    run_id = store.start_run() if store else None
+    if store:
+        store.add_pending([job.name for job in jobs])
+
+    def ref_stage(job: Job) -> Job:
+        if callable(job.reference):
+            job.reference = job.reference()
+        if job.reference is not None:
+            job.reference = prepare_reference(job.reference)
+        return job
+
+    def generate_once(job: Job) -> str:
+        if job.reference is None and not job.fallback_prompt:
+            raise ValueError("no reference image")
+        controller.acquire()
+        try:
+            if job.reference is not None:
+                images_edit(job.reference, job.prompt, job.out_path)
+                return job.method
+            images_generate(job.fallback_prompt, job.out_path)
+            return "text"
+        finally:
+            controller.release()
+
+    def generate_stage(job: Job) -> Job:
+        if store:
+            store.start(job.name)
+        request = job.request()
+        key = result_key(*request) if request else None
+        if key and reuse_results and results.fetch(key, job.out_path):
+            job.cached = True
+            if job.reference is None:
+                job.method = "text"
+        else:
+            job.method = with_retry(lambda: generate_once(job), job.label, controller=controller)
+            if key:
+                results.store(key, job.out_path, label=job.name)
+        if store:
+            store.finish(job.name, job.method)
+        return job
+
+    pipeline = Pipeline([
+        Stage("refs", ref_stage, workers=args.ref_workers),
+        Stage("generate", generate_stage, workers=workers),
+    ], report_interval=args.report_interval)
+
+    generated = 0
+    cached = 0
+    failed = 0
+    try:
+        for job, error, stage in pipeline.run(jobs):
+            progress = f"[{job.index}/{total}] {job.label}..."
+            if error is not None:
+                print(f"{progress} FAILED ({stage}): {error}")
+                failed += 1
+                if store:
+                    store.fail(job.name, str(error))
+                if job.on_failure:
+                    job.on_failure(job)
+                continue
+            print(f"{progress} OK ({job.method}" + (", cached)" if job.cached else ")"))
+            generated += 1
+            cached += job.cached
+    except KeyboardInterrupt:
+        print("\nInterrupted — finishing in-flight requests...")
+        pipeline.stop()
+        pipeline.join()
+        raise
+    finally:
+        controller.detach()
+        results.close()
+        summary = {"generated": generated, "cached": cached, "skipped": skipped, "failed": failed}
+        if store:
+            store.end_run(run_id, summary)
+            store.close()
+
+    if cached:
+        print(f"\nServed from the result cache: {cached} (use --no-cache for fresh images)")
+    return summary
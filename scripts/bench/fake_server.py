@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI and CarWale endpoints the asset scripts call.
+
+Emulates:
+  POST /v1/images/edits          gpt-image-1 restyle  -> {"data": [{"b64_json": PNG}]}
+  POST /v1/images/generations    text-only generation -> same shape
+  POST /v1/chat/completions      direction detection  -> JSON {"file.png": "left"|"right"}
+  GET  /<make>-cars/<model>/     CarWale model page with an og:image tag
+  GET  /img/<slug>-1056x594.jpg  the reference photo (distinct per slug)
+  GET  /__stats                  request counts, 429s and bytes served
+
+Latency, 429 injection (random and/or above a concurrency cap, with
+Retry-After and x-ratelimit-* headers) and payload sizes are configurable,
+so throughput can be measured without network access or API spend.
+
+Usage:
+    python3 scripts/bench/fake_server.py --port 8765 --latency 2 --rate-429 0.05
+    # then point openai_images.API_BASE at http://127.0.0.1:8765/v1
+    # and carwale_refs.CARWALE_BASE at http://127.0.0.1:8765
+"""
+
+import io
+import re
+import json
+import time
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeConfig:
+    """Knobs for the stand-in; every field can be set from the command line."""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, rate_429: float = 0.0,
+                 capacity: int = 0, retry_after: float = 1.0, image_size: str = "1536x1024",
+                 image_noise: float = 0.5, ref_size: str = "1056x594", page_latency: float = 0.05,
+                 chat_latency: float = 0.5, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.image_size = image_size
+        self.image_noise = image_noise
+        self.ref_size = ref_size
+        self.page_latency = page_latency
+        self.chat_latency = chat_latency
+        self.seed = seed
+
+
+def _dims(size: str) -> tuple[int, int]:
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+
+def make_png(width: int, height: int, noise: float, rng: random.Random) -> bytes:
+    """A decodable RGB PNG; `noise` (0-1) is the share of random rows, which sets the file size."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    flat = b"\x00" + bytes([40, 40, 40]) * width
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) if rng.random() < noise else flat
+                   for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def make_jpeg(width: int, height: int, rng: random.Random) -> bytes:
+    """A real JPEG when Pillow is available, otherwise JPEG-framed filler of similar size."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8" + rng.randbytes(width * height // 8) + b"\xff\xd9"
+    img = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+class FakeState:
+    """Payloads built once at startup plus counters shared by handler threads."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.image_png = make_png(*_dims(config.image_size), config.image_noise, self.rng)
+        self.image_b64 = base64.b64encode(self.image_png)
+        self.ref_jpeg = make_jpeg(*_dims(config.ref_size), self.rng)
+        self.refs = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"requests": {}, "rate_limited": 0, "bytes_out": 0, "peak_in_flight": 0}
+
+    def reference(self, slug: str) -> bytes:
+        """A reference JPEG per model, so near-duplicate detection sees distinct photos."""
+        with self.lock:
+            if slug not in self.refs:
+                rng = random.Random(zlib.crc32(slug.encode()) ^ self.config.seed)
+                self.refs[slug] = make_jpeg(*_dims(self.config.ref_size), rng)
+            return self.refs[slug]
+
+    def count(self, endpoint: str, sent: int = 0):
+        with self.lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+            self.stats["bytes_out"] += sent
+
+    def enter(self) -> bool:
+        """Admit an API request, or return False if it should get a 429."""
+        with self.lock:
+            over = self.config.capacity and self.in_flight >= self.config.capacity
+            if over or self.rng.random() < self.config.rate_429:
+                self.stats["rate_limited"] += 1
+                return False
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def remaining(self) -> int:
+        with self.lock:
+            if not self.config.capacity:
+                return 1000
+            return max(0, self.config.capacity - self.in_flight)
+
+    def delay(self, base: float):
+        if base > 0:
+            time.sleep(max(0.0, base + self.rng.uniform(-self.config.jitter, self.config.jitter) * base))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _rate_headers(self) -> dict:
+        return {
+            "x-ratelimit-remaining-requests": str(self.state.remaining()),
+            "x-ratelimit-reset-requests": f"{self.state.config.retry_after:g}s",
+        }
+
+    def _too_many(self):
+        body = b'{"error": {"message": "Rate limit reached (fake)", "type": "rate_limit"}}'
+        self._send(429, body, "application/json",
+                   {"Retry-After": f"{self.state.config.retry_after:g}", **self._rate_headers()})
+
+    def do_GET(self):
+        state = self.state
+        if self.path == "/__stats":
+            with state.lock:
+                body = json.dumps(state.stats).encode()
+            self._send(200, body, "application/json")
+            return
+
+        match = re.fullmatch(r"/img/([\w\-\.]+)\.jpg", self.path)
+        if match:
+            state.delay(state.config.page_latency)
+            image = state.reference(match.group(1))
+            state.count("carwale_image", len(image))
+            self._send(200, image, "image/jpeg", {"ETag": f'"{match.group(1)}-v1"'})
+            return
+
+        match = re.fullmatch(r"/([\w\-\.]+)-cars/([\w\-\.]+)/", self.path)
+        if match:
+            state.delay(state.config.page_latency)
+            slug = f"{match.group(1)}-{match.group(2)}"
+            page = (f'<html><head><meta property="og:image" '
+                    f'content="http://{self.headers["Host"]}/img/{slug}-642x336.jpg" />'
+                    f"</head><body>{match.group(2)}</body></html>").encode()
+            state.count("carwale_page", len(page))
+            self._send(200, page, "text/html", {"ETag": f'"{slug}-v1"'})
+            return
+
+        state.count("not_found")
+        self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length") or 0)
+        # Stream the upload through; only chat requests need to be parsed
+        body = b""
+        keep = self.path.endswith("/chat/completions")
+        remaining = length
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if keep:
+                body += chunk
+
+        if self.path in ("/v1/images/edits", "/v1/images/generations"):
+            if not state.enter():
+                self._too_many()
+                return
+            try:
+                state.delay(state.config.latency)
+                payload = (b'{"created": ' + str(int(time.time())).encode()
+                           + b', "data": [{"b64_json": "' + state.image_b64 + b'"}]}')
+                state.count(self.path.rsplit("/", 1)[-1], len(payload))
+                self._send(200, payload, "application/json", self._rate_headers())
+            finally:
+                state.leave()
+            return
+
+        if self.path == "/v1/chat/completions":
+            if not state.enter():
+                self._too_many()
+                return
+            try:
+                state.delay(state.config.chat_latency)
+                names = re.findall(r"Image: ([\w\-\.]+\.png)", body.decode("utf-8", "ignore"))
+                # Deterministic split so flips are exercised
+                directions = {name: ("right" if zlib.crc32(name.encode()) % 3 == 0 else "left")
+                              for name in names}
+                payload = json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": json.dumps(directions)}}],
+                }).encode()
+                state.count("chat_completions", len(payload))
+                self._send(200, payload, "application/json", self._rate_headers())
+            finally:
+                state.leave()
+            return
+
+        state.count("not_found")
+        self._send(404, b"not found", "text/plain")
+
+
+def start_server(config: FakeConfig, host: str = "127.0.0.1", port: int = 0):
+    """Start the stand-in on a background thread. Returns (server, base_url)."""
+    handler = type("BoundHandler", (Handler,), {"state": FakeState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def add_config_arguments(parser):
+    defaults = FakeConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency,
+                        help="seconds per image call (default %(default)s)")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter,
+                        help="latency jitter as a fraction of --latency (default %(default)s)")
+    parser.add_argument("--rate-429", type=float, default=defaults.rate_429,
+                        help="probability an API call gets a 429 (default %(default)s)")
+    parser.add_argument("--capacity", type=int, default=defaults.capacity,
+                        help="concurrent API calls before 429s, 0 = unlimited (default %(default)s)")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after,
+                        help="Retry-After seconds on 429 (default %(default)s)")
+    parser.add_argument("--image-size", default=defaults.image_size,
+                        help="generated PNG dimensions (default %(default)s)")
+    parser.add_argument("--image-noise", type=float, default=defaults.image_noise,
+                        help="share of noisy rows, sets PNG bytes (default %(default)s)")
+    parser.add_argument("--ref-size", default=defaults.ref_size,
+                        help="CarWale reference JPEG dimensions (default %(default)s)")
+    parser.add_argument("--page-latency", type=float, default=defaults.page_latency)
+    parser.add_argument("--chat-latency", type=float, default=defaults.chat_latency)
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(
+        latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, capacity=args.capacity,
+        retry_after=args.retry_after, image_size=args.image_size, image_noise=args.image_noise,
+        ref_size=args.ref_size, page_latency=args.page_latency, chat_latency=args.chat_latency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI + CarWale server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(config_from_args(args), args.host, args.port)
+    state = server.RequestHandlerClass.state
+    print(f"Fake server on {base_url} (image PNG {len(state.image_png) // 1024}KB, "
+          f"reference JPEG {len(state.ref_jpeg) // 1024}KB) — Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
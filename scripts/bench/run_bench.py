@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the image pipeline, entirely offline.
+
+Starts the fake OpenAI/CarWale server (fake_server.py), builds a scratch
+CarImages tree with synthetic vehicle data, then runs each scenario in its
+own subprocess (scenario.py):
+
+  generate  generate_car_images.py  CarWale ref fetch + images/edits
+  plates    regenerate_plates.py    has_plates/ batch on the batch runner
+  refs      regenerate_from_refs.py regenerate_refs/ batch on the batch runner
+  optimize  optimize_car_images.py  chat/completions directions + JPEG encode
+
+and reports images/min, p50/p99 per-image latency and peak RSS. Each run is
+appended to a JSONL history; the report shows the change against the last
+run with the same settings, so regressions are visible run to run.
+
+Usage:
+    python3 scripts/bench/run_bench.py
+    python3 scripts/bench/run_bench.py --images 40 --workers 8 --latency 2 --rate-429 0.05
+    python3 scripts/bench/run_bench.py --scenarios generate,optimize --capacity 4
+    python3 scripts/bench/run_bench.py --scenarios optimize --images 400 --optimize-jobs 0
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+from fake_server import add_config_arguments, config_from_args, make_png, start_server
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent
+HISTORY_FILE = BENCH_DIR / "results.jsonl"
+SCENARIOS = ("generate", "plates", "refs", "optimize")
+
+
+# ---------------------------------------------------------------------------
+# Scratch tree
+# ---------------------------------------------------------------------------
+
+def build_tree(root: Path, images: int, state):
+    """Synthetic vehicle data plus the inputs each scenario reads."""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    from regenerate_from_refs import FILENAME_MAP
+
+    car_images = root / "CarImages"
+    for sub in ("references", "has_plates", "regenerate_refs", "optimized"):
+        (car_images / sub).mkdir(parents=True, exist_ok=True)
+
+    makes = {}
+    for i in range(images):
+        makes.setdefault(f"Benchmake {i % 5}", []).append({"name": f"Model {i}"})
+    data = {"makes": [{"name": make, "models": models} for make, models in makes.items()]}
+    (root / "IndianVehicleData.json").write_text(json.dumps(data))
+
+    names = [f"{make.lower().replace(' ', '_')}_{m['name'].lower().replace(' ', '_')}"
+             for make, models in makes.items() for m in models]
+    raw_png = state.image_png
+    for name in names:
+        (car_images / "has_plates" / f"{name}.png").write_bytes(raw_png)
+
+    # Distinct photos, or the result cache would answer every job after the first
+    for stem in list(FILENAME_MAP)[:images]:
+        (car_images / "regenerate_refs" / f"{stem}.jpg").write_bytes(state.reference(stem))
+    return names
+
+
+def seed_raw_pngs(root: Path, names: list[str], png: bytes):
+    """optimize reads raw PNGs; give it a full set without running generate first."""
+    for name in names:
+        (root / "CarImages" / f"{name}.png").write_bytes(png)
+
+
+# ---------------------------------------------------------------------------
+# Running scenarios
+# ---------------------------------------------------------------------------
+
+def run_scenario(name: str, config: dict, workdir: Path) -> dict:
+    """Run one scenario subprocess; returns its result plus peak RSS."""
+    config_path = workdir / f"{name}.config.json"
+    result_path = workdir / f"{name}.result.json"
+    log_path = workdir / f"{name}.log"
+    config_path.write_text(json.dumps(config))
+
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(
+            [sys.executable, str(BENCH_DIR / "scenario.py"), name, str(config_path), str(result_path)],
+            stdout=log, stderr=subprocess.STDOUT, env={**os.environ, "OPENAI_API_KEY": "bench"},
+        )
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if proc.returncode != 0 or not result_path.exists():
+        tail = log_path.read_text().splitlines()[-20:]
+        raise RuntimeError(f"scenario {name} failed (exit {proc.returncode}):\n" + "\n".join(tail))
+
+    result = json.loads(result_path.read_text())
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    result["peak_rss_mb"] = usage.ru_maxrss * scale / (1024 * 1024)
+    return result
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(result: dict) -> dict:
+    wall = result["wall_seconds"]
+    return {
+        "images": result["images"],
+        "wall_seconds": round(wall, 2),
+        "images_per_min": round(result["images"] / wall * 60, 1) if wall else 0.0,
+        "p50_seconds": round(percentile(result["latencies"], 50), 3),
+        "p99_seconds": round(percentile(result["latencies"], 99), 3),
+        "peak_rss_mb": round(result["peak_rss_mb"], 1),
+    }
+
+
+# ---------------------------------------------------------------------------
+# History
+# ---------------------------------------------------------------------------
+
+def previous_run(history: Path, settings: dict) -> dict | None:
+    if not history.exists():
+        return None
+    last = None
+    with open(history) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get("settings") == settings:
+                    last = entry
+    return last
+
+
+def delta(current: float, before: float | None) -> str:
+    if not before:
+        return ""
+    change = (current - before) / before * 100
+    return f" ({change:+.0f}%)" if abs(change) >= 1 else " (=)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline against a fake server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--images", type=int, default=20, help="synthetic models per scenario")
+    parser.add_argument("--workers", type=int, default=4, help="generation workers")
+    parser.add_argument("--optimize-jobs", type=int, default=1,
+                        help="optimize_car_images.py --jobs (0 = one per core)")
+    parser.add_argument("--rpm", type=float, default=6000,
+                        help="client-side requests/images per minute ceiling (default: effectively off)")
+    parser.add_argument("--request-delay", type=float, default=1,
+                        help="backoff base seconds for retries (the scripts use 15)")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch tree and logs")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    fake_config = config_from_args(args)
+    server, base_url = start_server(fake_config)
+    state = server.RequestHandlerClass.state
+    workdir = Path(tempfile.mkdtemp(prefix="autoledger-bench-"))
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("history", "keep", "scenarios")}
+    print(f"Fake server {base_url}: image PNG {len(state.image_png) // 1024}KB, "
+          f"latency {args.latency}s, 429 rate {args.rate_429}, capacity {args.capacity or 'unlimited'}")
+    print(f"Scratch tree: {workdir}")
+    print()
+
+    results = {}
+    try:
+        for name in scenarios:
+            root = workdir / name
+            names = build_tree(root, args.images, state)
+            if name == "optimize":
+                seed_raw_pngs(root, names, make_png(1536, 1024, args.image_noise, state.rng))
+            config = {
+                "root": str(root),
+                "base_url": base_url,
+                "workers": args.workers,
+                "optimize_jobs": args.optimize_jobs,
+                "rpm": args.rpm,
+                "request_delay": args.request_delay,
+            }
+            print(f"Running {name}...", flush=True)
+            results[name] = summarize(run_scenario(name, config, workdir))
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    before = previous_run(args.history, settings)
+    print()
+    print(f"{'scenario':<10} {'images':>6} {'img/min':>14} {'p50 s':>14} {'p99 s':>14} {'peak RSS MB':>16}")
+    print("-" * 78)
+    for name, r in results.items():
+        b = (before or {}).get("results", {}).get(name, {})
+        print(f"{name:<10} {r['images']:>6} "
+              f"{r['images_per_min']:>7}{delta(r['images_per_min'], b.get('images_per_min')):>7} "
+              f"{r['p50_seconds']:>7}{delta(r['p50_seconds'], b.get('p50_seconds')):>7} "
+              f"{r['p99_seconds']:>7}{delta(r['p99_seconds'], b.get('p99_seconds')):>7} "
+              f"{r['peak_rss_mb']:>9}{delta(r['peak_rss_mb'], b.get('peak_rss_mb')):>7}")
+    with state.lock:
+        print(f"\nServer: {state.stats['requests']}, {state.stats['rate_limited']} rate limited, "
+              f"peak {state.stats['peak_in_flight']} in flight")
+
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.history, "a") as f:
+        f.write(json.dumps({
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "settings": settings,
+            "results": results,
+        }) + "\n")
+    if before:
+        print(f"Compared with run at {before['at']} ({args.history.name})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Run one asset script against the fake server inside a scratch tree.
+
+Started as a subprocess by run_bench.py so each scenario gets its own peak
+RSS. Points every module's hardcoded /Users/sohail/AutoLedger paths and API
+base URLs at the scratch tree and fake server, times each image, runs the
+script's main() and writes {"images", "latencies", "wall_seconds"} as JSON.
+
+Usage (normally via run_bench.py):
+    python3 scripts/bench/scenario.py <generate|plates|refs|optimize> <config.json> <result.json>
+"""
+
+import os
+import sys
+import json
+import time
+import builtins
+import functools
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+
+def configure_modules(root: Path, base_url: str, request_delay: float):
+    """Redirect module-level paths and URLs; only attributes a module defines are touched."""
+    import asset_index
+    import asset_inventory
+    import batch_runner
+    import carwale_refs
+    import direction_model
+    import image_batch
+    import job_store
+    import openai_images
+    import reference_dedupe
+    import reference_prep
+    import result_cache
+
+    car_images = root / "CarImages"
+    assets = root / "Assets.xcassets" / "CarImages"
+    data_file = root / "IndianVehicleData.json"
+
+    openai_images.API_BASE = f"{base_url}/v1"
+    carwale_refs.CARWALE_BASE = base_url
+    carwale_refs.CACHE_DIR = car_images / "references" / ".cache"
+    asset_inventory.CAR_IMAGES_DIR = car_images
+    asset_inventory.ASSETS_DIR = assets
+    asset_inventory.INVENTORY_FILE = car_images / "inventory.json"
+    asset_index.CATALOG_DIR = assets.parent
+    asset_index.INDEX_FILE = root / "AssetIndex.json"
+    job_store.STORE_FILE = car_images / "jobs.sqlite3"
+    batch_runner.JOB_STORE_FILE = car_images / "jobs.sqlite3"
+    batch_runner.REQUEST_DELAY = request_delay
+    image_batch.BATCH_DIR = car_images / "batches"
+    image_batch.REFS_DIR = car_images / "batches" / "refs"
+    reference_prep.CACHE_DIR = car_images / "references" / ".normalized"
+    reference_dedupe.INDEX_FILE = car_images / "references" / "phash_index.json"
+    result_cache.CACHE_DIR = car_images / ".results"
+    direction_model.CAR_IMAGES_DIR = car_images
+    direction_model.MODEL_FILE = car_images / "direction_model.json"
+    direction_model.LABELS_FILE = car_images / "direction_cache.json"
+
+    overrides = {
+        "OUTPUT_DIR": car_images,
+        "INPUT_DIR": car_images,
+        "REF_DIR": car_images / "references",
+        "HAS_PLATES_DIR": car_images / "has_plates",
+        "DATA_FILE": data_file,
+        "MANIFEST_FILE": car_images / "manifest.json",
+        "JOB_STORE_FILE": car_images / "jobs.sqlite3",
+        "ERROR_LOG": car_images / "errors.log",
+        "DIRECTION_CACHE": car_images / "direction_cache.json",
+        "BUILD_CACHE": car_images / "optimize_cache.json",
+        "IMAGES_DIR": car_images / "optimized",
+        "ASSETS_DIR": assets,
+        "API_BASE": f"{base_url}/v1",
+        "REQUEST_DELAY": request_delay,
+    }
+    return overrides
+
+
+def apply_overrides(module, overrides: dict, **extra):
+    for name, value in {**overrides, **extra}.items():
+        if hasattr(module, name):
+            setattr(module, name, value)
+
+
+def timed(func, latencies: list):
+    """Wrap `func` to record the wall time of each successful call."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        return result
+    return wrapper
+
+
+def stream_intervals(func, latencies: list):
+    """Wrap generator `func` to record the wall time between its items (from the call for the first)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        last = time.perf_counter()
+        for item in func(*args, **kwargs):
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            yield item
+    return wrapper
+
+
+def main():
+    scenario, config_path, result_path = sys.argv[1], Path(sys.argv[2]), Path(sys.argv[3])
+    config = json.loads(config_path.read_text())
+    root = Path(config["root"])
+    overrides = configure_modules(root, config["base_url"], config["request_delay"])
+    runner_args = [
+        "--workers", str(config["workers"]),
+        "--rpm", str(config["rpm"]),
+        "--ipm", str(config["rpm"]),
+        "--report-interval", "0",
+    ]
+    latencies = []
+
+    if scenario == "generate":
+        import generate_car_images as module
+        apply_overrides(module, overrides, REF_DIR=root / "CarImages" / "references")
+        module.generate_with_retry = timed(module.generate_with_retry, latencies)
+        builtins.input = lambda prompt="": "yes"
+        sys.argv = ["generate_car_images.py", *runner_args]
+    elif scenario in ("plates", "refs"):
+        import batch_runner
+        if scenario == "plates":
+            import regenerate_plates as module
+            apply_overrides(module, overrides)
+        else:
+            import regenerate_from_refs as module
+            apply_overrides(module, overrides, REF_DIR=root / "CarImages" / "regenerate_refs")
+        batch_runner.with_retry = timed(batch_runner.with_retry, latencies)
+        sys.argv = [f"{scenario}.py", *runner_args, "--redo"]
+    elif scenario == "optimize":
+        import optimize_car_images as module
+        apply_overrides(module, overrides, OUTPUT_DIR=root / "CarImages" / "optimized")
+        # With --jobs > 1 images are encoded in worker processes, so time the
+        # ordered result stream instead of individual calls
+        module.optimize_all = stream_intervals(module.optimize_all, latencies)
+        sys.argv = ["optimize_car_images.py", "--jobs", str(config.get("optimize_jobs", 1))]
+    else:
+        raise SystemExit(f"Unknown scenario: {scenario}")
+
+    started = time.perf_counter()
+    module.main()
+    wall = time.perf_counter() - started
+
+    result_path.write_text(json.dumps({
+        "scenario": scenario,
+        "images": len(latencies),
+        "latencies": latencies,
+        "wall_seconds": wall,
+    }))
+
+
+if __name__ == "__main__":
+    main()
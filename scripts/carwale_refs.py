@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+CarWale reference photo fetching with an on-disk cache.
+
+Shared by generate_car_images.py and regenerate_plates.py. References are
+keyed by the CarWale slug from carwale_slug() and stored under
+CarImages/references/.cache/ as one metadata JSON + one image file per slug:
+
+  maruti-suzuki-cars__baleno.json   og:image URL, ETag/Last-Modified, fetch time
+  maruti-suzuki-cars__baleno.img    image bytes (1056x594 og:image)
+
+Within REF_TTL a cached reference is returned without touching the network.
+After that the model page and image are revalidated with conditional GETs, so
+an unchanged reference costs two 304s instead of two full downloads. Pages
+without an og:image are cached too, so a warm rerun makes no requests at all.
+
+Usage:
+    python3 scripts/carwale_refs.py Hyundai Creta     # fetch/inspect one reference
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+import html as htmlmod
+import urllib.error
+from pathlib import Path
+
+import asset_http
+
+# Configuration
+CARWALE_BASE = "https://www.carwale.com"
+CACHE_DIR = Path("/Users/sohail/AutoLedger/CarImages/references/.cache")
+REF_TTL = 30 * 24 * 3600  # seconds before a cached reference is revalidated
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120"
+}
+
+# Slugs already force-refetched this run, so retries don't download again
+_refreshed = set()
+_refreshed_lock = threading.Lock()
+
+
+def carwale_slug(make: str, model: str) -> str:
+    """Generate CarWale URL slug from make/model names."""
+    make_s = make.lower().replace(" ", "-")
+    model_s = model.lower().replace(" ", "-")
+    return f"{make_s}-cars/{model_s}"
+
+
+# ---------------------------------------------------------------------------
+# Cache entries
+# ---------------------------------------------------------------------------
+
+def _cache_paths(slug: str) -> tuple[Path, Path]:
+    key = slug.replace("/", "__")
+    return CACHE_DIR / f"{key}.json", CACHE_DIR / f"{key}.img"
+
+
+def _load_entry(slug: str) -> dict | None:
+    meta_path, img_path = _cache_paths(slug)
+    try:
+        with open(meta_path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # An entry that claims an image but lost its bytes is as good as missing
+    if entry.get("image_url") and not img_path.exists():
+        return None
+    return entry
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _save_entry(slug: str, entry: dict, image: bytes | None = None):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    meta_path, img_path = _cache_paths(slug)
+    if image is not None:
+        _write_atomic(img_path, image)
+    entry["fetched_at"] = time.time()
+    _write_atomic(meta_path, json.dumps(entry, indent=2).encode())
+
+
+# ---------------------------------------------------------------------------
+# Conditional GET
+# ---------------------------------------------------------------------------
+
+def _conditional_get(url: str, etag: str | None, last_modified: str | None) -> tuple[bytes | None, dict]:
+    """GET `url`, sending validators if known. Returns (body or None on 304, validators)."""
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        with asset_http.request("GET", url, headers=headers, timeout=15) as resp:
+            body = resp.read()
+            validators = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+            return body, validators
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, {"etag": etag, "last_modified": last_modified}
+        raise
+
+
+def _extract_og_image(page_html: str) -> str | None:
+    match = re.search(r'og:image.*?content="([^"]+)"', page_html)
+    if not match:
+        return None
+    # Request a higher resolution version
+    return htmlmod.unescape(match.group(1)).replace("642x336", "1056x594")
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def fetch_reference_image(make: str, model: str, refresh: bool = False) -> bytes | None:
+    """Return a reference photo from CarWale's og:image tag, using the on-disk cache.
+
+    refresh=True ignores the cache (once per slug per run) and refetches both
+    the model page and the image unconditionally; if that fails, the cached
+    copy is still returned.
+    """
+    slug = carwale_slug(make, model)
+    page_url = f"{CARWALE_BASE}/{slug}/"
+    _, img_path = _cache_paths(slug)
+
+    if refresh:
+        with _refreshed_lock:
+            force = slug not in _refreshed
+            _refreshed.add(slug)
+    else:
+        force = False
+
+    # Loaded even when forcing: it is the fallback if the refetch fails
+    cached = _load_entry(slug) or {}
+    if cached and not force and time.time() - cached.get("fetched_at", 0) < REF_TTL:
+        return img_path.read_bytes() if cached.get("image_url") else None
+
+    # Validators only when revalidating; a forced refetch downloads unconditionally
+    entry = {} if force else cached
+    try:
+        try:
+            page, page_validators = _conditional_get(
+                page_url, entry.get("page_etag"), entry.get("page_last_modified"))
+        except urllib.error.HTTPError as e:
+            if e.code not in (404, 410):
+                raise
+            # No model page on CarWale — remember that like a page without og:image
+            page, page_validators = b"", {"etag": None, "last_modified": None}
+
+        if page is None:
+            img_url = entry.get("image_url")
+        else:
+            img_url = _extract_og_image(page.decode("utf-8", errors="ignore"))
+
+        if not img_url:
+            _save_entry(slug, {
+                "page_url": page_url,
+                "page_etag": page_validators["etag"],
+                "page_last_modified": page_validators["last_modified"],
+                "image_url": None,
+            })
+            return None
+
+        # Only revalidate the image if the page still points at the same one
+        same_image = img_url == entry.get("image_url")
+        image, img_validators = _conditional_get(
+            img_url,
+            entry.get("image_etag") if same_image else None,
+            entry.get("image_last_modified") if same_image else None,
+        )
+
+        _save_entry(slug, {
+            "page_url": page_url,
+            "page_etag": page_validators["etag"],
+            "page_last_modified": page_validators["last_modified"],
+            "image_url": img_url,
+            "image_etag": img_validators["etag"],
+            "image_last_modified": img_validators["last_modified"],
+        }, image)
+        return image if image is not None else img_path.read_bytes()
+
+    except Exception:
+        # Network trouble: a stale cached copy beats no reference at all
+        if cached.get("image_url") and img_path.exists():
+            return img_path.read_bytes()
+        return None
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python3 scripts/carwale_refs.py <make> <model>")
+        return
+
+    make, model = sys.argv[1], sys.argv[2]
+    data = fetch_reference_image(make, model)
+    entry = _load_entry(carwale_slug(make, model)) or {}
+    if data:
+        print(f"OK ({len(data) // 1024}KB) {entry.get('image_url')}")
+    else:
+        print("No reference found")
+
+
+if __name__ == "__main__":
+    main()
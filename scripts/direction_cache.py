@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Facing-direction cache keyed by image content.
+
+direction_cache.json used to map filename -> "left"/"right", so when
+regenerate_plates.py or regenerate_from_refs.py replaced foo.png the old
+answer was reused and the new image could be flipped the wrong way. Records
+are now keyed by the PNG's SHA-256 and say where the answer came from:
+
+  {"version": 2, "entries": {
+      "<sha256>": {"name": "tata_nexon.png", "direction": "left",
+                   "source": "api", "model": "gpt-4o", "prompt_version": 1},
+      "<sha256>": {"name": "kia_seltos.png", "direction": "right",
+                   "source": "local", "model": "direction_model 2026-10-17T02:00:00",
+                   "confidence": 0.982}}}
+
+An API answer is only reused while the vision model and prompt version
+match the current ones; changing the prompt re-asks. Offline detector
+answers (direction_model.py) stay valid — they already passed the
+confidence threshold — but are never used as training labels. When GPT-4o
+didn't answer for an image the detector was unsure about, its low-confidence
+answer is recorded with source "guess": reused like the others, so the image
+isn't re-encoded on every run, but listed by guesses() so it can be re-asked
+(optimize_car_images.py --recheck-guesses).
+
+A legacy filename-keyed cache is migrated on load: an entry is kept only if
+its PNG is older than the cache file, i.e. it can't have been replaced
+after the answer was written.
+
+Usage:
+    from direction_cache import DirectionCache
+    cache = DirectionCache(path, vision_model="gpt-4o", prompt_version=1)
+    cache.get(sha)                                  # "left" / "right" / None
+    cache.set(sha, "foo.png", "right", source="api")
+    cache.save()
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+
+CACHE_VERSION = 2
+
+
+class DirectionCache:
+    """sha256 -> direction record, safe to share across worker threads."""
+
+    def __init__(self, path: Path, vision_model: str = "gpt-4o", prompt_version: int = 1,
+                 image_dir: Path | None = None):
+        self.path = Path(path)
+        self.vision_model = vision_model
+        self.prompt_version = prompt_version
+        self.entries = {}
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.entries = data.get("entries", {})
+        elif "version" not in data:
+            self._migrate(data, image_dir or self.path.parent)
+
+    def _migrate(self, legacy: dict, image_dir: Path):
+        """Import a filename-keyed cache, dropping answers for images replaced since."""
+        from asset_inventory import sha256_file
+
+        written = self.path.stat().st_mtime
+        for name, direction in legacy.items():
+            image = image_dir / name
+            try:
+                if direction not in ("left", "right") or image.stat().st_mtime > written:
+                    continue
+            except OSError:
+                continue
+            # Legacy answers all came from the GPT-4o prompt, version 1
+            self.entries[sha256_file(image)] = {
+                "name": name, "direction": direction, "source": "api",
+                "model": "gpt-4o", "prompt_version": 1,
+            }
+
+    def save(self):
+        with self.lock:
+            payload = json.dumps({"version": CACHE_VERSION, "entries": self.entries},
+                                 indent=1, sort_keys=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(payload)
+        os.replace(tmp, self.path)
+
+    def _valid(self, record: dict) -> bool:
+        if record.get("source") in ("local", "guess"):
+            return True
+        return (record.get("model") == self.vision_model
+                and record.get("prompt_version") == self.prompt_version)
+
+    def get(self, sha: str) -> str | None:
+        """Cached direction for this image content, or None if unknown or stale."""
+        with self.lock:
+            record = self.entries.get(sha)
+        if record and self._valid(record):
+            return record["direction"]
+        return None
+
+    def set(self, sha: str, name: str, direction: str, source: str = "api",
+            model: str | None = None, confidence: float | None = None):
+        record = {"name": name, "direction": direction, "source": source}
+        if source == "api":
+            record.update(model=model or self.vision_model, prompt_version=self.prompt_version)
+        else:
+            record["model"] = model
+            if confidence is not None:
+                record["confidence"] = round(confidence, 4)
+        with self.lock:
+            self.entries[sha] = record
+
+    def is_guess(self, sha: str) -> bool:
+        with self.lock:
+            return (self.entries.get(sha) or {}).get("source") == "guess"
+
+    def guesses(self) -> list[str]:
+        """sha256 of every image whose direction is an unconfirmed offline guess."""
+        with self.lock:
+            return sorted(sha for sha, r in self.entries.items() if r.get("source") == "guess")
+
+    def api_labels(self) -> list[tuple[str, str, str]]:
+        """(sha256, name, direction) for every API answer — the offline detector's training set."""
+        with self.lock:
+            return [(sha, r["name"], r["direction"]) for sha, r in sorted(self.entries.items())
+                    if r.get("source") == "api" and r["direction"] in ("left", "right")]
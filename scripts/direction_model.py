@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Offline facing-direction detector for generated car images.
+
+optimize_car_images.py used to send every new image to GPT-4o just to learn
+whether the car faces left or right. Every image is a black car on the same
+dark-gray studio background, so the answer is in the pixels:
+
+1. crop to the car (pixels that differ from the border's background gray)
+2. resize the crop to FEATURE_SIZE and take intensity and horizontal-gradient
+   channels
+3. keep the mirror-antisymmetric part, x - mirror(x): it is zero for a
+   symmetric frame and changes sign when the car is flipped
+4. score it with a logistic regression without bias, trained on the labels
+   GPT-4o already produced (the "api" records in direction_cache.json; the
+   detector's own answers are never fed back in)
+
+Because the features change sign under mirroring and there is no bias, a
+flipped image always gets the opposite answer with the same confidence, and
+each training image doubles as its own mirrored counterexample.
+predict() returns (direction, confidence in 0.5-1); callers send images
+below their confidence threshold to the API. Without a trained model every
+image gets confidence 0 — i.e. the old API-only behaviour.
+
+Usage:
+    python3 scripts/direction_model.py train              # fit on GPT-4o labels in direction_cache.json
+    python3 scripts/direction_model.py predict CarImages/tata_nexon.png [...]
+
+Dependencies: pip3 install Pillow numpy
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+import image_source
+from direction_cache import DirectionCache
+
+# Configuration
+CAR_IMAGES_DIR = Path("/Users/sohail/AutoLedger/CarImages")
+MODEL_FILE = CAR_IMAGES_DIR / "direction_model.json"
+LABELS_FILE = CAR_IMAGES_DIR / "direction_cache.json"
+MODEL_VERSION = 1
+
+FEATURE_SIZE = (64, 32)     # crop is resized to this (width, height) before features
+SUBJECT_THRESHOLD = 18      # gray levels from the background that count as car
+MIN_CONFIDENCE = 0.9        # below this, callers should ask the API
+L2_PENALTY = 1.0
+TRAIN_STEPS = 400
+
+
+def available() -> bool:
+    return np is not None
+
+
+# ---------------------------------------------------------------------------
+# Features
+# ---------------------------------------------------------------------------
+
+def subject_box(gray) -> tuple[int, int, int, int]:
+    """(left, top, right, bottom) of pixels that differ from the border median; full frame if none."""
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    mask = np.abs(gray - np.median(border)) > SUBJECT_THRESHOLD
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) < 2 or len(cols) < 2:
+        return 0, 0, gray.shape[1], gray.shape[0]
+    return cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+
+
+def features(img: "Image.Image"):
+    """Mirror-antisymmetric feature vector of an RGB or L image."""
+    gray = img.convert("L")
+    # A box-filtered quarter-size copy is plenty for a 64x32 descriptor
+    factor = max(1, min(gray.width // (FEATURE_SIZE[0] * 4), gray.height // (FEATURE_SIZE[1] * 4)))
+    if factor > 1:
+        gray = gray.reduce(factor)
+
+    pixels = np.asarray(gray, dtype=np.float32)
+    crop = gray.crop(subject_box(pixels)).resize(FEATURE_SIZE, Image.BILINEAR)
+    a = np.asarray(crop, dtype=np.float32) / 255.0
+    a -= a.mean()
+    gx = np.abs(np.diff(a, axis=1, append=a[:, -1:]))
+    channels = np.stack([a, gx])
+
+    # x - mirror(x) is antisymmetric, so its left half carries all of it
+    anti = channels - channels[:, :, ::-1]
+    vector = anti[:, :, :FEATURE_SIZE[0] // 2].ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+# ---------------------------------------------------------------------------
+# Model
+# ---------------------------------------------------------------------------
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def fit(x, y, l2: float = L2_PENALTY, steps: int = TRAIN_STEPS):
+    """Logistic regression without bias on x (n, d) and y in {0, 1} ("right" = 1).
+
+    Each sample is also added mirrored (-x, 1 - y).
+    """
+    x = np.concatenate([x, -x])
+    y = np.concatenate([y, 1 - y]).astype(np.float64)
+    w = np.zeros(x.shape[1])
+    n = len(y)
+    # Fixed step from the Lipschitz bound of the loss
+    step = 1.0 / (0.25 * np.linalg.norm(x, 2) ** 2 / n + l2 / n)
+    for _ in range(steps):
+        grad = x.T @ (_sigmoid(x @ w) - y) / n + l2 * w / n
+        w -= step * grad
+    return w
+
+
+class DirectionModel:
+    """Trained weights plus metadata, loaded from MODEL_FILE."""
+
+    def __init__(self, weights=None, meta: dict | None = None):
+        self.weights = weights
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "DirectionModel":
+        """The saved model, or an untrained one if there is none (or numpy is missing)."""
+        if not available():
+            return cls()
+        try:
+            with open(path or MODEL_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.get("version") != MODEL_VERSION or data.get("feature_size") != list(FEATURE_SIZE):
+            return cls()
+        return cls(np.asarray(data["weights"]), data)
+
+    def save(self, path: Path | None = None):
+        path = Path(path or MODEL_FILE)
+        payload = {
+            **self.meta,
+            "version": MODEL_VERSION,
+            "feature_size": list(FEATURE_SIZE),
+            "weights": [round(float(v), 6) for v in self.weights],
+        }
+        path.write_text(json.dumps(payload))
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    @property
+    def name(self) -> str:
+        """Identifies the model in direction_cache.json records."""
+        return f"direction_model {self.meta.get('trained_at', 'untrained')}"
+
+    def predict(self, img: "Image.Image") -> tuple[str, float]:
+        """("left" | "right", confidence 0.5-1). Confidence is 0 without a trained model."""
+        if not self.trained:
+            return "left", 0.0
+        p = float(_sigmoid(features(img) @ self.weights))
+        return ("right", p) if p >= 0.5 else ("left", 1 - p)
+
+
+# ---------------------------------------------------------------------------
+# Training
+# ---------------------------------------------------------------------------
+
+def labelled_features(labels: list[tuple[str, str, str]], image_dir: Path):
+    """(x, y, names) for every (sha256, name, direction) label whose image still has that content."""
+    rows, targets, names = [], [], []
+    for sha, name, direction in labels:
+        path = image_dir / name
+        if direction not in ("left", "right") or not path.exists():
+            continue
+        current, img = image_source.read(path)
+        if current != sha:
+            continue
+        rows.append(features(img))
+        targets.append(1 if direction == "right" else 0)
+        names.append(name)
+    return np.array(rows), np.array(targets), names
+
+
+def cross_validate(x, y, folds: int = 5, threshold: float = MIN_CONFIDENCE) -> dict:
+    """Held-out accuracy overall and on predictions at or above `threshold`."""
+    order = np.random.default_rng(0).permutation(len(y))
+    correct = confident = confident_correct = 0
+    for k in range(folds):
+        test = order[k::folds]
+        train = np.setdiff1d(order, test)
+        w = fit(x[train], y[train])
+        p = _sigmoid(x[test] @ w)
+        predicted = (p >= 0.5).astype(int)
+        confidence = np.maximum(p, 1 - p)
+        correct += int((predicted == y[test]).sum())
+        sure = confidence >= threshold
+        confident += int(sure.sum())
+        confident_correct += int((predicted[sure] == y[test][sure]).sum())
+    return {
+        "accuracy": correct / len(y),
+        "coverage": confident / len(y),
+        "confident_accuracy": confident_correct / confident if confident else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or run the offline direction detector.")
+    parser.add_argument("command", choices=["train", "predict"])
+    parser.add_argument("images", nargs="*", type=Path)
+    parser.add_argument("--threshold", type=float, default=MIN_CONFIDENCE,
+                        help=f"confidence needed to skip the API (default {MIN_CONFIDENCE})")
+    args = parser.parse_args()
+
+    if not available():
+        print("Error: Pillow and NumPy are required. pip3 install Pillow numpy")
+        sys.exit(1)
+
+    if args.command == "train":
+        labels = DirectionCache(LABELS_FILE, image_dir=CAR_IMAGES_DIR).api_labels()
+        x, y, names = labelled_features(labels, CAR_IMAGES_DIR)
+        if len(names) < 10 or len(set(y.tolist())) < 2:
+            print(f"Need at least 10 labelled images of both directions, found {len(names)}")
+            sys.exit(1)
+        print(f"Training on {len(names)} labelled images "
+              f"({int(y.sum())} right, {len(y) - int(y.sum())} left, each also mirrored)")
+        scores = cross_validate(x, y, threshold=args.threshold)
+        print(f"  5-fold accuracy:         {scores['accuracy'] * 100:.1f}%")
+        print(f"  confidence >= {args.threshold:g}:      {scores['coverage'] * 100:.0f}% of images, "
+              f"{scores['confident_accuracy'] * 100:.1f}% correct")
+        model = DirectionModel(fit(x, y), {
+            "trained_on": len(names),
+            "trained_at": datetime.now().isoformat(timespec="seconds"),
+            **{k: round(v, 4) for k, v in scores.items()},
+        })
+        model.save()
+        print(f"Saved {MODEL_FILE}")
+
+    elif args.command == "predict":
+        model = DirectionModel.load()
+        if not model.trained:
+            print(f"No trained model at {MODEL_FILE} — run: python3 scripts/direction_model.py train")
+            sys.exit(1)
+        for path in args.images:
+            direction, confidence = model.predict(image_source.read(path)[1])
+            tag = "" if confidence >= args.threshold else "  (low confidence, would ask the API)"
+            print(f"  {path.name}: {direction} {confidence:.3f}{tag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,10 @@ Usage: python3 download_car_logos.py
 """
 
 import os
-import urllib.request
 import ssl
 
+import asset_http
+
 # Disable SSL verification for downloads (Wikimedia uses valid certs but sometimes causes issues)
 ssl._create_default_https_context = ssl._create_unverified_context
 
@@ -91,13 +92,13 @@ def download_logo(brand, url):
     try:
         print(f'Downloading {brand}...', end=' ')
 
-        # Create request with user agent
-        req = urllib.request.Request(
+        # Request with user agent over the shared keep-alive pool
+        with asset_http.request(
+            'GET',
             url,
-            headers={'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'}
-        )
-
-        with urllib.request.urlopen(req, timeout=30) as response:
+            headers={'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'},
+            timeout=30,
+        ) as response:
             svg_content = response.read()
 
         with open(output_path, 'wb') as f:
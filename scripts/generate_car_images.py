@@ -2,49 +2,86 @@
 """
 Generate car images for all active models using reference photos + GPT-4o restyle.
 
-Pipeline per model:
-1. Fetch reference photo from CarWale (og:image — front three-quarter view)
+Pipeline per model (stages overlap, connected by bounded queues — see pipeline.py):
+1. Fetch reference photo from CarWale (og:image — front three-quarter view),
+   cached on disk by carwale_refs.py (--refresh-refs forces a refetch), then
+   cropped/downscaled/re-encoded for upload by reference_prep.py, and checked
+   against every other model's reference by perceptual hash (reference_dedupe.py)
 2. Send reference to gpt-image-1 /v1/images/edits to restyle on dark studio background
-3. Fallback: text-only generation if reference unavailable
+   Fallback: text-only generation if reference unavailable
+   Near-duplicate reference (e.g. a photo shared by Baleno and Baleno RS): text-only
+   (--duplicate-refs reuse copies the owning model's image if it is already
+   generated, allow restyles anyway). All references are fetched and hashed
+   before generation starts so the owner is always the earliest model in the
+   catalog; every near-duplicate is printed with both names and the distance.
+3. Optional (--post-process): optimize and import into Assets.xcassets, then
+   refresh the generated AssetIndex.json once the run ends (asset_index.py)
 
 Features:
 - Reference-based generation for accurate car designs
 - Dark charcoal studio background (matches app's dark theme)
-- Retry with exponential backoff for rate limiting
-- Progress manifest (manifest.json) for resuming after interruptions
+- Retry with jittered exponential backoff that honours Retry-After
+- Concurrent workers governed by a requests/images-per-minute token bucket and
+  an adaptive in-flight limit driven by the API's rate-limit headers
+- Crash-safe job store (jobs.sqlite3, see job_store.py) for resuming after interruptions
+- Result cache (see result_cache.py): a request already answered once — same reference,
+  prompt, model and size — is copied from disk instead of paid for again (--no-cache to skip)
+- Asset inventory (see asset_inventory.py) to skip finished models and redo truncated PNGs
 - Error logging to errors.log
 
 Usage:
     export OPENAI_API_KEY="your-key-here"
     python3 scripts/generate_car_images.py
+    python3 scripts/generate_car_images.py --workers 4 --rpm 20 --ipm 20
+    python3 scripts/generate_car_images.py --workers 4 --ref-workers 8 --post-process
+
+Offline batch mode (see image_batch.py):
+    python3 scripts/generate_car_images.py --batch-out CarImages/batches/full.jsonl
+    python3 scripts/generate_car_images.py --ingest results.jsonl
 
 Output: /Users/sohail/AutoLedger/CarImages/
 """
 
 import os
 import json
-import time
-import base64
-import uuid
-import re
-import html as htmlmod
-import urllib.request
-import urllib.error
+import shutil
+import argparse
+import threading
 from pathlib import Path
 from datetime import datetime
 
+import asset_index
+from asset_inventory import Inventory
+from batch_runner import AdaptiveController, with_retry
+from carwale_refs import fetch_reference_image
+from image_batch import BatchWriter, ingest_results
+from job_store import FAILED, IN_FLIGHT, PENDING, JobStore
+from openai_images import images_edit, images_generate
+from pipeline import Pipeline, Stage
+from reference_dedupe import ReferenceIndex
+from reference_prep import prepare_reference, sniff_extension
+from result_cache import ResultCache, result_key
+
 # Configuration
 API_KEY = os.environ.get("OPENAI_API_KEY")
 OUTPUT_DIR = Path("/Users/sohail/AutoLedger/CarImages")
 REF_DIR = OUTPUT_DIR / "references"
 DATA_FILE = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/IndianVehicleData.json")
-MANIFEST_FILE = OUTPUT_DIR / "manifest.json"
+MANIFEST_FILE = OUTPUT_DIR / "manifest.json"  # legacy, imported into the job store once
+JOB_STORE_FILE = OUTPUT_DIR / "jobs.sqlite3"
 ERROR_LOG = OUTPUT_DIR / "errors.log"
 
 # Rate limiting: 15s between requests (safe for standard tier)
 REQUEST_DELAY = 15
 MAX_RETRIES = 3
 
+# Token bucket defaults — one request every REQUEST_DELAY seconds, like the serial run
+DEFAULT_WORKERS = 1
+DEFAULT_REF_WORKERS = 4
+DEFAULT_POST_WORKERS = 2
+DEFAULT_RPM = 60 / REQUEST_DELAY
+DEFAULT_IPM = 60 / REQUEST_DELAY
+
 RESTYLE_PROMPT = (
     "Recreate this exact car model accurately, front three-quarter view. "
     "The car must be painted in glossy black color. "
@@ -76,172 +113,154 @@ FALLBACK_PROMPT_TEMPLATE = (
 
 
 # ---------------------------------------------------------------------------
-# Reference image fetching
+# Image generation via OpenAI
 # ---------------------------------------------------------------------------
 
-def carwale_slug(make: str, model: str) -> str:
-    """Generate CarWale URL slug from make/model names."""
-    make_s = make.lower().replace(" ", "-")
-    model_s = model.lower().replace(" ", "-")
-    return f"{make_s}-cars/{model_s}"
+def generate_with_reference(ref_path: Path, out_path: Path):
+    """Restyle a reference image via gpt-image-1 /v1/images/edits, streaming to out_path."""
+    images_edit(ref_path, RESTYLE_PROMPT, out_path)
 
 
-def fetch_reference_image(make: str, model: str) -> bytes | None:
-    """Download a reference photo from CarWale's og:image tag."""
-    slug = carwale_slug(make, model)
-    page_url = f"https://www.carwale.com/{slug}/"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120"
-    }
+def fallback_prompt(make: str, model: str, year: int = 2026) -> str:
+    return FALLBACK_PROMPT_TEMPLATE.format(year=year, make=make, model=model)
 
-    try:
-        req = urllib.request.Request(page_url, headers=headers)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            page_html = resp.read().decode("utf-8", errors="ignore")
 
-        # Extract og:image URL
-        match = re.search(r'og:image.*?content="([^"]+)"', page_html)
-        if not match:
-            return None
+def generate_text_only(make: str, model: str, out_path: Path, year: int = 2026):
+    """Fallback: text-only generation via gpt-image-1 /v1/images/generations."""
+    images_generate(fallback_prompt(make, model, year), out_path)
 
-        img_url = htmlmod.unescape(match.group(1))
 
-        # Download the image — request a higher resolution version
-        img_url = img_url.replace("642x336", "1056x594")
-        req = urllib.request.Request(img_url, headers=headers)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return resp.read()
+def prefetch_reference(make: str, model: str, refresh_refs: bool = False,
+                       ref_index: ReferenceIndex | None = None) -> Path | None:
+    """Fetch the CarWale reference (from cache when warm), adding it to `ref_index`.
 
-    except Exception:
+    Returns the normalized upload file.
+    """
+    ref_data = fetch_reference_image(make, model, refresh=refresh_refs)
+    if not ref_data:
         return None
+    # Save reference for debugging
+    name = safe_name(make, model)
+    ref_path = REF_DIR / f"{name}{sniff_extension(ref_data) or '.img'}"
+    REF_DIR.mkdir(exist_ok=True)
+    ref_path.write_bytes(ref_data)
+    if ref_index:
+        ref_index.add(name, ref_data)
+    # The upload streams from the cropped, downscaled copy
+    return prepare_reference(ref_data)
+
+
+def prefetch_references(jobs: list[dict], ref_workers: int, refresh_refs: bool = False,
+                        ref_index: ReferenceIndex | None = None) -> list[tuple[dict, BaseException]]:
+    """Fetch (and hash) every job's reference concurrently, then pick near-duplicate owners.
+
+    Ownership is resolved in catalog order once all references are in, so it
+    doesn't depend on which worker finished first. Sets ref_path, duplicate_of
+    and distance on each job and prints every near-duplicate. Returns
+    (job, error) for the references that failed.
+    """
+    def fetch_stage(job: dict) -> dict:
+        job["ref_path"] = prefetch_reference(job["make"], job["model"], refresh_refs, ref_index)
+        return job
+
+    failures = []
+    pipeline = Pipeline([Stage("refs", fetch_stage, workers=ref_workers)], report_interval=0)
+    try:
+        for job, error, _ in pipeline.run(jobs):
+            if error is not None:
+                failures.append((job, error))
+    except KeyboardInterrupt:
+        pipeline.stop()
+        pipeline.join()
+        raise
+
+    failed = {id(job) for job, _ in failures}
+    matches = ref_index.resolve([job["name"] for job in jobs
+                                 if id(job) not in failed and job["ref_path"]]) if ref_index else {}
+    for job in jobs:
+        job["duplicate_of"], job["distance"] = matches.get(job["name"], (None, None))
+        if job["duplicate_of"]:
+            print(f"  {job['make']} {job['model']}: reference near-duplicates "
+                  f"{job['duplicate_of']} (pHash distance {job['distance']})")
+    return failures
+
+
+def generate_image(make: str, model: str, out_path: Path, ref_path: Path | None = None,
+                   limiter: AdaptiveController | None = None) -> str:
+    """Generate car image into out_path. Returns the method used."""
+    if limiter:
+        limiter.acquire()
+    try:
+        # Reference-based when we have one, text-only fallback otherwise
+        if ref_path:
+            generate_with_reference(ref_path, out_path)
+            return "ref"
+        generate_text_only(make, model, out_path)
+        return "text"
+    finally:
+        if limiter:
+            limiter.release()
+
+
+def generate_with_retry(make: str, model: str, out_path: Path, ref_path: Path | None = None,
+                        limiter: AdaptiveController | None = None) -> str:
+    """Generate image with exponential backoff retry. Returns the method used."""
+    return with_retry(lambda: generate_image(make, model, out_path, ref_path, limiter),
+                      f"{make} {model}", MAX_RETRIES, controller=limiter)
 
 
 # ---------------------------------------------------------------------------
-# Image generation via OpenAI
+# Post-processing (optimize + catalog import)
 # ---------------------------------------------------------------------------
 
-def build_multipart(fields: dict, files: dict) -> tuple[bytes, str]:
-    """Build multipart/form-data body. Returns (body, boundary)."""
-    boundary = uuid.uuid4().hex
-    lines = []
-    for key, val in fields.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(f'Content-Disposition: form-data; name="{key}"'.encode())
-        lines.append(b"")
-        lines.append(val.encode() if isinstance(val, str) else val)
-    for key, (filename, data, content_type) in files.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(
-            f'Content-Disposition: form-data; name="{key}"; filename="{filename}"'.encode()
-        )
-        lines.append(f"Content-Type: {content_type}".encode())
-        lines.append(b"")
-        lines.append(data)
-    lines.append(f"--{boundary}--".encode())
-    lines.append(b"")
-    return b"\r\n".join(lines), boundary
-
-
-def generate_with_reference(ref_data: bytes) -> bytes:
-    """Restyle a reference image via gpt-image-1 /v1/images/edits."""
-    body, boundary = build_multipart(
-        fields={
-            "model": "gpt-image-1",
-            "prompt": RESTYLE_PROMPT,
-            "n": "1",
-            "size": "1536x1024",
-        },
-        files={
-            "image": ("reference.png", ref_data, "image/png"),
-        },
-    )
-
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/edits",
-        data=body,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": f"multipart/form-data; boundary={boundary}",
-        },
-    )
-
-    with urllib.request.urlopen(req, timeout=300) as response:
-        result = json.loads(response.read())
-        b64_data = result["data"][0]["b64_json"]
-        return base64.b64decode(b64_data)
-
-
-def generate_text_only(make: str, model: str, year: int = 2026) -> bytes:
-    """Fallback: text-only generation via gpt-image-1 /v1/images/generations."""
-    prompt = FALLBACK_PROMPT_TEMPLATE.format(year=year, make=make, model=model)
-
-    data = json.dumps({
-        "model": "gpt-image-1",
-        "prompt": prompt,
-        "n": 1,
-        "size": "1536x1024",
-    }).encode()
-
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/generations",
-        data=data,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json",
-        },
-    )
-
-    with urllib.request.urlopen(req, timeout=300) as response:
-        result = json.loads(response.read())
-        b64_data = result["data"][0]["b64_json"]
-        return base64.b64decode(b64_data)
-
-
-def generate_image(make: str, model: str) -> tuple[bytes, str]:
-    """Generate car image. Returns (image_bytes, method_used)."""
-    # Try reference-based first
-    ref_data = fetch_reference_image(make, model)
-    if ref_data:
-        # Save reference for debugging
-        ref_name = safe_name(make, model)
-        REF_DIR.mkdir(exist_ok=True)
-        (REF_DIR / f"{ref_name}.png").write_bytes(ref_data)
-
-        image_data = generate_with_reference(ref_data)
-        return image_data, "ref"
-
-    # Fallback to text-only
-    image_data = generate_text_only(make, model)
-    return image_data, "text"
-
-
-def generate_with_retry(make: str, model: str) -> tuple[bytes, str]:
-    """Generate image with exponential backoff retry."""
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            return generate_image(make, model)
-        except urllib.error.HTTPError as e:
-            if e.code == 429 and attempt < MAX_RETRIES:
-                wait = REQUEST_DELAY * (2 ** (attempt - 1))
-                print(f"\n  Rate limited, waiting {wait}s (attempt {attempt}/{MAX_RETRIES})...",
-                      end=" ", flush=True)
-                time.sleep(wait)
-            elif attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  HTTP {e.code}, retrying in {wait}s (attempt {attempt}/{MAX_RETRIES})...",
-                      end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
-        except Exception:
-            if attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  Error, retrying in {wait}s (attempt {attempt}/{MAX_RETRIES})...",
-                      end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
+def make_post_processor():
+    """Return (post_process, refresh_index): a function that optimizes one generated PNG and
+    imports it into Assets.xcassets, and one that updates AssetIndex.json after the imports.
+
+    Imported lazily so plain generation runs don't need Pillow.
+    """
+    import optimize_car_images as optimize
+    import setup_car_images as setup
+    import studio_framing
+    from asset_inventory import sha256_file
+
+    optimize.OUTPUT_DIR.mkdir(exist_ok=True)
+    cache = optimize.load_direction_cache()
+    cache_lock = threading.Lock()
+    model = optimize.DirectionModel.load()
+    # Recorded like optimize_car_images.py's default build, so its next run skips these
+    trim = studio_framing.available()
+    settings = optimize.encoder_settings(trim=trim)
+    build = optimize.load_build_cache()
+
+    def refresh_index():
+        """Index the imagesets written so far; the app treats unindexed cars as having no image."""
+        asset_index.update("cars", setup.ASSETS_DIR)
+
+    def post_process(name: str, png_path: Path) -> bool:
+        """Returns True if the image was flipped."""
+        # One decode feeds the hash, direction detection and the encode
+        sha, img = optimize.load_source(png_path, trim)
+        direction = cache.get(sha)
+        if direction is None:
+            optimize.detect_directions({png_path.name: (sha, img)}, cache, model=model, workers=1)
+            with cache_lock:
+                optimize.save_direction_cache(cache)
+            direction = cache.get(sha) or "left"
+
+        should_flip = direction == "right"
+        jpg_path = optimize.OUTPUT_DIR / f"{name}.jpg"
+        _, variants, encoding = optimize.encode(img, jpg_path, should_flip)
+        record = optimize.build_record(
+            sha, should_flip, settings, sha256_file(jpg_path),
+            {variant: sha256_file(optimize.OUTPUT_DIR / variant) for variant in variants}, encoding)
+        with cache_lock:
+            build[jpg_path.name] = record
+            optimize.save_build_cache(build)
+        setup.create_imageset(name, jpg_path)
+        return should_flip
+
+    return post_process, refresh_index
 
 
 # ---------------------------------------------------------------------------
@@ -255,20 +274,6 @@ def safe_name(make: str, model: str) -> str:
     return f"{safe_make}_{safe_model}"
 
 
-def load_manifest() -> dict:
-    """Load progress manifest or create a new one."""
-    if MANIFEST_FILE.exists():
-        with open(MANIFEST_FILE) as f:
-            return json.load(f)
-    return {"generated": [], "failed": [], "started_at": datetime.now().isoformat()}
-
-
-def save_manifest(manifest: dict):
-    """Save progress manifest."""
-    with open(MANIFEST_FILE, "w") as f:
-        json.dump(manifest, f, indent=2)
-
-
 def log_error(make: str, model: str, error: str):
     """Append error to errors.log."""
     with open(ERROR_LOG, "a") as f:
@@ -280,8 +285,100 @@ def log_error(make: str, model: str, error: str):
 # Main
 # ---------------------------------------------------------------------------
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate car images for all models.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"generation calls kept in flight (default {DEFAULT_WORKERS})")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM,
+                        help=f"OpenAI requests per minute (default {DEFAULT_RPM:g})")
+    parser.add_argument("--ipm", type=float, default=DEFAULT_IPM,
+                        help=f"OpenAI images per minute (default {DEFAULT_IPM:g})")
+    parser.add_argument("--refresh-refs", action="store_true",
+                        help="ignore the reference cache and refetch from CarWale")
+    parser.add_argument("--duplicate-refs", choices=("text", "reuse", "allow"), default="text",
+                        help="when a reference near-duplicates another model's: text-only, reuse "
+                             "that model's image if generated (else text-only), or restyle it "
+                             "anyway (default text)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always call the API, even for a request the result cache has "
+                             "answered before (new results are still cached)")
+    parser.add_argument("--ref-workers", type=int, default=DEFAULT_REF_WORKERS,
+                        help=f"reference prefetch threads (default {DEFAULT_REF_WORKERS})")
+    parser.add_argument("--post-process", action="store_true",
+                        help="optimize and import each image into Assets.xcassets as it finishes")
+    parser.add_argument("--post-workers", type=int, default=DEFAULT_POST_WORKERS,
+                        help=f"optimize/import threads with --post-process (default {DEFAULT_POST_WORKERS})")
+    parser.add_argument("--report-interval", type=float, default=30,
+                        help="seconds between queue-depth reports, 0 to disable (default 30)")
+    parser.add_argument("--batch-out", type=Path, metavar="JSONL",
+                        help="write pending requests to a batch file instead of calling the API")
+    parser.add_argument("--ingest", type=Path, metavar="JSONL",
+                        help="import a batch results file into CarImages/ and the job store")
+    return parser.parse_args()
+
+
+def write_batch(pending: list[dict], batch_path: Path, ref_workers: int,
+                refresh_refs: bool = False, ref_index: ReferenceIndex | None = None) -> dict:
+    """Fetch references concurrently and write one request line per pending job.
+
+    Near-duplicate references become text-only requests — the owning model's
+    output may not exist until the batch comes back.
+    """
+    counts = {"ref": 0, "text": 0, "duplicate": 0, "failed": 0}
+    failures = prefetch_references(pending, ref_workers, refresh_refs, ref_index)
+    failed = {id(job) for job, _ in failures}
+    for job, error in failures:
+        print(f"  {job['make']} {job['model']}: reference failed, skipped ({error})")
+        counts["failed"] += 1
+
+    with BatchWriter(batch_path) as writer:
+        for job in pending:
+            if id(job) in failed:
+                continue
+            if job["ref_path"] and not job["duplicate_of"]:
+                writer.add_edit(job["name"], job["ref_path"], RESTYLE_PROMPT)
+                counts["ref"] += 1
+            else:
+                writer.add_generation(job["name"], fallback_prompt(job["make"], job["model"]))
+                counts["text"] += 1
+                counts["duplicate"] += bool(job["duplicate_of"])
+    return counts
+
+
+def ingest(results_path: Path):
+    """Import a batch results file: write PNGs and mark jobs done/failed."""
+    store = JobStore(JOB_STORE_FILE, batch="generate")
+    inventory = Inventory()
+    # Only jobs --batch-out queued (or that failed since) may be written
+    expected = {name for state in (PENDING, IN_FLIGHT, FAILED) for name in store.names(state)}
+    run_id = store.start_run()
+    result = ingest_results(results_path, OUTPUT_DIR, expected, store, inventory)
+    store.end_run(run_id, {"ingested": len(result["done"]), "failed": len(result["failed"]),
+                           "rejected": len(result["rejected"]), "results_file": str(results_path)})
+    store.close()
+    inventory.save()
+
+    for name, error in result["failed"].items():
+        log_error(name, "(batch)", error)
+    print(f"Ingested:   {len(result['done'])} images into {OUTPUT_DIR}")
+    print(f"Failed:     {len(result['failed'])}")
+    if result["rejected"]:
+        print(f"Rejected:   {len(result['rejected'])} lines with an unknown or unsafe custom_id")
+        for name, reason in sorted(result["rejected"].items())[:10]:
+            print(f"  {name!r}: {reason}")
+    if result["failed"]:
+        print(f"Errors logged to: {ERROR_LOG}")
+
+
 def main():
-    if not API_KEY:
+    args = parse_args()
+    workers = max(1, args.workers)
+
+    if args.ingest:
+        ingest(args.ingest)
+        return
+
+    if not API_KEY and not args.batch_out:
         print("Error: Set OPENAI_API_KEY environment variable")
         print("  export OPENAI_API_KEY='your-key-here'")
         return
@@ -299,25 +396,47 @@ def main():
         for model in make["models"]:
             models_to_generate.append((make_name, model["name"]))
 
+    per_minute = min(args.rpm, args.ipm)
     total = len(models_to_generate)
     print(f"Total models: {total}")
     print(f"Estimated cost: ${total * 0.04:.2f} (gpt-image-1 @ ~$0.04/image)")
-    print(f"Estimated time: ~{total * REQUEST_DELAY // 60} minutes")
+    print(f"Estimated time: ~{total / per_minute:.0f} minutes")
+    print(f"Concurrency: {args.ref_workers} ref / {workers} generate"
+          + (f" / {args.post_workers} post" if args.post_process else "")
+          + f" workers, {args.rpm:g} requests/min, {args.ipm:g} images/min")
     print(f"Output directory: {OUTPUT_DIR}")
     print(f"Method: Reference from CarWale + gpt-image-1 restyle (text-only fallback)")
     print("-" * 60)
 
-    # Load manifest for resume support
-    manifest = load_manifest()
-    already_done = set(manifest.get("generated", []))
-
-    # Count how many we can skip
-    skip_count = 0
-    for make_name, model_name in models_to_generate:
-        name = safe_name(make_name, model_name)
-        filepath = OUTPUT_DIR / f"{name}.png"
-        if filepath.exists() or name in already_done:
-            skip_count += 1
+    # Open job store for resume support
+    store = JobStore(JOB_STORE_FILE, batch="generate")
+    imported = store.import_manifest(MANIFEST_FILE)
+    if imported:
+        print(f"Imported {imported} jobs from {MANIFEST_FILE.name}")
+    orphaned = store.reset_in_flight()
+    if orphaned:
+        print(f"Recovered {orphaned} jobs left in flight by an interrupted run")
+
+    # Count how many we can skip — one directory scan instead of a stat per model.
+    # A PNG that fails the truncation check is regenerated even if marked done.
+    inventory = Inventory()
+    inventory.refresh(["raw"])
+    corrupt = set(inventory.corrupt("raw"))
+    if corrupt:
+        print(f"Found {len(corrupt)} truncated/corrupt PNGs, they will be regenerated")
+
+    def already_generated(name: str) -> bool:
+        if inventory.entry("raw", f"{name}.png"):
+            return inventory.is_complete("raw", f"{name}.png")
+        return store.is_done(name)
+
+    done_names = {
+        name for name in (safe_name(make_name, model_name)
+                          for make_name, model_name in models_to_generate)
+        if already_generated(name)
+    }
+    skip_count = sum(1 for make_name, model_name in models_to_generate
+                     if safe_name(make_name, model_name) in done_names)
 
     if skip_count > 0:
         print(f"Resuming: {skip_count} already generated, {total - skip_count} remaining")
@@ -325,87 +444,228 @@ def main():
         print(f"Remaining cost: ${remaining_cost:.2f}")
 
     print()
-    confirm = input("Continue? (yes/no): ")
-    if confirm.lower() != "yes":
-        print("Cancelled.")
-        return
+    if not args.batch_out:
+        confirm = input("Continue? (yes/no): ")
+        if confirm.lower() != "yes":
+            print("Cancelled.")
+            return
 
     generated = 0
     skipped = 0
     failed = 0
     ref_count = 0
     text_count = 0
+    reuse_count = 0
+    cached_count = 0
 
+    # Skip if already generated
+    pending = []
     for i, (make_name, model_name) in enumerate(models_to_generate, 1):
         name = safe_name(make_name, model_name)
         filepath = OUTPUT_DIR / f"{name}.png"
-
-        # Skip if already exists
-        if filepath.exists() or name in already_done:
+        if name in done_names:
             skipped += 1
             continue
+        pending.append({
+            "index": i,
+            "make": make_name,
+            "model": model_name,
+            "name": name,
+            "png_path": filepath,
+        })
+
+    store.add_pending([job["name"] for job in pending])
+
+    # Near-duplicate reference detection; "allow" skips the hashing entirely
+    ref_index = ReferenceIndex() if args.duplicate_refs != "allow" else None
+
+    # Offline mode: one batch file instead of rate-limited synchronous calls
+    if args.batch_out:
+        counts = write_batch(pending, args.batch_out, args.ref_workers, args.refresh_refs, ref_index)
+        store.close()
+        if ref_index:
+            ref_index.save()
+        print(f"Wrote {counts['ref'] + counts['text']} requests to {args.batch_out} "
+              f"({counts['ref']} edits, {counts['text']} text-only of which {counts['duplicate']} "
+              f"near-duplicate refs, {counts['failed']} failed)")
+        print("\nWhen results are back: python3 scripts/generate_car_images.py --ingest <results.jsonl>")
+        return
+
+    run_id = store.start_run()
 
-        progress = f"[{i}/{total}]"
-        print(f"{progress} {make_name} {model_name}...", end=" ", flush=True)
+    # With duplicate detection every reference is fetched and hashed first, so
+    # which model owns a shared photo doesn't depend on worker timing
+    if ref_index:
+        print("Fetching references...")
+        failures = prefetch_references(pending, args.ref_workers, args.refresh_refs, ref_index)
+        for job, error in failures:
+            print(f"[{job['index']}/{total}] {job['make']} {job['model']}... FAILED: {error}")
+            failed += 1
+            log_error(job["make"], job["model"], str(error))
+            store.fail(job["name"], str(error))
+        failed_refs = {id(job) for job, _ in failures}
+        pending = [job for job in pending if id(job) not in failed_refs]
+        ref_index.save()
+        print()
+
+    limiter = AdaptiveController(workers, args.rpm, args.ipm)
+    limiter.attach()
+    results = ResultCache()
+
+    # Stage 1 (without duplicate detection): prefetch references for upcoming
+    # models while generation is busy
+    def fetch_stage(job: dict) -> dict:
+        job["ref_path"] = prefetch_reference(job["make"], job["model"], args.refresh_refs)
+        job["duplicate_of"] = job["distance"] = None
+        return job
+
+    # Stage 2: rate-limited OpenAI call; the job store is updated here so in-flight
+    # results survive Ctrl-C. A near-duplicate reference is never restyled: the
+    # text prompt is used, or with --duplicate-refs reuse the owner's image is
+    # copied when it exists.
+    # An identical earlier request is answered from the result cache.
+    def generate_stage(job: dict) -> dict:
+        store.start(job["name"])
+        owner = job["duplicate_of"]
+        ref_path = None if owner else job["ref_path"]
+        job["cached"] = False
+        if owner and args.duplicate_refs == "reuse" and inventory.is_complete("raw", f"{owner}.png"):
+            shutil.copyfile(OUTPUT_DIR / f"{owner}.png", job["png_path"])
+            job["method"] = "reuse"
+        else:
+            prompt = RESTYLE_PROMPT if ref_path else fallback_prompt(job["make"], job["model"])
+            key = result_key(prompt, ref_path)
+            if not args.no_cache and results.fetch(key, job["png_path"]):
+                job["method"] = "ref" if ref_path else "text"
+                job["cached"] = True
+            else:
+                job["method"] = generate_with_retry(job["make"], job["model"], job["png_path"],
+                                                    ref_path, limiter)
+                results.store(key, job["png_path"], label=job["name"])
+        store.finish(job["name"], job["method"])
+        inventory.update_file("raw", job["png_path"].name, job["png_path"])
+        return job
+
+    stages = [] if ref_index else [Stage("refs", fetch_stage, workers=args.ref_workers)]
+    stages.append(Stage("generate", generate_stage, workers=workers))
+
+    # Stage 3 (optional): optimize + import into the asset catalog
+    if args.post_process:
+        post_process, refresh_index = make_post_processor()
 
-        try:
-            image_data, method = generate_with_retry(make_name, model_name)
-            filepath.write_bytes(image_data)
+        def post_stage(job: dict) -> dict:
+            job["flipped"] = post_process(job["name"], job["png_path"])
+            return job
 
+        stages.append(Stage("post", post_stage, workers=args.post_workers))
+
+    pipeline = Pipeline(stages, report_interval=args.report_interval)
+    post_failed = 0
+
+    try:
+        for job, error, stage in pipeline.run(pending):
+            progress = f"[{job['index']}/{total}]"
+            label = f"{progress} {job['make']} {job['model']}..."
+
+            if error is not None and stage != "post":
+                error_msg = str(error)
+                print(f"{label} FAILED: {error_msg}")
+                failed += 1
+
+                # Log error
+                log_error(job["make"], job["model"], error_msg)
+                store.fail(job["name"], error_msg)
+                continue
+
+            method = job["method"]
             if method == "ref":
                 ref_count += 1
-                print(f"OK (ref)")
+                status = "OK (ref)"
+            elif method == "reuse":
+                reuse_count += 1
+                status = f"OK (reused {job['duplicate_of']}, pHash distance {job['distance']})"
             else:
                 text_count += 1
-                print(f"OK (text-only)")
-
+                status = "OK (text-only)"
+                if job["duplicate_of"]:
+                    status += (f", reference near-duplicates {job['duplicate_of']} "
+                               f"(pHash distance {job['distance']})")
             generated += 1
+            if job["cached"]:
+                cached_count += 1
+                status += ", cached"
+
+            if error is not None:
+                post_failed += 1
+                log_error(job["make"], job["model"], f"post-processing: {error}")
+                status += f", post-processing FAILED: {error}"
+            elif "flipped" in job:
+                status += ", imported" + (" [FLIPPED]" if job["flipped"] else "")
+            print(f"{label} {status}")
+    except KeyboardInterrupt:
+        print("\nInterrupted — finishing in-flight requests, progress is saved in the job store.")
+        pipeline.stop()
+        pipeline.join()
+        inventory.save()
+        if args.post_process:
+            refresh_index()
+        if ref_index:
+            ref_index.save()
+        raise
+    finally:
+        limiter.detach()
+        results.close()
 
-            # Update manifest
-            manifest.setdefault("generated", []).append(name)
-            manifest.setdefault("methods", {})[name] = method
-            save_manifest(manifest)
-
-            # Rate limiting
-            time.sleep(REQUEST_DELAY)
-
-        except Exception as e:
-            error_msg = str(e)
-            print(f"FAILED: {error_msg}")
-            failed += 1
-
-            # Log error
-            log_error(make_name, model_name, error_msg)
-            manifest.setdefault("failed", []).append(name)
-            save_manifest(manifest)
+    print()
+    print(f"Rate control: {limiter.status_line()}")
+    print("Stage timings:")
+    for stat in pipeline.stats():
+        print(f"  {stat['stage']:<9} {stat['workers']} workers  {stat['processed']} done  "
+              f"{stat['failed']} failed  avg {stat['avg_seconds']:.1f}s")
 
     # Final summary
-    manifest["completed_at"] = datetime.now().isoformat()
-    manifest["summary"] = {
+    store.end_run(run_id, {
         "generated": generated,
         "skipped": skipped,
         "failed": failed,
         "ref_based": ref_count,
         "text_only": text_count,
-    }
-    save_manifest(manifest)
+        "reused": reuse_count,
+        "cached": cached_count,
+    })
+    store.close()
+    inventory.save()
+    if ref_index:
+        ref_index.save()
+    if args.post_process:
+        refresh_index()
 
     print()
     print("-" * 60)
-    print(f"Generated:  {generated} ({ref_count} ref-based, {text_count} text-only)")
+    print(f"Generated:  {generated} ({ref_count} ref-based, {text_count} text-only, "
+          f"{reuse_count} reused from a near-duplicate reference)")
+    if cached_count:
+        print(f"Cached:     {cached_count} served from the result cache without an API call")
     print(f"Skipped:    {skipped}")
     print(f"Failed:     {failed}")
     print(f"\nImages saved to: {OUTPUT_DIR}")
     print(f"References saved to: {REF_DIR}")
 
-    if failed > 0:
+    if post_failed > 0:
+        print(f"Post-processing failed: {post_failed} (run optimize/setup scripts for these)")
+
+    if failed > 0 or post_failed > 0:
         print(f"Errors logged to: {ERROR_LOG}")
+    if failed > 0:
         print("\nTo retry failed images, just run this script again.")
 
     print("\nNext steps:")
     print("1. Spot-check ~10 images visually")
-    print("2. Run: python3 scripts/optimize_car_images.py")
-    print("3. Run: python3 scripts/setup_car_images.py")
+    if args.post_process:
+        print("2. Build Xcode project — new images are already in Assets.xcassets and AssetIndex.json")
+    else:
+        print("2. Run: python3 scripts/optimize_car_images.py")
+        print("3. Run: python3 scripts/setup_car_images.py")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Offline batch files for gpt-image-1 requests.
+
+For full-catalog regenerations throughput matters more than latency, so
+instead of hundreds of rate-limited synchronous calls generate_car_images.py
+can write every pending request into one JSONL batch file
+(--batch-out) and later ingest a results JSONL (--ingest).
+
+Request lines follow the OpenAI Batch API shape:
+
+  {"custom_id": "tata_nexon", "method": "POST", "url": "/v1/images/edits",
+   "body": {"model": ..., "prompt": ..., "n": 1, "size": ...,
+            "image": {"sha256": "...", "filename": "reference.jpg", "content_type": "image/jpeg"}}}
+
+Edit requests reference their (normalized) image by content hash; the bytes
+live once in CarImages/batches/refs/<sha256>.<ext> no matter how many
+requests share them.
+Result lines are {"custom_id", "response": {"status_code", "body"}, "error"}
+with the image as data[0].b64_json, exactly like a synchronous response.
+Results files come from outside, so only custom_ids the caller expects (the
+job store's unfinished jobs, or a batch file's ids) are written, and an id is
+never used as a path unless it is a plain file name. Images are decoded
+straight to disk (openai_images.stream_b64_json_to_file) instead of holding
+the base64 text, a parsed copy and the decoded bytes of every line.
+
+`simulate` is a local stand-in for the batch service: it reads a batch file
+and writes a results file without any network access (edits echo their
+reference, generations get a flat placeholder PNG), so the write -> ingest
+path can be exercised end to end.
+
+Usage:
+    python3 scripts/generate_car_images.py --batch-out CarImages/batches/full.jsonl
+    python3 scripts/image_batch.py simulate CarImages/batches/full.jsonl results.jsonl
+    python3 scripts/generate_car_images.py --ingest results.jsonl
+"""
+
+import io
+import os
+import json
+import zlib
+import base64
+import shutil
+import struct
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+from openai_images import IMAGE_MODEL, IMAGE_SIZE, image_type, stream_b64_json_to_file
+
+# Configuration
+BATCH_DIR = Path("/Users/sohail/AutoLedger/CarImages/batches")
+REFS_DIR = BATCH_DIR / "refs"
+
+B64_MARKER = b'"b64_json"'
+
+EDITS_URL = "/v1/images/edits"
+GENERATIONS_URL = "/v1/images/generations"
+
+
+# ---------------------------------------------------------------------------
+# Writing batch files
+# ---------------------------------------------------------------------------
+
+def store_reference(ref_path: Path, refs_dir: Path | None = None) -> dict:
+    """Copy a reference into the content-addressed refs dir. Returns its image descriptor."""
+    refs_dir = Path(refs_dir or REFS_DIR)
+    digest = hashlib.sha256()
+    with open(ref_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    sha = digest.hexdigest()
+    filename, content_type = image_type(ref_path)
+
+    dest = refs_dir / f"{sha}{Path(filename).suffix}"
+    if not dest.exists():
+        refs_dir.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(ref_path, tmp)
+        os.replace(tmp, dest)
+    return {"sha256": sha, "filename": filename, "content_type": content_type}
+
+
+class BatchWriter:
+    """Append request lines to a batch file; the file appears only once closed cleanly."""
+
+    def __init__(self, path: Path, refs_dir: Path | None = None):
+        self.path = Path(path)
+        self.refs_dir = refs_dir
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        self.file = open(self.tmp, "w")
+        self.count = 0
+
+    def _write(self, custom_id: str, url: str, body: dict):
+        line = {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+        self.file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def add_edit(self, custom_id: str, ref_path: Path, prompt: str):
+        self._write(custom_id, EDITS_URL, {
+            "model": IMAGE_MODEL,
+            "prompt": prompt,
+            "n": 1,
+            "size": IMAGE_SIZE,
+            "image": store_reference(ref_path, self.refs_dir),
+        })
+
+    def add_generation(self, custom_id: str, prompt: str):
+        self._write(custom_id, GENERATIONS_URL, {
+            "model": IMAGE_MODEL,
+            "prompt": prompt,
+            "n": 1,
+            "size": IMAGE_SIZE,
+        })
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.file.close()
+        self.tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_lines(path: Path):
+    """Yield parsed JSONL lines one at a time (result files can be gigabytes)."""
+    with open(path, "rb") as f:
+        for raw in f:
+            if raw.strip():
+                yield json.loads(raw)
+
+
+def batch_ids(batch_path: Path) -> set[str]:
+    """custom_ids of every request in a batch file."""
+    return {request["custom_id"] for request in iter_lines(batch_path)}
+
+
+# ---------------------------------------------------------------------------
+# Ingesting results
+# ---------------------------------------------------------------------------
+
+def result_error(line: dict) -> str | None:
+    """Error message for a failed result line, None if it succeeded."""
+    if line.get("error"):
+        err = line["error"]
+        return err.get("message", str(err)) if isinstance(err, dict) else str(err)
+    response = line.get("response") or {}
+    status = response.get("status_code")
+    if status != 200:
+        body = response.get("body") or {}
+        message = (body.get("error") or {}).get("message", "") if isinstance(body, dict) else ""
+        return f"HTTP {status}: {message}".rstrip(": ")
+    return None
+
+
+def _parse_result(raw: bytes) -> dict:
+    """Parse a result line with its b64_json value left out (as ""), so the
+    image isn't materialized as a Python string."""
+    idx = raw.find(B64_MARKER)
+    if idx >= 0:
+        start = raw.find(b'"', idx + len(B64_MARKER))
+        end = raw.find(b'"', start + 1) if start >= 0 else -1
+        if end >= 0:
+            try:
+                return json.loads(raw[:start] + b'""' + raw[end + 1:])
+            except ValueError:
+                pass
+    return json.loads(raw)
+
+
+def safe_custom_id(name) -> bool:
+    """True if `name` can be used as a file name in the output directory."""
+    return (isinstance(name, str) and name not in ("", ".", "..") and not name.startswith(".")
+            and "/" not in name and "\\" not in name and os.sep not in name and "\0" not in name)
+
+
+def ingest_results(results_path: Path, out_dir: Path, expected: set[str],
+                   store=None, inventory=None) -> dict:
+    """Write each successful result to out_dir/<custom_id>.png and record it in the job store.
+
+    Only ids in `expected` are accepted; others are reported as rejected and
+    touch neither the disk nor the store. Returns
+    {"done": [...], "failed": {custom_id: error}, "rejected": {custom_id: reason}}.
+    """
+    done = []
+    failed = {}
+    rejected = {}
+    with open(results_path, "rb") as f:
+        for number, raw in enumerate(f, 1):
+            if not raw.strip():
+                continue
+            try:
+                line = _parse_result(raw)
+            except ValueError:
+                rejected[f"line {number}"] = "not valid JSON"
+                continue
+            name = line.get("custom_id")
+            if not safe_custom_id(name):
+                rejected[str(name)] = "not a plain file name"
+                continue
+            if name not in expected:
+                rejected[name] = "not a pending job of this batch"
+                continue
+
+            error = result_error(line)
+            out_path = out_dir / f"{name}.png"
+            if error is None:
+                try:
+                    stream_b64_json_to_file(io.BytesIO(raw), out_path)
+                except ValueError as e:  # includes binascii.Error
+                    error = f"malformed result: {e}"
+
+            if error is not None:
+                failed[name] = error
+                if store:
+                    store.fail(name, error)
+                continue
+
+            if store:
+                store.finish(name, "batch")
+            if inventory:
+                inventory.update_file("raw", out_path.name, out_path)
+            done.append(name)
+    return {"done": done, "failed": failed, "rejected": rejected}
+
+
+# ---------------------------------------------------------------------------
+# Local stand-in for the batch service
+# ---------------------------------------------------------------------------
+
+def placeholder_png(width: int = 16, height: int = 16, gray: int = 40) -> bytes:
+    """A flat dark-gray RGB PNG built without Pillow."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    row = b"\x00" + bytes([gray, gray, gray]) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+def simulate(batch_path: Path, results_path: Path, refs_dir: Path | None = None) -> int:
+    """Answer every request in a batch file offline. Returns the number of result lines."""
+    refs_dir = Path(refs_dir or REFS_DIR)
+    placeholder = base64.b64encode(placeholder_png()).decode()
+    count = 0
+    tmp = results_path.with_name(f".{results_path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    with open(tmp, "w") as out:
+        for index, request in enumerate(iter_lines(batch_path)):
+            result = {"id": f"batch_req_{index}", "custom_id": request["custom_id"], "error": None}
+            image = request["body"].get("image")
+            if request["url"] == EDITS_URL:
+                ref = refs_dir / f"{image['sha256']}{Path(image['filename']).suffix}"
+                if ref.exists():
+                    b64 = base64.b64encode(ref.read_bytes()).decode()
+                    result["response"] = {"status_code": 200, "body": {"data": [{"b64_json": b64}]}}
+                else:
+                    result["response"] = {"status_code": 400, "body": {
+                        "error": {"message": f"reference {image['sha256'][:12]} not found"}}}
+            else:
+                result["response"] = {"status_code": 200, "body": {"data": [{"b64_json": placeholder}]}}
+            out.write(json.dumps(result) + "\n")
+            count += 1
+    os.replace(tmp, results_path)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline image batch tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sim = sub.add_parser("simulate", help="answer a batch file locally (no network)")
+    sim.add_argument("batch", type=Path)
+    sim.add_argument("results", type=Path)
+    sim.add_argument("--refs-dir", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "simulate":
+        count = simulate(args.batch, args.results, args.refs_dir)
+        print(f"Wrote {count} results to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
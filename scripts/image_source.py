@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Decode-once image loading shared by the optimize, direction and reference steps.
+
+optimize_car_images.py used to decode each new PNG three times — once for
+the GPT-4o thumbnail, once for the offline direction detector and once for
+the output JPEG — and flatten its alpha at full resolution each time, with
+the same RGBA -> RGB block copied into every step. read() now returns the
+file's SHA-256 and one decoded RGB image, and every consumer (hashing,
+thumbnail, flip detection, resize, encode) works from those:
+
+- the bytes are read once and hashed as they are decoded
+- with max_size the decoder does as little as the target needs: JPEG uses
+  draft() (DCT scaling), other formats an integer reduce() that never goes
+  below max_size — so a 1536x1024 PNG for a 1200x800 output is untouched,
+  and the Lanczos resize that follows is unchanged
+- alpha is flattened once, after reducing, onto the caller's background
+
+Usage:
+    from image_source import read, flatten
+    sha, img = read(png_path, max_size=(1200, 800))
+    img = flatten(Image.open(path), background=(255, 255, 255))
+
+Dependencies: pip3 install Pillow
+"""
+
+import io
+import os
+import hashlib
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+STUDIO_BACKGROUND = (40, 40, 40)  # the generated images' dark-gray studio
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def flatten(img: "Image.Image", background=STUDIO_BACKGROUND) -> "Image.Image":
+    """RGB copy of `img` with any alpha composited onto `background` (`img` itself if already RGB)."""
+    if img.mode in ("RGBA", "LA", "P", "PA"):
+        img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, background)
+        bg.paste(img, mask=img.split()[3])
+        return bg
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def decode(data: bytes, max_size: tuple[int, int] | None = None,
+           background=STUDIO_BACKGROUND) -> "Image.Image":
+    """Decode image bytes to RGB, reduced while decoding when `max_size` allows it."""
+    # Not closed: close() would discard the pixels of an image returned as is,
+    # and an in-memory source holds no file handle
+    img = Image.open(io.BytesIO(data))
+    if max_size:
+        img.draft("RGB", max_size)  # JPEG only; a no-op for PNG
+    img.load()
+    if max_size:
+        factor = min(img.width // max_size[0], img.height // max_size[1])
+        if factor >= 2:
+            if img.mode == "P":
+                img = img.convert("RGBA")
+            img = img.reduce(factor)
+    return flatten(img, background)
+
+
+def read(path: Path, max_size: tuple[int, int] | None = None,
+         background=STUDIO_BACKGROUND) -> tuple[str, "Image.Image"]:
+    """(SHA-256 of the file, decoded RGB image) from a single read of `path`."""
+    data = Path(path).read_bytes() if isinstance(path, (str, os.PathLike)) else bytes(path)
+    return hashlib.sha256(data).hexdigest(), decode(data, max_size, background)
+
+
+def fit(img: "Image.Image", max_size: tuple[int, int]) -> "Image.Image":
+    """Downscale in place to fit `max_size` (Lanczos, aspect kept); smaller images are left alone."""
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img.thumbnail(max_size, Image.LANCZOS)
+    return img
+
+
+def fitted(img: "Image.Image", max_size: tuple[int, int]) -> "Image.Image":
+    """Downscaled copy of `img` that fits `max_size` (Lanczos, aspect kept); `img` itself if it fits."""
+    scale = min(max_size[0] / img.width, max_size[1] / img.height)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS, reducing_gap=2.0)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Crash-safe job store for the image generation scripts.
+
+Replaces the manifest.json that was rewritten in full after every image.
+State lives in a SQLite database (CarImages/jobs.sqlite3, WAL mode):
+
+  jobs    one row per (batch, name): state, method, attempts, last error —
+          primary-key lookups, so "is this model done?" is O(1)
+  events  append-only journal of every state change
+  runs    one row per script run with its final summary
+
+Every transition is a single small transaction, so an interrupt can never
+truncate progress. Jobs left "in_flight" by a crash are put back to
+"pending" on the next run. Batches keep the scripts apart:
+generate_car_images.py uses "generate", regenerate_plates.py "plates",
+regenerate_from_refs.py "refs".
+
+States: pending -> in_flight -> done | failed
+
+Usage:
+    python3 scripts/job_store.py status [--batch generate]
+    python3 scripts/job_store.py failed [--batch generate]
+    python3 scripts/job_store.py reset-failed [--batch generate]
+    python3 scripts/job_store.py compact
+"""
+
+import json
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+# Configuration
+STORE_FILE = Path("/Users/sohail/AutoLedger/CarImages/jobs.sqlite3")
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    batch       TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    method      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (batch, name)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (batch, state);
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch   TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    state   TEXT NOT NULL,
+    detail  TEXT,
+    at      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch         TEXT NOT NULL,
+    started_at    TEXT NOT NULL,
+    completed_at  TEXT,
+    summary       TEXT
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class JobStore:
+    """Per-model job state for one batch, safe to share across worker threads."""
+
+    def __init__(self, path: Path | None = None, batch: str = "generate"):
+        self.path = Path(path or STORE_FILE)
+        self.batch = batch
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # -- transitions --------------------------------------------------------
+
+    def _transition(self, name: str, state: str, method: str | None = None,
+                    error: str | None = None, attempt: bool = False):
+        now = _now()
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                """INSERT INTO jobs (batch, name, state, method, attempts, error, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (batch, name) DO UPDATE SET
+                       state = excluded.state,
+                       method = COALESCE(excluded.method, jobs.method),
+                       attempts = jobs.attempts + ?,
+                       error = excluded.error,
+                       updated_at = excluded.updated_at""",
+                (self.batch, name, state, method, int(attempt), error, now, int(attempt)),
+            )
+            self.db.execute(
+                "INSERT INTO events (batch, name, state, detail, at) VALUES (?, ?, ?, ?, ?)",
+                (self.batch, name, state, error or method, now),
+            )
+
+    def add_pending(self, names: list[str]):
+        """Register jobs that don't exist yet; existing rows keep their state."""
+        now = _now()
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO jobs (batch, name, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(self.batch, name, PENDING, now) for name in names],
+            )
+
+    def start(self, name: str):
+        """Mark a job in flight and count the attempt."""
+        self._transition(name, IN_FLIGHT, attempt=True)
+
+    def finish(self, name: str, method: str | None = None):
+        self._transition(name, DONE, method=method)
+
+    def fail(self, name: str, error: str):
+        self._transition(name, FAILED, error=error)
+
+    def reset(self, name: str):
+        self._transition(name, PENDING)
+
+    def reset_in_flight(self) -> int:
+        """Put jobs orphaned by a crash back to pending. Returns how many."""
+        names = self.names(IN_FLIGHT)
+        for name in names:
+            self.reset(name)
+        return len(names)
+
+    # -- queries ------------------------------------------------------------
+
+    def get(self, name: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT state, method, attempts, error, updated_at FROM jobs WHERE batch = ? AND name = ?",
+                (self.batch, name),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("state", "method", "attempts", "error", "updated_at"), row))
+
+    def state(self, name: str) -> str | None:
+        job = self.get(name)
+        return job["state"] if job else None
+
+    def is_done(self, name: str) -> bool:
+        return self.state(name) == DONE
+
+    def names(self, state: str) -> list[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT name FROM jobs WHERE batch = ? AND state = ? ORDER BY name",
+                (self.batch, state),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> dict:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state", (self.batch,)
+            ).fetchall()
+        return dict(rows)
+
+    def methods(self) -> dict:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT method, COUNT(*) FROM jobs WHERE batch = ? AND state = ? GROUP BY method",
+                (self.batch, DONE),
+            ).fetchall()
+        return dict(rows)
+
+    # -- runs -----------------------------------------------------------------
+
+    def start_run(self) -> int:
+        with self.lock:
+            cur = self.db.execute(
+                "INSERT INTO runs (batch, started_at) VALUES (?, ?)", (self.batch, _now()))
+            return cur.lastrowid
+
+    def end_run(self, run_id: int, summary: dict):
+        with self.lock:
+            self.db.execute(
+                "UPDATE runs SET completed_at = ?, summary = ? WHERE id = ?",
+                (_now(), json.dumps(summary), run_id),
+            )
+
+    # -- maintenance ----------------------------------------------------------
+
+    def import_manifest(self, manifest_file: Path) -> int:
+        """One-time migration from the old manifest.json. Returns jobs imported."""
+        if not manifest_file.exists() or self.counts():
+            return 0
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        methods = manifest.get("methods", {})
+        generated = set(manifest.get("generated", []))
+        for name in manifest.get("failed", []):
+            if name not in generated:
+                self.fail(name, "imported from manifest.json")
+        for name in generated:
+            self.finish(name, methods.get(name))
+        return len(generated) + len(set(manifest.get("failed", [])) - generated)
+
+    def compact(self) -> int:
+        """Drop journal events superseded by a later one for the same job, then VACUUM."""
+        with self.lock:
+            cur = self.db.execute(
+                """DELETE FROM events WHERE id NOT IN (
+                       SELECT MAX(id) FROM events GROUP BY batch, name)""")
+            removed = cur.rowcount
+            self.db.execute("VACUUM")
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the image job store.")
+    parser.add_argument("command", choices=["status", "failed", "reset-failed", "compact"])
+    parser.add_argument("--batch", default="generate", help="generate, plates or refs")
+    args = parser.parse_args()
+
+    if not STORE_FILE.exists():
+        print(f"No job store at {STORE_FILE}")
+        return
+
+    store = JobStore(batch=args.batch)
+
+    if args.command == "status":
+        counts = store.counts()
+        print(f"Batch '{args.batch}': {sum(counts.values())} jobs")
+        for state in (PENDING, IN_FLIGHT, DONE, FAILED):
+            print(f"  {state:<10} {counts.get(state, 0)}")
+        methods = store.methods()
+        if methods:
+            print("  methods:   " + ", ".join(f"{m or '?'} {n}" for m, n in methods.items()))
+
+    elif args.command == "failed":
+        for name in store.names(FAILED):
+            print(f"  {name}: {store.get(name)['error']}")
+
+    elif args.command == "reset-failed":
+        names = store.names(FAILED)
+        for name in names:
+            store.reset(name)
+        print(f"Reset {len(names)} failed jobs to pending")
+
+    elif args.command == "compact":
+        size_before = STORE_FILE.stat().st_size
+        removed = store.compact()
+        size_after = STORE_FILE.stat().st_size
+        print(f"Removed {removed} journal events, "
+              f"{size_before // 1024}KB -> {size_after // 1024}KB")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
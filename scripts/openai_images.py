@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Streaming OpenAI image calls shared by the generation scripts.
+
+gpt-image-1 returns a ~3 MB PNG as base64 inside JSON. Reading the whole
+response, json.loads-ing it and base64-decoding it keeps three copies of the
+image alive per request; building the multipart upload with b"\\r\\n".join
+adds more copies of the reference. Here both directions stream instead:
+
+- MultipartEncoder yields the form body piece by piece and reads file parts
+  lazily in CHUNK_SIZE blocks, with an exact Content-Length up front
+- stream_b64_json_to_file() scans the JSON response for "b64_json" and
+  decodes it incrementally straight into the output file
+
+so peak memory per in-flight request stays around a few CHUNK_SIZE buffers
+regardless of image size. Outputs are written to a temp file and renamed
+into place, so an interrupted call never leaves a truncated PNG behind.
+
+Usage:
+    from openai_images import images_edit, images_generate
+
+    images_edit(ref_path, prompt, out_path)
+    images_generate(prompt, out_path)
+"""
+
+import os
+import json
+import uuid
+import binascii
+import threading
+from pathlib import Path
+from collections.abc import Iterator
+
+import asset_http
+
+# Configuration
+API_KEY = os.environ.get("OPENAI_API_KEY")
+API_BASE = "https://api.openai.com/v1"
+IMAGE_MODEL = "gpt-image-1"
+IMAGE_SIZE = "1536x1024"
+REQUEST_TIMEOUT = 300
+CHUNK_SIZE = 64 * 1024
+
+IMAGE_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+
+
+# ---------------------------------------------------------------------------
+# Streaming multipart upload
+# ---------------------------------------------------------------------------
+
+class MultipartEncoder:
+    """multipart/form-data body that is streamed rather than built in memory.
+
+    `files` maps field name to (filename, source, content_type) where source is
+    bytes or a Path read lazily. Iterating restarts from the beginning, so the
+    body can be resent if a pooled connection turns out to be stale.
+    """
+
+    def __init__(self, fields: dict, files: dict):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.parts = []
+        for key, val in fields.items():
+            header = (f"--{self.boundary}\r\n"
+                      f'Content-Disposition: form-data; name="{key}"\r\n\r\n')
+            value = val.encode() if isinstance(val, str) else val
+            self.parts.append(header.encode() + value + b"\r\n")
+        for key, (filename, source, content_type) in files.items():
+            header = (f"--{self.boundary}\r\n"
+                      f'Content-Disposition: form-data; name="{key}"; filename="{filename}"\r\n'
+                      f"Content-Type: {content_type}\r\n\r\n")
+            self.parts.append(header.encode())
+            self.parts.append(Path(source) if isinstance(source, (str, os.PathLike)) else source)
+            self.parts.append(b"\r\n")
+        self.parts.append(f"--{self.boundary}--\r\n".encode())
+
+    def __len__(self) -> int:
+        return sum(part.stat().st_size if isinstance(part, Path) else len(part)
+                   for part in self.parts)
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, Path):
+                with open(part, "rb") as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        yield chunk
+            else:
+                view = memoryview(part)
+                for start in range(0, len(view), CHUNK_SIZE):
+                    yield view[start:start + CHUNK_SIZE]
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": self.content_type, "Content-Length": str(len(self))}
+
+
+# ---------------------------------------------------------------------------
+# Streaming base64 decode
+# ---------------------------------------------------------------------------
+
+def _write_atomic_stream(out_path: Path, chunks) -> int:
+    """Write an iterable of byte chunks to `out_path` via a temp file. Returns bytes written."""
+    out_path = Path(out_path)
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    written = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return written
+
+
+def iter_b64_json(resp) -> Iterator[bytes]:
+    """Yield decoded image bytes from the first "b64_json" string in a JSON response stream."""
+    marker = b'"b64_json"'
+    buf = b""
+    head = b""
+
+    # Find the opening quote of the b64_json value
+    while True:
+        chunk = resp.read(CHUNK_SIZE)
+        if len(head) < 2048:
+            head += chunk[:2048 - len(head)]
+        if not chunk:
+            raise ValueError(f"No b64_json in response: {head.decode('utf-8', 'replace')[:500]}")
+        buf += chunk
+        idx = buf.find(marker)
+        if idx < 0:
+            buf = buf[-len(marker):]
+            continue
+        rest = buf[idx + len(marker):].lstrip()
+        if not rest.startswith(b":"):
+            if len(rest) < 2:
+                continue
+            raise ValueError("Malformed b64_json field in response")
+        rest = rest[1:].lstrip()
+        if not rest:
+            buf = buf[:idx + len(marker)] + b":"
+            continue
+        if not rest.startswith(b'"'):
+            raise ValueError("Malformed b64_json field in response")
+        buf = rest[1:]
+        break
+
+    # Decode 4-character groups as they arrive until the closing quote
+    pending = b""
+    while True:
+        end = buf.find(b'"')
+        data = buf if end < 0 else buf[:end]
+        # JSON may escape "/" as "\/"; base64 itself never contains a backslash
+        pending += data.replace(b"\\", b"")
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield binascii.a2b_base64(pending[:usable])
+            pending = pending[usable:]
+        if end >= 0:
+            break
+        buf = resp.read(CHUNK_SIZE)
+        if not buf:
+            raise ValueError("Response ended inside b64_json payload")
+
+    if pending:
+        yield binascii.a2b_base64(pending)
+
+    # Drain the rest of the JSON so the pooled connection can be reused
+    while resp.read(CHUNK_SIZE):
+        pass
+
+
+def stream_b64_json_to_file(resp, out_path: Path) -> int:
+    """Decode the response's b64_json image straight into `out_path`. Returns bytes written."""
+    return _write_atomic_stream(out_path, iter_b64_json(resp))
+
+
+# ---------------------------------------------------------------------------
+# API calls
+# ---------------------------------------------------------------------------
+
+def _sniff_suffix(head: bytes) -> str | None:
+    if head[:4] == b"\x89PNG":
+        return ".png"
+    if head[:2] == b"\xff\xd8":
+        return ".jpg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def image_type(image) -> tuple[str, str]:
+    """(filename, content_type) for an upload: from the path's suffix, or the bytes' magic number.
+
+    Raises ValueError for anything the edit endpoint doesn't take (PNG, JPEG, WebP)
+    rather than labelling it as one of those.
+    """
+    name = "image bytes"
+    if isinstance(image, (str, os.PathLike)):
+        name = Path(image).name
+        suffix = Path(image).suffix.lower()
+        if suffix not in IMAGE_TYPES:
+            with open(image, "rb") as f:
+                suffix = _sniff_suffix(f.read(16))
+    else:
+        suffix = _sniff_suffix(image[:16])
+    if suffix not in IMAGE_TYPES:
+        raise ValueError(f"{name}: unsupported upload format (not PNG, JPEG or WebP)")
+    return f"reference{suffix}", IMAGE_TYPES[suffix]
+
+
+def images_edit(image, prompt: str, out_path: Path, filename: str | None = None,
+                content_type: str | None = None) -> int:
+    """Restyle `image` (bytes or a path) via /v1/images/edits, writing the result to `out_path`.
+
+    The upload is labelled with the image's real type unless `filename`/`content_type` are given.
+    """
+    if filename is None or content_type is None:
+        guessed_name, guessed_type = image_type(image)
+        filename = filename or guessed_name
+        content_type = content_type or guessed_type
+    body = MultipartEncoder(
+        fields={
+            "model": IMAGE_MODEL,
+            "prompt": prompt,
+            "n": "1",
+            "size": IMAGE_SIZE,
+        },
+        files={
+            "image": (filename, image, content_type),
+        },
+    )
+
+    with asset_http.request(
+        "POST",
+        f"{API_BASE}/images/edits",
+        body=body,
+        headers={
+            "Authorization": f"Bearer {API_KEY}",
+            **body.headers,
+        },
+        timeout=REQUEST_TIMEOUT,
+    ) as response:
+        return stream_b64_json_to_file(response, out_path)
+
+
+def images_generate(prompt: str, out_path: Path) -> int:
+    """Text-only generation via /v1/images/generations, writing the result to `out_path`."""
+    data = json.dumps({
+        "model": IMAGE_MODEL,
+        "prompt": prompt,
+        "n": 1,
+        "size": IMAGE_SIZE,
+    }).encode()
+
+    with asset_http.request(
+        "POST",
+        f"{API_BASE}/images/generations",
+        body=data,
+        headers={
+            "Authorization": f"Bearer {API_KEY}",
+            "Content-Type": "application/json",
+        },
+        timeout=REQUEST_TIMEOUT,
+    ) as response:
+        return stream_b64_json_to_file(response, out_path)
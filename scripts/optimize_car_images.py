@@ -3,26 +3,75 @@
 Optimize generated car images for app bundling.
 
 Pipeline:
-1. Read raw PNGs from CarImages/
-2. Detect car facing direction using GPT-4o vision
+1. Read raw PNGs from CarImages/ (listed by the asset inventory; truncated
+   or corrupt PNGs are reported and skipped)
+2. Detect car facing direction: offline detector first (direction_model.py,
+   trained on earlier GPT-4o answers), GPT-4o vision only for images it is
+   not confident about, sent DIRECTION_WORKERS batches at a time
 3. Flip only right-facing cars so all face left
-4. Resize to max 1200x800 (Lanczos resampling)
-5. Convert to JPEG quality 82
+4. Trim the studio backdrop to a 3:2 frame with the car at the same scale
+   in every image, padding the backdrop for a car too large for it, and
+   resize to exactly 1200x800 (studio_framing.py; --no-trim keeps the full
+   frame and only fits it within 1200x800; Lanczos resampling)
+5. Convert to JPEG quality 82 — or, with --target-ssim, the smallest
+   quality/subsampling/progressive setting that keeps SSIM against the
+   resized image at the target (quality_search.py) — plus hero and
+   list-thumbnail variants at
+   @2x/@3x (asset_variants.py), optionally also in WebP/AVIF/HEIF (--format)
 6. Output to CarImages/optimized/
 
-Dependencies: pip3 install Pillow
-Requires: OPENAI_API_KEY environment variable
+Each PNG is decoded once (image_source.py): the fitted 1200x800 image feeds
+the offline detector, the GPT-4o thumbnail and the JPEG encode. An image
+the detector is unsure about is held, decoded, until its GPT-4o batch
+answers and is then encoded without a second decode.
+
+Steps 2-5 are CPU-bound (PNG decode, Lanczos resize, optimized JPEG encode);
+--jobs N spreads them over N worker processes. Results are collected in
+input order, so the log and the totals are the same as a serial run.
+
+Directions are cached in direction_cache.json by the PNG's SHA-256 (see
+direction_cache.py), so a regenerated image is detected again instead of
+inheriting the old file's answer, and GPT-4o answers are re-asked when
+VISION_MODEL or DIRECTION_PROMPT_VERSION changes.
+
+Builds are incremental: optimize_cache.json records, per output JPEG, the
+source PNG's SHA-256, the flip decision, the encoder settings, the
+output's SHA-256 and, with --target-ssim, the JPEG settings the search
+chose, and the framing settings. An output is re-encoded only when one of
+the inputs changed (or the JPEG was deleted/edited), so changing
+JPEG_QUALITY or the SSIM target re-encodes everything, a new direction
+re-encodes one image, and a no-op rerun is a directory scan. --force
+rebuilds everything. generate_car_images.py --post-process writes the same
+records (build_record()), so the images it imported are up to date here.
+A direction GPT-4o didn't answer is cached as a guess rather than left
+unknown, so it doesn't force a re-encode on every run.
+
+Dependencies: pip3 install Pillow (numpy for the offline direction detector and trimming)
+Requires: OPENAI_API_KEY environment variable when some directions still need GPT-4o
 
 Usage:
     export OPENAI_API_KEY="your-key"
     python3 scripts/optimize_car_images.py
+    python3 scripts/optimize_car_images.py --jobs 8     # 0 = one per CPU core
+    python3 scripts/optimize_car_images.py --force      # ignore the build cache
+    python3 scripts/optimize_car_images.py --min-confidence 0.95
+    python3 scripts/optimize_car_images.py --direction-workers 8 --direction-batch-size 10
+    python3 scripts/optimize_car_images.py --format avif  # AVIF variants next to the JPEG ones
+    python3 scripts/optimize_car_images.py --target-ssim 0.99 --jobs 0
+    python3 scripts/optimize_car_images.py --no-trim    # keep the generated framing
+    python3 scripts/optimize_car_images.py --recheck-guesses  # re-ask GPT-4o for guessed directions
 """
 
+import io
 import os
 import json
 import base64
-import urllib.request
+import argparse
+import functools
 from pathlib import Path
+from collections import deque
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 try:
     from PIL import Image
@@ -31,227 +80,613 @@ except ImportError:
     print("  pip3 install Pillow")
     exit(1)
 
+import asset_http
+import image_source
+import quality_search
+import studio_framing
+from asset_inventory import Inventory
+from asset_variants import FORMATS, VARIANTS, available_formats, variant_filename
+from direction_cache import DirectionCache
+from direction_model import MIN_CONFIDENCE, DirectionModel
+
 # Configuration
 INPUT_DIR = Path("/Users/sohail/AutoLedger/CarImages")
 OUTPUT_DIR = INPUT_DIR / "optimized"
 DIRECTION_CACHE = INPUT_DIR / "direction_cache.json"
+BUILD_CACHE = INPUT_DIR / "optimize_cache.json"
 MAX_WIDTH = 1200
 MAX_HEIGHT = 800
 JPEG_QUALITY = 82
+VARIANT_QUALITY = {"jpeg": JPEG_QUALITY, "webp": 80, "avif": 60, "heic": 70}
+BACKGROUND_COLOR = (40, 40, 40)  # alpha is flattened onto the studio gray
 API_KEY = os.environ.get("OPENAI_API_KEY")
-
-
-def detect_direction_batch(image_paths: list[Path], batch_size: int = 5) -> dict[str, str]:
-    """Detect car facing direction for a batch of images using GPT-4o vision.
-    Returns dict mapping filename to 'left' or 'right'."""
-    results = {}
-
-    for i in range(0, len(image_paths), batch_size):
-        batch = image_paths[i:i + batch_size]
-        content = [
-            {
-                "type": "text",
-                "text": (
-                    "For each car image, tell me which direction the car's FRONT/NOSE is pointing: "
-                    "'left' or 'right'. A car facing left has its hood/bonnet pointing toward the "
-                    "left side of the image. Respond ONLY with a JSON object mapping each filename "
-                    "to 'left' or 'right'. Example: {\"audi_a3.png\": \"left\", \"bmw_x5.png\": \"right\"}"
-                ),
-            }
-        ]
-
-        for img_path in batch:
-            # Create a small thumbnail for vision (saves tokens)
-            with Image.open(img_path) as img:
-                if img.mode in ("RGBA", "P"):
-                    bg = Image.new("RGB", img.size, (40, 40, 40))
-                    if img.mode == "P":
-                        img = img.convert("RGBA")
-                    bg.paste(img, mask=img.split()[3])
-                    img = bg
-                elif img.mode != "RGB":
-                    img = img.convert("RGB")
-                img.thumbnail((512, 340), Image.LANCZOS)
-                import io
-                buf = io.BytesIO()
-                img.save(buf, "JPEG", quality=60)
-                b64 = base64.b64encode(buf.getvalue()).decode()
-
-            content.append({
-                "type": "text",
-                "text": f"Image: {img_path.name}"
-            })
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": "low"},
-            })
-
-        payload = json.dumps({
-            "model": "gpt-4o",
-            "messages": [{"role": "user", "content": content}],
-            "max_tokens": 300,
-        }).encode()
-
-        req = urllib.request.Request(
-            "https://api.openai.com/v1/chat/completions",
-            data=payload,
+API_BASE = "https://api.openai.com/v1"
+
+VISION_MODEL = "gpt-4o"
+DIRECTION_PROMPT_VERSION = 1  # bump when DIRECTION_PROMPT changes, to re-ask
+DIRECTION_BATCH_SIZE = 5      # images per vision request
+DIRECTION_WORKERS = 4         # vision requests in flight
+
+
+DIRECTION_PROMPT = (
+    "For each car image, tell me which direction the car's FRONT/NOSE is pointing: "
+    "'left' or 'right'. A car facing left has its hood/bonnet pointing toward the "
+    "left side of the image. Respond ONLY with a JSON object mapping each filename "
+    "to 'left' or 'right'. Example: {\"audi_a3.png\": \"left\", \"bmw_x5.png\": \"right\"}"
+)
+
+
+def vision_thumbnail(img: "Image.Image") -> bytes:
+    """Small JPEG of a decoded image for GPT-4o vision (saves tokens)."""
+    thumb = img.copy()
+    thumb.thumbnail((512, 340), Image.LANCZOS)
+    buf = io.BytesIO()
+    thumb.save(buf, "JPEG", quality=60)
+    return buf.getvalue()
+
+
+def _detect_one_batch(number: int, batch: list[tuple[str, bytes]]) -> dict[str, str]:
+    """One GPT-4o vision request for up to a batch of (filename, thumbnail). Returns {} on failure."""
+    content = [{"type": "text", "text": DIRECTION_PROMPT}]
+
+    for name, thumbnail in batch:
+        b64 = base64.b64encode(thumbnail).decode()
+        content.append({
+            "type": "text",
+            "text": f"Image: {name}"
+        })
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": "low"},
+        })
+
+    payload = json.dumps({
+        "model": VISION_MODEL,
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": 300,
+    }).encode()
+
+    try:
+        with asset_http.request(
+            "POST",
+            f"{API_BASE}/chat/completions",
+            body=payload,
             headers={
                 "Authorization": f"Bearer {API_KEY}",
                 "Content-Type": "application/json",
             },
-        )
-
-        try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                result = json.loads(resp.read())
-                text = result["choices"][0]["message"]["content"]
-                # Extract JSON from response
-                start = text.find("{")
-                end = text.rfind("}") + 1
-                if start >= 0 and end > start:
-                    parsed = json.loads(text[start:end])
-                    results.update(parsed)
-                    names = list(parsed.keys())
-                    dirs = list(parsed.values())
-                    print(f"  Batch {i // batch_size + 1}: {len(parsed)} detected — "
-                          f"{dirs.count('left')} left, {dirs.count('right')} right")
-                else:
-                    print(f"  Batch {i // batch_size + 1}: Failed to parse response")
-                    # Default to no-flip for unparseable results
-                    for p in batch:
-                        results[p.name] = "left"
-        except Exception as e:
-            print(f"  Batch {i // batch_size + 1}: API error: {e}")
-            # Default to no-flip on error
-            for p in batch:
-                results[p.name] = "left"
-
-    return results
+            timeout=60,
+        ) as resp:
+            result = json.loads(resp.read())
+        text = result["choices"][0]["message"]["content"]
+        # Extract JSON from response
+        start = text.find("{")
+        end = text.rfind("}") + 1
+        if start >= 0 and end > start:
+            parsed = json.loads(text[start:end])
+            dirs = list(parsed.values())
+            print(f"  Batch {number}: {len(parsed)} detected — "
+                  f"{dirs.count('left')} left, {dirs.count('right')} right", flush=True)
+            return parsed
+        print(f"  Batch {number}: Failed to parse response", flush=True)
+    except Exception as e:
+        print(f"  Batch {number}: API error: {e}", flush=True)
+    # Failed batches are left out, so they are retried next run instead of
+    # being cached as "left"
+    return {}
 
 
-def load_direction_cache() -> dict:
-    """Load cached direction results."""
-    if DIRECTION_CACHE.exists():
-        with open(DIRECTION_CACHE) as f:
-            return json.load(f)
-    return {}
+def detect_direction_batch(thumbnails: dict[str, bytes], batch_size: int = DIRECTION_BATCH_SIZE,
+                           workers: int = DIRECTION_WORKERS) -> dict[str, str]:
+    """Detect car facing direction using GPT-4o vision, `workers` batches in flight at once.
+    Takes {filename: vision_thumbnail()}; returns dict mapping filename to 'left' or 'right'."""
+    items = list(thumbnails.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for parsed in pool.map(_detect_one_batch, range(1, len(batches) + 1), batches):
+            results.update(parsed)
+    return results
 
 
-def save_direction_cache(cache: dict):
+def detect_directions(images: dict[str, tuple[str, "Image.Image"]], cache: DirectionCache,
+                      min_confidence: float = MIN_CONFIDENCE, model: DirectionModel | None = None,
+                      batch_size: int = DIRECTION_BATCH_SIZE, workers: int = DIRECTION_WORKERS) -> int:
+    """Fill `cache` for already decoded images ({filename: (sha256, image)}): the
+    offline detector where it is confident, GPT-4o otherwise. Returns how many
+    directions were found.
+
+    Images that still need GPT-4o are skipped when there is no API key and
+    stay uncached. When GPT-4o doesn't answer for one, the detector's answer
+    is cached as a guess.
+    """
+    model = model or DirectionModel.load()
+    found = 0
+    unsure = {}
+    unsure_answers = {}
+    for name, (sha, img) in images.items():
+        direction, confidence = model.predict(img)
+        if confidence >= min_confidence:
+            cache.set(sha, name, direction, source="local", model=model.name, confidence=confidence)
+            found += 1
+        else:
+            unsure[name] = sha
+            unsure_answers[name] = (direction, confidence)
+
+    if unsure and API_KEY:
+        thumbnails = {name: vision_thumbnail(images[name][1]) for name in unsure}
+        answers = detect_direction_batch(thumbnails, batch_size, workers)
+        for name, sha in unsure.items():
+            if answers.get(name) in ("left", "right"):
+                cache.set(sha, name, answers[name], source="api")
+                found += 1
+            else:
+                direction, confidence = unsure_answers[name]
+                cache.set(sha, name, direction, source="guess", model=model.name, confidence=confidence)
+    return found
+
+
+def load_direction_cache() -> DirectionCache:
+    """Load cached direction results (migrating a filename-keyed cache)."""
+    return DirectionCache(DIRECTION_CACHE, VISION_MODEL, DIRECTION_PROMPT_VERSION, image_dir=INPUT_DIR)
+
+
+def save_direction_cache(cache: DirectionCache):
     """Save direction cache."""
-    with open(DIRECTION_CACHE, "w") as f:
-        json.dump(cache, f, indent=2)
+    cache.save()
+
+
+def encoder_settings(formats: tuple[str, ...] = ("jpeg",), target_ssim: float | None = None,
+                     trim: bool = True) -> dict:
+    """Everything besides the source and the flip that changes the output bytes."""
+    settings = {
+        "max_width": MAX_WIDTH,
+        "max_height": MAX_HEIGHT,
+        "jpeg_quality": JPEG_QUALITY,
+        "background": list(BACKGROUND_COLOR),
+        "variants": {slot: {f"{scale}x": list(box) for scale, box in scales.items()}
+                     for slot, scales in VARIANTS.items()},
+        "variant_quality": {fmt: VARIANT_QUALITY[fmt] for fmt in formats},
+        "framing": studio_framing.settings() if trim else None,
+    }
+    if target_ssim is not None:
+        # JPEG quality becomes the search's ceiling
+        settings["target_ssim"] = target_ssim
+        settings["min_quality"] = quality_search.MIN_QUALITY
+    return settings
+
+
+def variant_files(asset: str, formats: tuple[str, ...]) -> list[str]:
+    """Filenames of every slot/scale variant of `asset` in `formats`."""
+    return [variant_filename(asset, slot, scale, fmt)
+            for fmt in formats for slot, scales in VARIANTS.items() for scale in scales]
+
+
+def load_build_cache() -> dict:
+    """Load the per-output build records (empty if missing or unreadable)."""
+    try:
+        with open(BUILD_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_cache(cache: dict):
+    """Save the build records atomically."""
+    tmp = BUILD_CACHE.with_name(f".{BUILD_CACHE.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, BUILD_CACHE)
+
+
+def build_record(source: str, flip: bool, settings: dict, output: str | None = None,
+                 variants: dict[str, str] | None = None, encoding: dict | None = None) -> dict:
+    """Build-cache entry for one output JPEG: an output is up to date while this still matches."""
+    record = {"source": source, "flip": flip, "settings": settings,
+              "output": output, "variants": variants or {}}
+    if encoding:
+        record["encoding"] = encoding
+    return record
+
+
+def load_source(src: Path, trim: bool = True) -> tuple[str, "Image.Image"]:
+    """(SHA-256, image) of a raw PNG from one read and one decode: framed at exactly the output
+    size, or (if `trim` is False or NumPy is missing) fitted to it."""
+    size = (MAX_WIDTH, MAX_HEIGHT)
+    sha, img = image_source.read(src, size, BACKGROUND_COLOR)
+    if trim and studio_framing.available():
+        # Exactly the output size, so every framed image has the same dimensions
+        return sha, studio_framing.trim(img, size)
+    return sha, image_source.fit(img, size)
+
+
+def staging_path(path: Path) -> Path:
+    """Temporary name next to `path`; outputs are written there and renamed over `path`, so a
+    file setup_car_images.py hard-linked into the asset catalog is replaced, not rewritten."""
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+def save_variant(img: "Image.Image", path: Path, fmt: str, jpeg_params: dict | None = None):
+    quality = VARIANT_QUALITY[fmt]
+    tmp = staging_path(path)
+    if fmt == "jpeg" and jpeg_params:
+        tmp.write_bytes(quality_search.encode_with(img, jpeg_params))
+    elif fmt == "jpeg":
+        img.save(tmp, "JPEG", quality=quality, optimize=True)
+    elif fmt == "webp":
+        img.save(tmp, "WEBP", quality=quality, method=6)
+    elif fmt == "avif":
+        img.save(tmp, "AVIF", quality=quality)
+    else:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+        img.save(tmp, "HEIF", quality=quality)
+    os.replace(tmp, path)
+
+
+def encode(img: "Image.Image", dst: Path, should_flip: bool, formats: tuple[str, ...] = ("jpeg",),
+           target_ssim: float | None = None) -> tuple[int, list[str], dict | None]:
+    """Write a fitted image as the output JPEG plus its slot/scale variants next to it.
+    Returns (new size, variant filenames, JPEG settings found by the SSIM search or None)."""
+    # Only flip if car is facing right
+    if should_flip:
+        img = img.transpose(Image.FLIP_LEFT_RIGHT)
+    params = None
+    tmp = staging_path(dst)
+    if target_ssim is None:
+        img.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        # Searched once on the full output; the JPEG variants reuse the settings
+        data, params = quality_search.search(img, target_ssim, max_quality=JPEG_QUALITY)
+        tmp.write_bytes(data)
+    os.replace(tmp, dst)
+
+    written = []
+    for slot, scales in VARIANTS.items():
+        for scale, box in scales.items():
+            variant = image_source.fitted(img, box)
+            for fmt in formats:
+                name = variant_filename(dst.stem, slot, scale, fmt)
+                save_variant(variant, dst.with_name(name), fmt, params)
+                written.append(name)
+    return dst.stat().st_size, written, params
 
 
 def optimize_image(src: Path, dst: Path, should_flip: bool) -> tuple[int, int]:
-    """Resize and convert a PNG to optimized JPEG. Returns (original_size, new_size)."""
-    original_size = src.stat().st_size
-
-    with Image.open(src) as img:
-        # Convert RGBA to RGB (JPEG doesn't support alpha)
-        if img.mode in ("RGBA", "P"):
-            background = Image.new("RGB", img.size, (40, 40, 40))
-            if img.mode == "P":
-                img = img.convert("RGBA")
-            background.paste(img, mask=img.split()[3])
-            img = background
-        elif img.mode != "RGB":
-            img = img.convert("RGB")
-
-        # Only flip if car is facing right
-        if should_flip:
-            img = img.transpose(Image.FLIP_LEFT_RIGHT)
-
-        # Resize if larger than max dimensions
-        if img.width > MAX_WIDTH or img.height > MAX_HEIGHT:
-            img.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.LANCZOS)
-
-        img.save(dst, "JPEG", quality=JPEG_QUALITY, optimize=True)
-
-    new_size = dst.stat().st_size
-    return original_size, new_size
+    """Resize and convert a PNG to optimized JPEG (and its variants). Returns (original_size, new_size)."""
+    _, img = load_source(src)
+    return src.stat().st_size, encode(img, dst, should_flip)[0]
+
+
+class Task(NamedTuple):
+    src: Path
+    dst: Path
+    flip: bool | None  # None: direction unknown, detect it from the decoded image
+
+
+class Outcome(NamedTuple):
+    original_size: int = 0
+    new_size: int = 0
+    flip: bool = False
+    error: str | None = None
+    detected: tuple[str, float] | None = None  # offline detector's (direction, confidence), if it ran
+    pending: tuple[bytes, "Image.Image"] | None = None  # (vision thumbnail, fitted image) awaiting GPT-4o
+    variants: tuple[str, ...] = ()
+    encoding: dict | None = None  # JPEG settings chosen by the SSIM search
+
+
+_direction_model = None
+
+
+def worker_direction_model() -> DirectionModel:
+    """The offline detector, loaded once per process."""
+    global _direction_model
+    if _direction_model is None:
+        _direction_model = DirectionModel.load()
+    return _direction_model
+
+
+def optimize_task(task: Task, min_confidence: float = MIN_CONFIDENCE,
+                  formats: tuple[str, ...] = ("jpeg",), target_ssim: float | None = None,
+                  trim: bool = True) -> Outcome:
+    """Decode once, detect the direction if unknown, then flip, resize and encode.
+
+    An image the offline detector is unsure about comes back unencoded, with
+    its GPT-4o thumbnail and the fitted image, so it can be encoded once the
+    API has answered without decoding it again. A failure comes back as a
+    message instead of raising.
+    """
+    try:
+        original_size = task.src.stat().st_size
+        _, img = load_source(task.src, trim)
+        flip, detected = task.flip, None
+        if flip is None:
+            detected = worker_direction_model().predict(img)
+            if detected[1] < min_confidence:
+                return Outcome(original_size, detected=detected, pending=(vision_thumbnail(img), img))
+            flip = detected[0] == "right"
+        new_size, variants, encoding = encode(img, task.dst, flip, formats, target_ssim)
+        return Outcome(original_size, new_size, flip, detected=detected, variants=tuple(variants),
+                       encoding=encoding)
+    except Exception as e:
+        return Outcome(error=str(e))
+
+
+def optimize_all(tasks: list[Task], jobs: int = 1, min_confidence: float = MIN_CONFIDENCE,
+                 formats: tuple[str, ...] = ("jpeg",), target_ssim: float | None = None,
+                 trim: bool = True):
+    """Yield (task, Outcome) in task order, using `jobs` processes."""
+    run = functools.partial(optimize_task, min_confidence=min_confidence, formats=formats,
+                            target_ssim=target_ssim, trim=trim)
+    if jobs <= 1:
+        for task in tasks:
+            yield task, run(task)
+        return
+    # A bounded window instead of map(): images held for GPT-4o are large, so
+    # workers shouldn't run far ahead of the consumer
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        window = deque()
+        for task in tasks:
+            window.append((task, pool.submit(run, task)))
+            if len(window) >= jobs * 4:
+                done, future = window.popleft()
+                yield done, future.result()
+        while window:
+            done, future = window.popleft()
+            yield done, future.result()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Optimize generated car images for app bundling.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes for resize/encode, 0 = one per CPU core (default 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="re-encode every image, ignoring the build cache")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help="offline direction confidence needed to skip GPT-4o; above 1 sends "
+                             f"everything to GPT-4o (default {MIN_CONFIDENCE:g})")
+    parser.add_argument("--direction-batch-size", type=int, default=DIRECTION_BATCH_SIZE,
+                        help=f"images per GPT-4o vision request (default {DIRECTION_BATCH_SIZE})")
+    parser.add_argument("--direction-workers", type=int, default=DIRECTION_WORKERS,
+                        help=f"GPT-4o vision requests in flight (default {DIRECTION_WORKERS})")
+    parser.add_argument("--target-ssim", type=float, default=None, metavar="SSIM",
+                        help="search each image for the smallest JPEG settings reaching this SSIM "
+                             f"(e.g. {quality_search.DEFAULT_TARGET}) instead of a fixed quality "
+                             f"{JPEG_QUALITY}; needs numpy")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="jpeg",
+                        help="also write the slot/scale variants in this codec (JPEG variants "
+                             "are always written); see asset_variants.py")
+    parser.add_argument("--recheck-guesses", action="store_true",
+                        help="ask GPT-4o again for directions cached as offline guesses after an "
+                             "earlier API failure")
+    parser.add_argument("--no-trim", dest="trim", action="store_false",
+                        help="keep the generated framing instead of trimming the studio backdrop")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+
     if not INPUT_DIR.exists():
         print(f"Error: Input directory not found: {INPUT_DIR}")
         return
 
-    if not API_KEY:
-        print("Error: Set OPENAI_API_KEY environment variable")
-        print("  export OPENAI_API_KEY='your-key-here'")
+    formats = ("jpeg",) if args.format == "jpeg" else ("jpeg", args.format)
+    if args.target_ssim is not None and not quality_search.available():
+        print("Error: --target-ssim needs NumPy. pip3 install numpy")
+        return
+    if args.format not in available_formats():
+        print(f"Error: this Pillow can't encode {args.format} "
+              + ("(pip3 install pillow-heif)" if args.format == "heic" else "(needs a newer Pillow build)"))
         return
 
+    trim = args.trim and studio_framing.available()
+    if args.trim and not trim:
+        print("Note: NumPy not installed — keeping the generated framing (pip3 install numpy)")
+
     OUTPUT_DIR.mkdir(exist_ok=True)
 
-    png_files = sorted(INPUT_DIR.glob("*.png"))
+    inventory = Inventory()
+    inventory.refresh(["raw", "optimized"])
+    png_files = [INPUT_DIR / name for name in inventory.names("raw")]
+    corrupt = inventory.corrupt("raw")
+    if corrupt:
+        print(f"Skipping {len(corrupt)} truncated/corrupt PNGs (regenerate them first):")
+        for name in corrupt:
+            print(f"  - {name}")
     if not png_files:
         print(f"No PNG files found in {INPUT_DIR}")
         return
 
     print(f"Found {len(png_files)} images to optimize")
-    print(f"Settings: max {MAX_WIDTH}x{MAX_HEIGHT}px, JPEG quality {JPEG_QUALITY}")
+    quality = (f"JPEG SSIM >= {args.target_ssim:g} (quality {quality_search.MIN_QUALITY}-{JPEG_QUALITY})"
+               if args.target_ssim is not None else f"JPEG quality {JPEG_QUALITY}")
+    print(f"Settings: max {MAX_WIDTH}x{MAX_HEIGHT}px{', trimmed' if trim else ''}, {quality}, "
+          f"variants in {' + '.join(formats)}, {jobs} worker process{'es' if jobs > 1 else ''}")
     print(f"Output: {OUTPUT_DIR}")
 
-    # Step 1: Detect car directions
-    print("\n--- Detecting car facing directions (GPT-4o vision) ---")
+    # Step 1: Detect car directions — cached ones now, the rest from the same
+    # decode that produces their output
+    print("\n--- Detecting car facing directions ---")
     cache = load_direction_cache()
-    uncached = [p for p in png_files if p.name not in cache]
-
-    if uncached:
-        print(f"  {len(uncached)} images need direction detection ({len(cache)} cached)")
-        new_directions = detect_direction_batch(uncached)
-        cache.update(new_directions)
-        save_direction_cache(cache)
+    model = DirectionModel.load()
+    hashes = {p: inventory.sha256("raw", p.name) for p in png_files}
+    directions = {p: cache.get(hashes[p]) for p in png_files}
+    if args.recheck_guesses:
+        # Detected (and encoded) again, like an image seen for the first time
+        directions = {p: None if cache.is_guess(hashes[p]) else d for p, d in directions.items()}
+    unknown = sum(1 for d in directions.values() if d is None)
+
+    if unknown:
+        print(f"  {unknown} images need direction detection ({len(png_files) - unknown} cached), "
+              + ("offline detector first" if model.trained else "no offline model — all go to GPT-4o"))
+        if not model.trained and not API_KEY:
+            print(f"Error: {unknown} images need GPT-4o direction detection. "
+                  "Set OPENAI_API_KEY environment variable")
+            print("  export OPENAI_API_KEY='your-key-here'")
+            return
     else:
         print(f"  All {len(png_files)} directions cached")
 
-    right_count = sum(1 for p in png_files if cache.get(p.name) == "right")
-    left_count = sum(1 for p in png_files if cache.get(p.name) == "left")
-    print(f"\n  Summary: {left_count} facing left, {right_count} facing right (will be flipped)")
-
     # Step 2: Optimize images
     print(f"\n--- Optimizing images ---")
     print("-" * 50)
 
     total_original = 0
     total_optimized = 0
+    total_variants = dict.fromkeys(formats, 0)
+    format_of = {ext: fmt for fmt, ext in FORMATS.items()}
     processed = 0
+    up_to_date = 0
     flipped = 0
-
+    detected_local = 0
+    detected_api = 0
+    guessed = 0
+    undetected = []
+
+    # Skip outputs whose source, flip and settings match the last build
+    settings = encoder_settings(formats, args.target_ssim, trim)
+    previous = {} if args.force else load_build_cache()
+    build = {}
+    tasks = []
     for png in png_files:
-        jpg_name = png.stem + ".jpg"
-        dst = OUTPUT_DIR / jpg_name
-        direction = cache.get(png.name, "left")
-        should_flip = direction == "right"
-
-        try:
-            orig_size, new_size = optimize_image(png, dst, should_flip)
-            savings = (1 - new_size / orig_size) * 100
-            flip_tag = " [FLIPPED]" if should_flip else ""
-            print(f"  {png.name} -> {jpg_name}  "
-                  f"{orig_size // 1024}KB -> {new_size // 1024}KB  "
-                  f"({savings:.0f}% smaller){flip_tag}")
-
-            total_original += orig_size
-            total_optimized += new_size
-            processed += 1
-            if should_flip:
-                flipped += 1
-
-        except Exception as e:
-            print(f"  FAILED: {png.name}: {e}")
+        dst = OUTPUT_DIR / f"{png.stem}.jpg"
+        if directions[png] is None:
+            tasks.append(Task(png, dst, None))
+            continue
+        should_flip = directions[png] == "right"
+        output = inventory.sha256("optimized", dst.name)
+        variants = {name: inventory.sha256("optimized", name) for name in variant_files(png.stem, formats)}
+        built = {k: v for k, v in previous.get(dst.name, {}).items() if k != "encoding"}
+        if output and all(variants.values()) and built == build_record(hashes[png], should_flip, settings,
+                                                                        output, variants):
+            build[dst.name] = previous[dst.name]
+            up_to_date += 1
+            total_original += inventory.entry("raw", png.name)["size"]
+            total_optimized += inventory.entry("optimized", dst.name)["size"]
+            for name in variants:
+                total_variants[format_of[Path(name).suffix]] += inventory.entry("optimized", name)["size"]
+            flipped += should_flip
+        else:
+            tasks.append(Task(png, dst, should_flip))
+
+    if up_to_date:
+        print(f"  {up_to_date} up to date (unchanged source, direction and settings)")
+
+    def finish(task: Task, should_flip: bool, orig_size: int, new_size: int, variants: list[str],
+               encoding: dict | None):
+        nonlocal total_original, total_optimized, processed, flipped
+        png, dst = task.src, task.dst
+        for name in [dst.name, *variants]:
+            inventory.update_file("optimized", name, OUTPUT_DIR / name)
+        build[dst.name] = build_record(
+            hashes[png], should_flip, settings, inventory.sha256("optimized", dst.name),
+            {name: inventory.sha256("optimized", name) for name in variants}, encoding)
+        variant_bytes = 0
+        for name in variants:
+            size = inventory.entry("optimized", name)["size"]
+            total_variants[format_of[Path(name).suffix]] += size
+            variant_bytes += size
+        savings = (1 - new_size / orig_size) * 100
+        flip_tag = " [FLIPPED]" if should_flip else ""
+        quality_tag = f" q{encoding['quality']} {encoding['subsampling']}" if encoding else ""
+        print(f"  {png.name} -> {dst.name}  "
+              f"{orig_size // 1024}KB -> {new_size // 1024}KB{quality_tag}  "
+              f"({savings:.0f}% smaller, +{variant_bytes // 1024}KB variants){flip_tag}", flush=True)
+
+        total_original += orig_size
+        total_optimized += new_size
+        processed += 1
+        if should_flip:
+            flipped += 1
+
+    # Images the offline detector was unsure about wait here, decoded, for
+    # GPT-4o; they are sent a full round of concurrent batches at a time
+    pending = []
+    flush_at = max(1, args.direction_batch_size * args.direction_workers)
+
+    def resolve_pending():
+        nonlocal detected_api, guessed
+        if not pending:
+            return
+        if not API_KEY:
+            undetected.extend(task.src.name for task, _ in pending)
+            pending.clear()
+            return
+        answers = detect_direction_batch({task.src.name: outcome.pending[0] for task, outcome in pending},
+                                         args.direction_batch_size, args.direction_workers)
+        for task, outcome in pending:
+            direction = answers.get(task.src.name)
+            if direction in ("left", "right"):
+                cache.set(hashes[task.src], task.src.name, direction, source="api")
+                detected_api += 1
+            else:
+                # Cached as a guess so it isn't re-encoded every run; --recheck-guesses re-asks
+                direction, confidence = outcome.detected
+                cache.set(hashes[task.src], task.src.name, direction, source="guess",
+                          model=model.name, confidence=confidence)
+                guessed += 1
+            should_flip = direction == "right"
+            try:
+                new_size, variants, encoding = encode(outcome.pending[1], task.dst, should_flip, formats,
+                                                      args.target_ssim)
+            except Exception as e:
+                print(f"  FAILED: {task.src.name}: {e}")
+                continue
+            finish(task, should_flip, outcome.original_size, new_size, variants, encoding)
+        pending.clear()
+        save_direction_cache(cache)
+
+    for task, outcome in optimize_all(tasks, jobs, args.min_confidence, formats, args.target_ssim,
+                                      trim):
+        if outcome.error is not None:
+            print(f"  FAILED: {task.src.name}: {outcome.error}")
+            continue
+        if outcome.pending is not None:
+            pending.append((task, outcome))
+            if len(pending) >= flush_at:
+                resolve_pending()
+            continue
+        if outcome.detected is not None:
+            direction, confidence = outcome.detected
+            cache.set(hashes[task.src], task.src.name, direction, source="local",
+                      model=model.name, confidence=confidence)
+            detected_local += 1
+        finish(task, outcome.flip, outcome.original_size, outcome.new_size, list(outcome.variants),
+               outcome.encoding)
+    resolve_pending()
+
+    # Unfinished tasks (interrupt) have no build record and rebuild next time
+    save_build_cache(build)
+    save_direction_cache(cache)
+    inventory.save()
 
     print()
     print("-" * 50)
-    print(f"Processed: {processed}/{len(png_files)} images")
+    print(f"Processed: {processed}/{len(png_files)} images"
+          + (f" ({up_to_date} more up to date)" if up_to_date else ""))
     print(f"Flipped:   {flipped} (were facing right, now face left)")
+    if unknown:
+        print(f"Directions: {detected_local} offline detector, {detected_api} GPT-4o"
+              + (f", {guessed} unanswered (offline guess used, cached as a guess)" if guessed else ""))
+    guesses = len(set(cache.guesses()) & set(hashes.values()))
+    if guesses:
+        print(f"Guesses:   {guesses} directions are unconfirmed offline guesses "
+              "(--recheck-guesses asks GPT-4o again)")
     print(f"Total original:  {total_original / (1024 * 1024):.1f} MB")
     print(f"Total optimized: {total_optimized / (1024 * 1024):.1f} MB")
+    for fmt in formats:
+        print(f"  {fmt} variants: {total_variants[fmt] / (1024 * 1024):.1f} MB (@2x + @3x, hero + thumb)")
     if total_original > 0:
         savings = (1 - total_optimized / total_original) * 100
         print(f"Total savings:   {savings:.0f}%")
     print(f"\nOptimized images saved to: {OUTPUT_DIR}")
+    if undetected:
+        print(f"\nError: {len(undetected)} images need GPT-4o direction detection and were skipped. "
+              "Set OPENAI_API_KEY environment variable")
+        print("  export OPENAI_API_KEY='your-key-here'")
+        return
     print("\nNext step:")
     print("  python3 scripts/setup_car_images.py")
 
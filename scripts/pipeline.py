@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Minimal staged producer/consumer pipeline for the asset scripts.
+
+Each Stage runs `func(item) -> item` on its own pool of worker threads and
+hands results to the next stage through a bounded queue, so a slow stage
+applies backpressure instead of letting work pile up in memory. Items that
+raise leave the pipeline early and are reported with the failing stage.
+
+    pipeline = Pipeline([
+        Stage("refs", fetch_ref, workers=4),
+        Stage("generate", generate, workers=2),
+        Stage("post", optimize_and_import, workers=2),
+    ])
+    for item, error, stage in pipeline.run(items):
+        ...
+
+While running, a reporter thread prints queue depth and busy workers per
+stage every `report_interval` seconds; stats() gives per-stage totals at the
+end, which together show where the bottleneck is.
+"""
+
+import time
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline step: `func` applied to each item by `workers` threads."""
+
+    def __init__(self, name: str, func, workers: int = 1, queue_size: int | None = None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+        self._alive = self.workers
+
+
+class Pipeline:
+    """Chain of Stages connected by bounded queues."""
+
+    def __init__(self, stages: list[Stage], report_interval: float = 30):
+        self.stages = stages
+        self.report_interval = report_interval
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        downstream = self.stages[index + 1].inbox if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.inbox.get()
+            if item is _DONE:
+                break
+            if self.stop_event.is_set():
+                # Interrupted: drop queued work, only in-flight items finish
+                continue
+
+            with stage.lock:
+                stage.busy += 1
+            started = time.monotonic()
+            try:
+                result = stage.func(item)
+                error = None
+            except Exception as e:
+                result, error = item, e
+            elapsed = time.monotonic() - started
+            with stage.lock:
+                stage.busy -= 1
+                stage.busy_seconds += elapsed
+                if error is None:
+                    stage.processed += 1
+                else:
+                    stage.failed += 1
+
+            if error is not None:
+                self.results.put((result, error, stage.name))
+            elif downstream is None or self.stop_event.is_set():
+                self.results.put((result, None, None))
+            else:
+                downstream.put(result)
+
+        # Last worker out closes the next stage (or the results stream)
+        with stage.lock:
+            stage._alive -= 1
+            last = stage._alive == 0
+        if last:
+            if downstream is None:
+                self.results.put(_DONE)
+            else:
+                for _ in range(self.stages[index + 1].workers):
+                    downstream.put(_DONE)
+
+    def _feed(self, items):
+        first = self.stages[0]
+        for item in items:
+            if self.stop_event.is_set():
+                break
+            first.inbox.put(item)
+        for _ in range(first.workers):
+            first.inbox.put(_DONE)
+
+    def _report(self):
+        while not self.stop_event.wait(self.report_interval):
+            print(f"  [pipeline] {self.status_line()}", flush=True)
+
+    def status_line(self) -> str:
+        parts = []
+        for stage in self.stages:
+            parts.append(f"{stage.name}: {stage.inbox.qsize()} queued, "
+                         f"{stage.busy}/{stage.workers} busy, {stage.processed} done")
+        return " | ".join(parts)
+
+    def run(self, items):
+        """Feed `items` through every stage. Yields (item, error, failed_stage) as items finish."""
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                t = threading.Thread(target=self._worker, args=(index,), daemon=True)
+                t.start()
+                self.threads.append(t)
+        threading.Thread(target=self._feed, args=(items,), daemon=True).start()
+        if self.report_interval:
+            threading.Thread(target=self._report, daemon=True).start()
+
+        try:
+            while True:
+                entry = self.results.get()
+                if entry is _DONE:
+                    break
+                yield entry
+        finally:
+            self.stop_event.set()
+
+    def stop(self):
+        """Stop feeding new work; items already inside a stage still complete."""
+        self.stop_event.set()
+
+    def join(self):
+        for t in self.threads:
+            t.join()
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "stage": stage.name,
+                "workers": stage.workers,
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "avg_seconds": stage.busy_seconds / max(1, stage.processed + stage.failed),
+                "busy_seconds": stage.busy_seconds,
+            }
+            for stage in self.stages
+        ]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Per-image JPEG settings search against an SSIM target.
+
+optimize_car_images.py encodes every car at JPEG_QUALITY, whether the frame
+is mostly flat charcoal background (which stays clean far lower) or full of
+grille and wheel detail. search() instead finds, per image, the smallest
+file whose SSIM against the resized source meets a target:
+
+1. for each chroma subsampling (4:2:0, 4:4:4), binary-search the lowest
+   quality in [min_quality, max_quality] that reaches the target
+2. keep the smallest result, then pick baseline or progressive — whichever
+   is smaller; neither changes the decoded pixels
+
+SSIM is computed with NumPy on YCbCr (7x7 box windows via an integral
+image), weighted 0.8 luma / 0.1 per chroma channel so subsampling can't
+hide colour damage; the score is the lower of the whole-frame mean and
+the mean over windows with detail, so a flat backdrop that survives any
+quality can't carry a damaged car. Like the reference implementation, both images are
+first box-downsampled by max(1, round(short side / 256)) to approximate
+viewing distance. The reference's window statistics are computed once per
+image; each probe costs one fast encode, one decode and one SSIM pass on
+the small copy, about 6 probes per subsampling. Today's fixed setting
+(max_quality, 4:2:0) is kept when nothing reaching the target is smaller,
+so no output grows.
+
+Usage:
+    from quality_search import search
+    data, params = search(img, target=0.99, max_quality=82)
+    # params: {"quality": 71, "subsampling": "4:2:0", "progressive": True, "ssim": 0.9903}
+
+    python3 scripts/quality_search.py image.jpg --target 0.99   # show the choice
+
+Dependencies: pip3 install Pillow numpy
+"""
+
+import io
+import sys
+import argparse
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+DEFAULT_TARGET = 0.99
+MIN_QUALITY = 50
+WINDOW = 7
+DETAIL_VARIANCE = 4.0  # luma variance above which a window counts as car detail, not backdrop
+CHANNEL_WEIGHTS = (0.8, 0.1, 0.1)  # Y, Cb, Cr
+SUBSAMPLING = {"4:2:0": 2, "4:4:4": 0}  # label -> Pillow's subsampling argument
+
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def available() -> bool:
+    return np is not None
+
+
+# ---------------------------------------------------------------------------
+# SSIM
+# ---------------------------------------------------------------------------
+
+def _box_mean(a):
+    """Mean over every WINDOW x WINDOW window (valid positions only), per channel."""
+    s = np.cumsum(np.cumsum(a, axis=0), axis=1)
+    s = np.pad(s, ((1, 0), (1, 0), (0, 0)))
+    w = WINDOW
+    return (s[w:, w:] - s[:-w, w:] - s[w:, :-w] + s[:-w, :-w]) / (w * w)
+
+
+class Reference:
+    """Window statistics of the image every candidate is compared with."""
+
+    def __init__(self, img: "Image.Image"):
+        self.factor = max(1, round(min(img.size) / 256))
+        self.pixels = self._prepare(img)
+        self.mu = _box_mean(self.pixels)
+        self.var = _box_mean(self.pixels ** 2) - self.mu ** 2
+        self.detail = self.var[:, :, 0] > DETAIL_VARIANCE
+
+    def _prepare(self, img: "Image.Image"):
+        if self.factor > 1:
+            img = img.reduce(self.factor)
+        return np.asarray(img.convert("YCbCr"), dtype=np.float64)
+
+    def ssim(self, candidate: "Image.Image") -> float:
+        b = self._prepare(candidate)
+        mu_b = _box_mean(b)
+        var_b = _box_mean(b * b) - mu_b ** 2
+        cov = _box_mean(self.pixels * b) - self.mu * mu_b
+        ssim_map = ((2 * self.mu * mu_b + _C1) * (2 * cov + _C2)
+                    / ((self.mu ** 2 + mu_b ** 2 + _C1) * (self.var + var_b + _C2)))
+        score = float(np.dot(ssim_map.mean(axis=(0, 1)), CHANNEL_WEIGHTS))
+        # The flat backdrop scores ~1 and would hide damage to the car itself
+        if self.detail.sum() >= 0.01 * self.detail.size:
+            detail = float(np.dot(ssim_map[self.detail].mean(axis=0), CHANNEL_WEIGHTS))
+            score = min(score, detail)
+        return score
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def _encode(img: "Image.Image", quality: int, subsampling: int,
+            progressive: bool = False, optimize: bool = False) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, subsampling=subsampling,
+             progressive=progressive, optimize=optimize)
+    return buf.getvalue()
+
+
+def _probe(ref: Reference, img: "Image.Image", quality: int, subsampling: int) -> tuple[float, int]:
+    data = _encode(img, quality, subsampling)
+    with Image.open(io.BytesIO(data)) as decoded:
+        return ref.ssim(decoded), len(data)
+
+
+def search(img: "Image.Image", target: float = DEFAULT_TARGET, min_quality: int = MIN_QUALITY,
+           max_quality: int = 82) -> tuple[bytes, dict]:
+    """(JPEG bytes, chosen settings) for the smallest encode of `img` with SSIM >= `target`.
+
+    The fixed max_quality 4:2:0 encode (what callers used before) is the
+    fallback, and also wins when it is smaller than every setting that
+    reaches the target.
+    """
+    img = img.convert("RGB")
+    ref = Reference(img)
+    score, size = _probe(ref, img, max_quality, SUBSAMPLING["4:2:0"])
+    fixed = (size, max_quality, "4:2:0", score)
+    best = None  # (size, quality, label, ssim)
+    for label, subsampling in SUBSAMPLING.items():
+        lo, hi = min_quality, max_quality
+        found = None
+        if label == "4:2:0":
+            # The fixed encode is this search's top probe
+            if fixed[3] < target:
+                continue
+            found, hi = fixed, max_quality - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            score, size = _probe(ref, img, mid, subsampling)
+            if score >= target:
+                found = (size, mid, label, score)
+                hi = mid - 1
+            else:
+                lo = mid + 1
+        if found and (best is None or found[0] < best[0]):
+            best = found
+    if best is None or best[0] >= fixed[0]:
+        best = fixed
+
+    _, quality, label, score = best
+    # Huffman optimization and progressive scans change the size, not the pixels
+    candidates = [(_encode(img, quality, SUBSAMPLING[label], progressive, optimize=True), progressive)
+                  for progressive in (False, True)]
+    data, progressive = min(candidates, key=lambda c: len(c[0]))
+    return data, {
+        "quality": quality,
+        "subsampling": label,
+        "progressive": progressive,
+        "ssim": round(score, 5),
+    }
+
+
+def encode_with(img: "Image.Image", params: dict) -> bytes:
+    """Encode `img` with settings search() chose (e.g. for the same image's smaller variants)."""
+    return _encode(img.convert("RGB"), params["quality"], SUBSAMPLING[params["subsampling"]],
+                   params["progressive"], optimize=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the JPEG settings chosen for an SSIM target.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET,
+                        help=f"SSIM target (default {DEFAULT_TARGET})")
+    parser.add_argument("--max-quality", type=int, default=82)
+    args = parser.parse_args()
+
+    if not available():
+        print("Error: Pillow and NumPy are required. pip3 install Pillow numpy")
+        sys.exit(1)
+
+    for path in args.images:
+        with Image.open(path) as src:
+            img = src.convert("RGB")
+        fixed = len(_encode(img, args.max_quality, 2, optimize=True))
+        data, params = search(img, args.target, max_quality=args.max_quality)
+        print(f"  {path}: q{params['quality']} {params['subsampling']}"
+              f"{' progressive' if params['progressive'] else ''}  SSIM {params['ssim']:.4f}  "
+              f"{len(data) // 1024}KB vs {fixed // 1024}KB at q{args.max_quality}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash index of reference photos, to catch near-duplicates before
+paying for a generation.
+
+When CarWale has no model-specific photo the og:image is often a generic or
+shared one (Baleno / Baleno RS, Pajero / Pajero Sport), and restyling it
+produces a copy of another model's image. Each reference gets two 64-bit
+perceptual hashes, computed with NumPy:
+
+  dHash  sign of horizontal gradients on a 9x8 grayscale thumbnail
+  pHash  low-frequency 8x8 block of a 32x32 DCT, thresholded at its median
+
+Hashes live in a BK-tree (Hamming metric) so a lookup touches a handful of
+nodes instead of every reference. A match needs pHash within PHASH_RADIUS
+bits *and* dHash within DHASH_RADIUS bits. Concurrent workers add() their
+references; resolve() then walks the batch in catalog order, so the earliest
+model of a cluster (or one indexed by an earlier run) owns the photo no
+matter which worker finished first. Near-duplicates are recorded with
+duplicate_of=<owner> and the pHash distance, so generate_car_images.py can
+fall back to the text-only prompt (or reuse the owner's output) instead of
+restyling the same photo twice.
+
+The index is persisted (CarImages/references/phash_index.json) and keyed by
+asset name, with hashes cached per SHA-256 of the reference bytes. Without
+Pillow or NumPy the index is disabled and every reference is treated as
+unique.
+
+Usage:
+    python3 scripts/reference_dedupe.py                 # cluster CarImages/references/*
+    python3 scripts/reference_dedupe.py --phash 6 --dhash 8
+
+    from reference_dedupe import ReferenceIndex
+    index = ReferenceIndex()
+    index.add("maruti_suzuki_baleno", ref_bytes)        # from any thread
+    index.add("maruti_suzuki_baleno_rs", ref_bytes_rs)
+    matches = index.resolve(names_in_catalog_order)     # {"maruti_suzuki_baleno_rs": ("maruti_suzuki_baleno", 3)}
+    index.save()
+"""
+
+import io
+import os
+import json
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+# Configuration
+REFERENCES_DIR = Path("/Users/sohail/AutoLedger/CarImages/references")
+INDEX_FILE = REFERENCES_DIR / "phash_index.json"
+INDEX_VERSION = 1
+
+PHASH_RADIUS = 8   # of 64 bits
+DHASH_RADIUS = 10
+
+REFERENCE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def available() -> bool:
+    return np is not None
+
+
+# ---------------------------------------------------------------------------
+# Hashes
+# ---------------------------------------------------------------------------
+
+_dct_matrix = None
+
+
+def _dct(n: int = 32):
+    """Orthonormal DCT-II basis, built once."""
+    global _dct_matrix
+    if _dct_matrix is None:
+        k = np.arange(n)[:, None]
+        x = np.arange(n)[None, :]
+        m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+        m[0] /= np.sqrt(2)
+        _dct_matrix = m
+    return _dct_matrix
+
+
+def _bits_to_int(bits) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def image_hashes(data: bytes) -> tuple[int, int]:
+    """(dhash, phash) of encoded image bytes."""
+    with Image.open(io.BytesIO(data)) as src:
+        src.draft("L", (128, 128))
+        gray = src.convert("L")
+
+    small = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+
+    pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    d = _dct()
+    low = (d @ pixels @ d.T)[:8, :8]
+    # The DC term is overall brightness; leave it out of the median
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+    return dhash, phash
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# ---------------------------------------------------------------------------
+# BK-tree
+# ---------------------------------------------------------------------------
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes; each node holds every item with that hash."""
+
+    def __init__(self):
+        self.root = None  # [hash, items, {distance: child}]
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = distance(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> list[tuple[int, object]]:
+        """(distance, item) for every item within `radius`, nearest first."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = distance(value, node[0])
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_d, child in node[2].items():
+                if d - radius <= child_d <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class ReferenceIndex:
+    """Persisted {asset name: hashes} with a BK-tree on pHash for near-duplicate lookups."""
+
+    def __init__(self, path: Path | None = None, phash_radius: int | None = None,
+                 dhash_radius: int | None = None):
+        self.path = Path(path or INDEX_FILE)
+        self.phash_radius = PHASH_RADIUS if phash_radius is None else phash_radius
+        self.dhash_radius = DHASH_RADIUS if dhash_radius is None else dhash_radius
+        self.entries = {}
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        self.tree = BKTree()
+        for name, entry in self.entries.items():
+            self.tree.add(int(entry["phash"], 16), name)
+
+    def save(self):
+        with self.lock:
+            payload = json.dumps({"version": INDEX_VERSION, "entries": self.entries},
+                                 indent=1, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(payload)
+        os.replace(tmp, self.path)
+
+    def _hashes(self, name: str, data: bytes, sha: str) -> tuple[int, int] | None:
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry and entry["sha256"] == sha:
+            return int(entry["dhash"], 16), int(entry["phash"], 16)
+        try:
+            return image_hashes(data)
+        except OSError:
+            # Undecodable reference — nothing to compare
+            return None
+
+    def _nearest(self, name: str, dhash: int, phash: int,
+                 rank: dict[str, int] | None = None) -> tuple[str, int] | None:
+        """Closest owner other than `name` within both radii, as (owner, phash distance).
+
+        With `rank` (catalog position), only entries ranked before `name` or
+        outside it may own the photo, and ties go to the earliest.
+        """
+        def eligible(other):
+            return rank is None or rank.get(other, -1) < rank[name]
+
+        candidates = []
+        for _, other in self.tree.search(phash, self.phash_radius):
+            entry = self.entries.get(other)
+            if other == name or entry is None or not eligible(other):
+                continue
+            # The tree never drops nodes; measure against the entry's current hash
+            d = distance(int(entry["phash"], 16), phash)
+            if d > self.phash_radius or distance(int(entry["dhash"], 16), dhash) > self.dhash_radius:
+                continue
+            candidates.append((d, (rank or {}).get(other, -1), other))
+        if not candidates:
+            return None
+        d, _, other = min(candidates)
+        owner = self.entries[other].get("duplicate_of") or other
+        if owner == name or owner not in self.entries or not eligible(owner):
+            owner = other
+        return owner, d
+
+    def add(self, name: str, source) -> bool:
+        """Record `name`'s reference (bytes or a path) without deciding ownership. Thread-safe.
+
+        Returns False if it couldn't be hashed.
+        """
+        if not available():
+            return False
+        data = Path(source).read_bytes() if isinstance(source, (str, os.PathLike)) else bytes(source)
+        sha = hashlib.sha256(data).hexdigest()
+        hashes = self._hashes(name, data, sha)
+        if hashes is None:
+            return False
+        dhash, phash = hashes
+        with self.lock:
+            previous = self.entries.get(name)
+            self.entries[name] = {
+                "sha256": sha,
+                "dhash": f"{dhash:016x}",
+                "phash": f"{phash:016x}",
+                "duplicate_of": None,
+                "distance": None,
+            }
+            if previous is None or int(previous["phash"], 16) != phash:
+                self.tree.add(phash, name)
+        return True
+
+    def resolve(self, names: list[str]) -> dict[str, tuple[str, int]]:
+        """Decide ownership for `names`, in that order. Returns {near-duplicate: (owner, pHash distance)}.
+
+        A name can only be owned by one listed before it or by an entry outside
+        `names` (indexed on an earlier run), so the result doesn't depend on the
+        order the references were added in.
+        """
+        rank = {name: i for i, name in enumerate(names)}
+        matches = {}
+        with self.lock:
+            for name in names:
+                entry = self.entries.get(name)
+                if entry is None:
+                    continue
+                match = self._nearest(name, int(entry["dhash"], 16), int(entry["phash"], 16), rank)
+                entry["duplicate_of"], entry["distance"] = match if match else (None, None)
+                if match:
+                    matches[name] = match
+        return matches
+
+    def duplicates(self) -> dict[str, list[str]]:
+        """{owner: [near-duplicate names]} for every owner with at least one duplicate."""
+        clusters = {}
+        with self.lock:
+            for name, entry in sorted(self.entries.items()):
+                if entry.get("duplicate_of"):
+                    clusters.setdefault(entry["duplicate_of"], []).append(name)
+        return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate reference photos.")
+    parser.add_argument("--dir", type=Path, default=None,
+                        help="reference directory (default CarImages/references)")
+    parser.add_argument("--phash", type=int, default=PHASH_RADIUS,
+                        help=f"max pHash distance in bits (default {PHASH_RADIUS})")
+    parser.add_argument("--dhash", type=int, default=DHASH_RADIUS,
+                        help=f"max dHash distance in bits (default {DHASH_RADIUS})")
+    args = parser.parse_args()
+
+    if not available():
+        print("Error: Pillow and NumPy are required. pip3 install Pillow numpy")
+        exit(1)
+
+    ref_dir = args.dir or REFERENCES_DIR
+    index = ReferenceIndex(phash_radius=args.phash, dhash_radius=args.dhash)
+    refs = sorted(p for p in ref_dir.iterdir()
+                  if p.is_file() and p.suffix.lower() in REFERENCE_SUFFIXES)
+    for path in refs:
+        index.add(path.stem, path)
+    index.resolve([path.stem for path in refs])
+    index.save()
+
+    clusters = index.duplicates()
+    print(f"References: {len(refs)} in {ref_dir}")
+    print(f"Near-duplicate groups: {len(clusters)} "
+          f"({sum(len(v) for v in clusters.values())} models would reuse another's photo)")
+    for owner, names in clusters.items():
+        print(f"  {owner}")
+        for name in names:
+            print(f"    ~ {name}  (pHash distance {index.entries[name]['distance']})")
+
+
+if __name__ == "__main__":
+    main()
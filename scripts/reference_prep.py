@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Reference image preprocessing before upload to /v1/images/edits.
+
+CarWale og:images and user-supplied references used to be uploaded as they
+came (a JPEG labelled image/png) or re-encoded as full-resolution lossless
+PNGs. prepare_reference() instead:
+
+1. decodes the source once (EXIF orientation applied, alpha flattened on white)
+2. crops to the car: the bounding box of pixels that differ from the border
+   colour, plus a margin — skipped when the background isn't uniform enough
+   for the box to be trustworthy
+3. downscales so the short side is at most REF_SHORT_SIDE — the edit
+   endpoint works from a ~768px-short-side view of the input, so larger
+   uploads only cost bytes and latency
+4. encodes a JPEG (REF_JPEG_QUALITY) — or keeps the original bytes if they
+   are already smaller and in a format the edit endpoint takes (PNG, JPEG,
+   WebP) — and returns its path, whose extension gives the upload its real
+   MIME type
+
+Results are cached under CarImages/references/.normalized/ keyed by the
+SHA-256 of the source bytes and PREP_VERSION, so each reference is
+processed once. Without Pillow the original bytes are cached and uploaded
+with their real MIME type; a reference in any other format (AVIF, HEIC...)
+that can't be converted raises ValueError rather than going up mislabelled.
+
+Usage:
+    from reference_prep import prepare_reference
+    ref_path = prepare_reference(ref_bytes_or_path)
+
+    python3 scripts/reference_prep.py <image> [<image> ...]   # show savings
+"""
+
+import io
+import os
+import sys
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:
+    Image = None
+
+import image_source
+
+# Configuration
+CACHE_DIR = Path("/Users/sohail/AutoLedger/CarImages/references/.normalized")
+PREP_VERSION = 1  # bump when the steps below change, to invalidate the cache
+
+REF_SHORT_SIDE = 768
+REF_JPEG_QUALITY = 88
+CROP_MARGIN = 0.06       # fraction of the box added on each side
+CROP_THRESHOLD = 28      # per-channel difference from the border colour that counts as "car"
+CROP_MIN_AREA = 0.15     # a smaller box is probably noise — keep the full frame
+CROP_MAX_AREA = 0.92     # a box this large isn't worth a crop
+BORDER_TOLERANCE = 24    # border pixels within this of the median count as background
+BORDER_MIN_SHARE = 0.8   # share of the border that must be background to trust it
+
+
+def sniff_extension(data: bytes) -> str | None:
+    """File extension for PNG, JPEG or WebP bytes, from their magic number; None for anything else."""
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Image steps
+# ---------------------------------------------------------------------------
+
+def flatten(img: "Image.Image") -> "Image.Image":
+    """RGB on a white background, with EXIF orientation applied."""
+    return image_source.flatten(ImageOps.exif_transpose(img), background=(255, 255, 255))
+
+
+def car_bbox(img: "Image.Image") -> tuple[int, int, int, int] | None:
+    """Bounding box of the subject against a uniform background, or None to keep the frame."""
+    # Work on a small copy; the box is scaled back up
+    small = img.copy()
+    small.thumbnail((256, 256))
+    w, h = small.size
+
+    border = [small.getpixel((x, y)) for x in range(w) for y in (0, h - 1)]
+    border += [small.getpixel((x, y)) for y in range(h) for x in (0, w - 1)]
+    bg_color = tuple(sorted(c)[len(c) // 2] for c in zip(*border))
+    matching = sum(1 for p in border if max(abs(a - b) for a, b in zip(p, bg_color)) <= BORDER_TOLERANCE)
+    if matching < BORDER_MIN_SHARE * len(border):
+        return None
+
+    diff = ImageChops.difference(small, Image.new("RGB", small.size, bg_color)).convert("L")
+    box = diff.point(lambda v: 255 if v > CROP_THRESHOLD else 0).getbbox()
+    if box is None:
+        return None
+    area = (box[2] - box[0]) * (box[3] - box[1]) / (w * h)
+    if not CROP_MIN_AREA <= area <= CROP_MAX_AREA:
+        return None
+
+    sx, sy = img.width / w, img.height / h
+    mx, my = (box[2] - box[0]) * CROP_MARGIN, (box[3] - box[1]) * CROP_MARGIN
+    return (
+        max(0, int((box[0] - mx) * sx)),
+        max(0, int((box[1] - my) * sy)),
+        min(img.width, int((box[2] + mx) * sx + 1)),
+        min(img.height, int((box[3] + my) * sy + 1)),
+    )
+
+
+def normalize(data: bytes) -> bytes:
+    """Decode, crop, downscale and JPEG-encode one reference."""
+    with Image.open(io.BytesIO(data)) as src:
+        src.draft("RGB", (REF_SHORT_SIDE * 2, REF_SHORT_SIDE * 2))
+        img = flatten(src)
+
+    box = car_bbox(img)
+    if box:
+        img = img.crop(box)
+
+    scale = REF_SHORT_SIDE / min(img.size)
+    if scale < 1:
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=REF_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Cached entry point
+# ---------------------------------------------------------------------------
+
+def prepare_reference(source) -> Path:
+    """Normalized copy of `source` (bytes or a path), cached by content hash. Returns its path."""
+    data = Path(source).read_bytes() if isinstance(source, (str, os.PathLike)) else bytes(source)
+    key = hashlib.sha256(data + f"|v{PREP_VERSION}".encode()).hexdigest()
+
+    for ext in (".jpg", ".png", ".webp"):
+        cached = CACHE_DIR / f"{key}{ext}"
+        if cached.exists():
+            return cached
+
+    # The original is only an option in a format the edit endpoint accepts
+    out = data if sniff_extension(data) else None
+    if Image is not None:
+        try:
+            normalized = normalize(data)
+            if out is None or len(normalized) < len(out):
+                out = normalized
+        except OSError:
+            # Undecodable (truncated download?) — let the API judge the original
+            pass
+    if out is None:
+        raise ValueError("unsupported reference image format (not PNG, JPEG or WebP)"
+                         + ("" if Image is not None else "; pip3 install Pillow to convert it"))
+    cached = CACHE_DIR / f"{key}{sniff_extension(out)}"
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Per thread: concurrent ref workers can normalize identical downloads to the same file
+    tmp = cached.with_name(f".{cached.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(out)
+    os.replace(tmp, cached)
+    return cached
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 scripts/reference_prep.py <image> [<image> ...]")
+        return
+    for arg in sys.argv[1:]:
+        src = Path(arg)
+        out = prepare_reference(src)
+        before, after = src.stat().st_size, out.stat().st_size
+        print(f"  {src.name}: {before // 1024}KB -> {after // 1024}KB "
+              f"({(1 - after / before) * 100:.0f}% smaller)  {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
-"""Generate a single car image from a reference."""
+"""Generate a single car image from a reference.
 
-import os, sys, json, base64, uuid, io, urllib.request
+Usage:
+    python3 scripts/regen_single.py <ref image> <output.png> [ref2 out2 ...]
+"""
+
+import os
+import argparse
 from pathlib import Path
-from PIL import Image
+
+from batch_runner import Job, add_runner_arguments, run_batch
 
 API_KEY = os.environ.get("OPENAI_API_KEY")
 
@@ -25,47 +31,27 @@ RESTYLE_PROMPT = (
     "No text, no watermarks, no labels."
 )
 
-def generate(ref_path, out_path):
-    with Image.open(ref_path) as img:
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        buf = io.BytesIO()
-        img.save(buf, "PNG")
-        ref_data = buf.getvalue()
-
-    boundary = uuid.uuid4().hex
-    lines = []
-    for key, val in {"model": "gpt-image-1", "prompt": RESTYLE_PROMPT, "n": "1", "size": "1536x1024"}.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(f'Content-Disposition: form-data; name="{key}"'.encode())
-        lines.append(b"")
-        lines.append(val.encode())
-    lines.append(f"--{boundary}".encode())
-    lines.append(b'Content-Disposition: form-data; name="image"; filename="reference.png"')
-    lines.append(b"Content-Type: image/png")
-    lines.append(b"")
-    lines.append(ref_data)
-    lines.append(f"--{boundary}--".encode())
-    lines.append(b"")
-    body = b"\r\n".join(lines)
 
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/edits",
-        data=body,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": f"multipart/form-data; boundary={boundary}",
-        },
+def single_job(ref_path: Path, out_path: Path, prompt: str = RESTYLE_PROMPT) -> Job:
+    return Job(
+        out_path.stem,
+        f"Generating {out_path.name}",
+        out_path,
+        prompt,
+        reference=ref_path,
     )
 
-    print(f"Generating {out_path.name}...", end=" ", flush=True)
-    with urllib.request.urlopen(req, timeout=300) as resp:
-        result = json.loads(resp.read())
-        img_data = base64.b64decode(result["data"][0]["b64_json"])
-        out_path.write_bytes(img_data)
-        print("OK")
 
 if __name__ == "__main__":
-    ref = Path(sys.argv[1])
-    out = Path(sys.argv[2])
-    generate(ref, out)
+    parser = argparse.ArgumentParser(description="Generate car images from reference/output pairs.")
+    parser.add_argument("pairs", nargs="+", type=Path, metavar="REF OUT")
+    add_runner_arguments(parser, store=False)
+    args = parser.parse_args()
+    if len(args.pairs) % 2:
+        parser.error("expected reference/output pairs")
+    if not API_KEY:
+        print("Error: Set OPENAI_API_KEY environment variable")
+        exit(1)
+
+    pairs = zip(args.pairs[::2], args.pairs[1::2])
+    run_batch([single_job(ref, out) for ref, out in pairs], args)
@@ -1,22 +1,16 @@
 #!/usr/bin/env python3
 """Regenerate Mahindra Thar ROXX (5-door) with specific prompt."""
 
-import os, json, base64, uuid, io, urllib.request
+import os
+import argparse
 from pathlib import Path
-from PIL import Image
+
+from batch_runner import Job, add_runner_arguments, run_batch
 
 API_KEY = os.environ.get("OPENAI_API_KEY")
 ref_path = Path("/Users/sohail/AutoLedger/CarImages/regenerate_refs/Mahindra Thar Roxx.webp")
 out_path = Path("/Users/sohail/AutoLedger/CarImages/mahindra_thar_roxx.png")
 
-# Convert ref to PNG
-with Image.open(ref_path) as img:
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-    buf = io.BytesIO()
-    img.save(buf, "PNG")
-    ref_data = buf.getvalue()
-
 prompt = (
     "Recreate this exact Mahindra Thar ROXX (not the regular Thar) accurately, front three-quarter view. "
     "The Thar ROXX is a 5-door SUV with a longer wheelbase than the regular 3-door Thar. "
@@ -30,34 +24,18 @@ prompt = (
     "No text, no watermarks, no labels. Professional automotive photography, photorealistic."
 )
 
-boundary = uuid.uuid4().hex
-lines = []
-for key, val in {"model": "gpt-image-1", "prompt": prompt, "n": "1", "size": "1536x1024"}.items():
-    lines.append(f"--{boundary}".encode())
-    lines.append(f'Content-Disposition: form-data; name="{key}"'.encode())
-    lines.append(b"")
-    lines.append(val.encode())
-lines.append(f"--{boundary}".encode())
-lines.append(b'Content-Disposition: form-data; name="image"; filename="reference.png"')
-lines.append(b"Content-Type: image/png")
-lines.append(b"")
-lines.append(ref_data)
-lines.append(f"--{boundary}--".encode())
-lines.append(b"")
-body = b"\r\n".join(lines)
+parser = argparse.ArgumentParser(description=__doc__)
+add_runner_arguments(parser, store=False)
+args = parser.parse_args()
+if not API_KEY:
+    print("Error: Set OPENAI_API_KEY environment variable")
+    exit(1)
 
-req = urllib.request.Request(
-    "https://api.openai.com/v1/images/edits",
-    data=body,
-    headers={
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": f"multipart/form-data; boundary={boundary}",
-    },
+job = Job(
+    out_path.stem,
+    "Generating Mahindra Thar ROXX (5-door)",
+    out_path,
+    prompt,
+    reference=ref_path,
 )
-
-print("Generating Mahindra Thar ROXX (5-door)...", end=" ", flush=True)
-with urllib.request.urlopen(req, timeout=300) as resp:
-    result = json.loads(resp.read())
-    img_data = base64.b64decode(result["data"][0]["b64_json"])
-    out_path.write_bytes(img_data)
-    print("OK")
+run_batch([job], args)
@@ -1,34 +1,33 @@
 #!/usr/bin/env python3
 """
 Regenerate car images using user-provided reference images.
-Reads references from CarImages/regenerate_refs/, converts to PNG,
-and uses gpt-image-1 to restyle each one.
+Reads references from CarImages/regenerate_refs/, normalizes them for upload
+(reference_prep.py) and uses gpt-image-1 to restyle each one.
 
 Special case: Range Rover Velar — remove text from bonnet using existing image.
+
+Jobs run concurrently on the shared batch runner (batch_runner.py).
+
+Usage:
+    python3 scripts/regenerate_from_refs.py [--workers 4 --rpm 12 --ipm 12] [--redo]
 """
 
 import os
-import json
-import time
-import base64
-import uuid
-import urllib.request
-import urllib.error
+import argparse
+import importlib.util
 from pathlib import Path
 
-try:
-    from PIL import Image
-except ImportError:
+# reference_prep needs Pillow to decode avif/webp refs
+if importlib.util.find_spec("PIL") is None:
     print("Error: Pillow required. pip3 install Pillow")
     exit(1)
 
+from batch_runner import Job, add_runner_arguments, run_batch
+
 API_KEY = os.environ.get("OPENAI_API_KEY")
 OUTPUT_DIR = Path("/Users/sohail/AutoLedger/CarImages")
 REF_DIR = OUTPUT_DIR / "regenerate_refs"
 
-REQUEST_DELAY = 15
-MAX_RETRIES = 3
-
 RESTYLE_PROMPT = (
     "Recreate this exact car model accurately, front three-quarter view. "
     "The car must be painted in glossy black color. "
@@ -90,96 +89,43 @@ FILENAME_MAP = {
 }
 
 
-def convert_to_png(src: Path) -> bytes:
-    """Convert any image format (avif, webp, jpg, png) to PNG bytes."""
-    with Image.open(src) as img:
-        if img.mode in ("RGBA", "P"):
-            bg = Image.new("RGB", img.size, (255, 255, 255))
-            if img.mode == "P":
-                img = img.convert("RGBA")
-            bg.paste(img, mask=img.split()[3])
-            img = bg
-        elif img.mode != "RGB":
-            img = img.convert("RGB")
-
-        import io
-        buf = io.BytesIO()
-        img.save(buf, "PNG")
-        return buf.getvalue()
-
-
-def build_multipart(fields: dict, files: dict) -> tuple[bytes, str]:
-    boundary = uuid.uuid4().hex
-    lines = []
-    for key, val in fields.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(f'Content-Disposition: form-data; name="{key}"'.encode())
-        lines.append(b"")
-        lines.append(val.encode() if isinstance(val, str) else val)
-    for key, (filename, data, content_type) in files.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(
-            f'Content-Disposition: form-data; name="{key}"; filename="{filename}"'.encode()
-        )
-        lines.append(f"Content-Type: {content_type}".encode())
-        lines.append(b"")
-        lines.append(data)
-    lines.append(f"--{boundary}--".encode())
-    lines.append(b"")
-    return b"\r\n".join(lines), boundary
-
-
-def generate_with_reference(ref_data: bytes, prompt: str) -> bytes:
-    body, boundary = build_multipart(
-        fields={
-            "model": "gpt-image-1",
-            "prompt": prompt,
-            "n": "1",
-            "size": "1536x1024",
-        },
-        files={
-            "image": ("reference.png", ref_data, "image/png"),
-        },
-    )
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/edits",
-        data=body,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": f"multipart/form-data; boundary={boundary}",
-        },
+def reference_jobs(ref_files: list[Path]) -> tuple[list[Job], list[str]]:
+    """Jobs for every mapped reference in regenerate_refs/, plus the unmapped stems."""
+    jobs = []
+    unmapped = []
+    for ref_file in ref_files:
+        stem = ref_file.stem  # e.g. "BMW 6 Series"
+        asset_name = FILENAME_MAP.get(stem)
+        if not asset_name:
+            unmapped.append(stem)
+            continue
+        jobs.append(Job(
+            asset_name,
+            f"{stem} -> {asset_name}.png",
+            OUTPUT_DIR / f"{asset_name}.png",
+            RESTYLE_PROMPT,
+            reference=ref_file,
+        ))
+    return jobs, unmapped
+
+
+def velar_job(velar_src: Path) -> Job:
+    """Bonnet text removal: the reference is a normalized copy of the existing file it replaces."""
+    return Job(
+        velar_src.stem,
+        "Range Rover Velar (remove bonnet text)",
+        velar_src,
+        VELAR_PROMPT,
+        reference=velar_src,
+        method="velar",
     )
-    with urllib.request.urlopen(req, timeout=300) as response:
-        result = json.loads(response.read())
-        b64_data = result["data"][0]["b64_json"]
-        return base64.b64decode(b64_data)
-
-
-def generate_with_retry(ref_data: bytes, prompt: str) -> bytes:
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            return generate_with_reference(ref_data, prompt)
-        except urllib.error.HTTPError as e:
-            if e.code == 429 and attempt < MAX_RETRIES:
-                wait = REQUEST_DELAY * (2 ** (attempt - 1))
-                print(f"\n  Rate limited, waiting {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            elif attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  HTTP {e.code}, retrying in {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
-        except Exception:
-            if attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  Error, retrying in {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Regenerate car images from user-provided references.")
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+
     if not API_KEY:
         print("Error: Set OPENAI_API_KEY environment variable")
         return
@@ -195,56 +141,21 @@ def main():
 
     total = len(ref_files) + (1 if has_velar else 0)
     print(f"Found {len(ref_files)} reference images + {'1 Velar fix' if has_velar else 'no Velar'}")
-    print(f"Total to regenerate: {total}")
-    print(f"Estimated cost: ${total * 0.04:.2f}")
-    print(f"Estimated time: ~{total * REQUEST_DELAY // 60} minutes")
-    print()
-
-    generated = 0
-    failed = 0
-    idx = 0
-
-    for ref_file in ref_files:
-        idx += 1
-        stem = ref_file.stem  # e.g. "BMW 6 Series"
-
-        asset_name = FILENAME_MAP.get(stem)
-        if not asset_name:
-            print(f"[{idx}/{total}] {stem} — SKIPPED (no mapping found)")
-            failed += 1
-            continue
-
-        output_path = OUTPUT_DIR / f"{asset_name}.png"
-        print(f"[{idx}/{total}] {stem} -> {asset_name}.png...", end=" ", flush=True)
-
-        try:
-            ref_data = convert_to_png(ref_file)
-            image_data = generate_with_retry(ref_data, RESTYLE_PROMPT)
-            output_path.write_bytes(image_data)
-            print("OK")
-            generated += 1
-            time.sleep(REQUEST_DELAY)
-        except Exception as e:
-            print(f"FAILED: {e}")
-            failed += 1
-
-    # Special case: Velar text removal
+    jobs, unmapped = reference_jobs(ref_files)
+    for stem in unmapped:
+        print(f"  {stem} — SKIPPED (no mapping found)")
     if has_velar:
-        idx += 1
-        print(f"[{idx}/{total}] Range Rover Velar (remove bonnet text)...", end=" ", flush=True)
-        try:
-            ref_data = velar_src.read_bytes()
-            image_data = generate_with_retry(ref_data, VELAR_PROMPT)
-            velar_src.write_bytes(image_data)
-            print("OK")
-            generated += 1
-        except Exception as e:
-            print(f"FAILED: {e}")
-            failed += 1
+        jobs.append(velar_job(velar_src))
+
+    summary = run_batch(jobs, args, batch="refs")
+    generated, skipped = summary["generated"], summary["skipped"]
+    failed = summary["failed"] + len(unmapped)
 
     print()
     print("-" * 50)
     print(f"Regenerated: {generated}/{total}")
+    if skipped:
+        print(f"Skipped: {skipped} (already done, use --redo to regenerate)")
     print(f"Failed: {failed}")
     print()
     print("Next steps:")
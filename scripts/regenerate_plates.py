@@ -1,22 +1,24 @@
 #!/usr/bin/env python3
 """
 Re-generate only images that have visible number plates.
-Reads filenames from CarImages/has_plates/, deletes the originals,
-and regenerates them using the same pipeline as generate_car_images.py.
+Reads filenames from CarImages/has_plates/ and regenerates them with the
+shared batch runner (batch_runner.py). Outputs are replaced atomically when a
+new image arrives; the has_plates/ copy is restored if one is missing.
+
+Usage:
+    python3 scripts/regenerate_plates.py [--workers 4 --rpm 12 --ipm 12] [--redo]
 """
 
 import os
-import sys
 import json
-import time
-import base64
-import uuid
-import re
-import html as htmlmod
-import urllib.request
-import urllib.error
+import shutil
+import argparse
 from pathlib import Path
 
+from batch_runner import Job, add_runner_arguments, run_batch
+from carwale_refs import fetch_reference_image
+from reference_prep import sniff_extension
+
 # Configuration
 API_KEY = os.environ.get("OPENAI_API_KEY")
 OUTPUT_DIR = Path("/Users/sohail/AutoLedger/CarImages")
@@ -24,9 +26,6 @@ REF_DIR = OUTPUT_DIR / "references"
 HAS_PLATES_DIR = OUTPUT_DIR / "has_plates"
 DATA_FILE = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/IndianVehicleData.json")
 
-REQUEST_DELAY = 15
-MAX_RETRIES = 3
-
 RESTYLE_PROMPT = (
     "Recreate this exact car model accurately, front three-quarter view. "
     "The car must be painted in glossy black color. "
@@ -65,138 +64,33 @@ def safe_name(make: str, model: str) -> str:
     return f"{safe_make}_{safe_model}"
 
 
-def carwale_slug(make: str, model: str) -> str:
-    make_s = make.lower().replace(" ", "-")
-    model_s = model.lower().replace(" ", "-")
-    return f"{make_s}-cars/{model_s}"
-
-
-def fetch_reference_image(make: str, model: str) -> bytes | None:
-    slug = carwale_slug(make, model)
-    page_url = f"https://www.carwale.com/{slug}/"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120"
-    }
-    try:
-        req = urllib.request.Request(page_url, headers=headers)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            page_html = resp.read().decode("utf-8", errors="ignore")
-        match = re.search(r'og:image.*?content="([^"]+)"', page_html)
-        if not match:
+def reference_loader(make: str, model: str, refresh_refs: bool = False):
+    """Return a callable that fetches the CarWale reference on the runner's refs stage."""
+    def load() -> Path | None:
+        ref_data = fetch_reference_image(make, model, refresh=refresh_refs)
+        if not ref_data:
             return None
-        img_url = htmlmod.unescape(match.group(1))
-        img_url = img_url.replace("642x336", "1056x594")
-        req = urllib.request.Request(img_url, headers=headers)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return resp.read()
-    except Exception:
-        return None
-
-
-def build_multipart(fields: dict, files: dict) -> tuple[bytes, str]:
-    boundary = uuid.uuid4().hex
-    lines = []
-    for key, val in fields.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(f'Content-Disposition: form-data; name="{key}"'.encode())
-        lines.append(b"")
-        lines.append(val.encode() if isinstance(val, str) else val)
-    for key, (filename, data, content_type) in files.items():
-        lines.append(f"--{boundary}".encode())
-        lines.append(
-            f'Content-Disposition: form-data; name="{key}"; filename="{filename}"'.encode()
-        )
-        lines.append(f"Content-Type: {content_type}".encode())
-        lines.append(b"")
-        lines.append(data)
-    lines.append(f"--{boundary}--".encode())
-    lines.append(b"")
-    return b"\r\n".join(lines), boundary
-
-
-def generate_with_reference(ref_data: bytes) -> bytes:
-    body, boundary = build_multipart(
-        fields={
-            "model": "gpt-image-1",
-            "prompt": RESTYLE_PROMPT,
-            "n": "1",
-            "size": "1536x1024",
-        },
-        files={
-            "image": ("reference.png", ref_data, "image/png"),
-        },
-    )
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/edits",
-        data=body,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": f"multipart/form-data; boundary={boundary}",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=300) as response:
-        result = json.loads(response.read())
-        b64_data = result["data"][0]["b64_json"]
-        return base64.b64decode(b64_data)
+        REF_DIR.mkdir(exist_ok=True)
+        ref_path = REF_DIR / f"{safe_name(make, model)}{sniff_extension(ref_data) or '.img'}"
+        ref_path.write_bytes(ref_data)
+        return ref_path
+    return load
 
 
-def generate_text_only(make: str, model: str, year: int = 2026) -> bytes:
-    prompt = FALLBACK_PROMPT_TEMPLATE.format(year=year, make=make, model=model)
-    data = json.dumps({
-        "model": "gpt-image-1",
-        "prompt": prompt,
-        "n": 1,
-        "size": "1536x1024",
-    }).encode()
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/images/generations",
-        data=data,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=300) as response:
-        result = json.loads(response.read())
-        b64_data = result["data"][0]["b64_json"]
-        return base64.b64decode(b64_data)
-
-
-def generate_with_retry(make: str, model: str) -> tuple[bytes, str]:
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            ref_data = fetch_reference_image(make, model)
-            if ref_data:
-                REF_DIR.mkdir(exist_ok=True)
-                name = safe_name(make, model)
-                (REF_DIR / f"{name}.png").write_bytes(ref_data)
-                image_data = generate_with_reference(ref_data)
-                return image_data, "ref"
-            else:
-                image_data = generate_text_only(make, model)
-                return image_data, "text"
-        except urllib.error.HTTPError as e:
-            if e.code == 429 and attempt < MAX_RETRIES:
-                wait = REQUEST_DELAY * (2 ** (attempt - 1))
-                print(f"\n  Rate limited, waiting {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            elif attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  HTTP {e.code}, retrying in {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
-        except Exception:
-            if attempt < MAX_RETRIES:
-                wait = 5 * attempt
-                print(f"\n  Error, retrying in {wait}s...", end=" ", flush=True)
-                time.sleep(wait)
-            else:
-                raise
+def restore_backup(job: Job):
+    """Put the old image back from has_plates/ if generation failed."""
+    backup = HAS_PLATES_DIR / job.out_path.name
+    if backup.exists() and not job.out_path.exists():
+        shutil.copy2(backup, job.out_path)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Re-generate images with visible number plates.")
+    parser.add_argument("--refresh-refs", action="store_true",
+                        help="ignore the reference cache and refetch from CarWale")
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+
     if not API_KEY:
         print("Error: Set OPENAI_API_KEY environment variable")
         return
@@ -218,46 +112,32 @@ def main():
         return
 
     print(f"Found {len(plate_files)} images with number plates to regenerate")
-    print(f"Estimated cost: ${len(plate_files) * 0.04:.2f}")
-    print(f"Estimated time: ~{len(plate_files) * REQUEST_DELAY // 60} minutes")
-    print()
-
-    generated = 0
-    failed = 0
 
-    for i, filename in enumerate(plate_files, 1):
+    jobs = []
+    for filename in plate_files:
         name = filename.replace(".png", "")
         if name not in name_to_make_model:
-            print(f"[{i}/{len(plate_files)}] {filename} — SKIPPED (not in vehicle data)")
+            print(f"  {filename} — SKIPPED (not in vehicle data)")
             continue
-
         make_name, model_name = name_to_make_model[name]
-
-        # Delete old original so it gets replaced
-        old_path = OUTPUT_DIR / filename
-        if old_path.exists():
-            old_path.unlink()
-
-        print(f"[{i}/{len(plate_files)}] {make_name} {model_name}...", end=" ", flush=True)
-
-        try:
-            image_data, method = generate_with_retry(make_name, model_name)
-            (OUTPUT_DIR / filename).write_bytes(image_data)
-            print(f"OK ({method})")
-            generated += 1
-            time.sleep(REQUEST_DELAY)
-        except Exception as e:
-            print(f"FAILED: {e}")
-            failed += 1
-            # Restore old image from has_plates
-            old_backup = HAS_PLATES_DIR / filename
-            if old_backup.exists():
-                import shutil
-                shutil.copy2(old_backup, OUTPUT_DIR / filename)
+        jobs.append(Job(
+            name,
+            f"{make_name} {model_name}",
+            OUTPUT_DIR / filename,
+            RESTYLE_PROMPT,
+            reference=reference_loader(make_name, model_name, args.refresh_refs),
+            fallback_prompt=FALLBACK_PROMPT_TEMPLATE.format(year=2026, make=make_name, model=model_name),
+            on_failure=restore_backup,
+        ))
+
+    summary = run_batch(jobs, args, batch="plates")
+    generated, skipped, failed = summary["generated"], summary["skipped"], summary["failed"]
 
     print()
     print("-" * 50)
     print(f"Regenerated: {generated}/{len(plate_files)}")
+    if skipped:
+        print(f"Skipped: {skipped} (already done, use --redo to regenerate)")
     print(f"Failed: {failed}")
     print()
     print("Next steps:")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of gpt-image-1 results.
+
+The same request — reference bytes, prompt, model, size, output format —
+used to cost a new API call every time: on retries after a partial run,
+after an output was deleted by accident, or when regenerate_plates.py
+restored has_plates/ copies and ran again. Results are now kept under
+CarImages/.results/:
+
+  objects/ab/<sha256>.png   each distinct output once, named by its content hash
+  index.sqlite3             request key -> object, with label, size, hits,
+                            last use and a pinned flag
+
+The request key is the SHA-256 of the prompt, the reference's SHA-256 and
+the model/size/format the call would use, so a hit is exactly the request
+that would otherwise be sent again; it is served by a local file copy.
+The cache is capped at MAX_CACHE_BYTES: the least recently used unpinned
+results are evicted first. Pinning a known-good output keeps every request
+that produced it out of eviction.
+
+Usage:
+    python3 scripts/result_cache.py status
+    python3 scripts/result_cache.py list [--pinned]
+    python3 scripts/result_cache.py pin CarImages/tata_nexon.png [...]
+    python3 scripts/result_cache.py unpin CarImages/tata_nexon.png [...]
+    python3 scripts/result_cache.py evict [--max-mb 500]
+
+    from result_cache import ResultCache, result_key
+    key = result_key(prompt, ref_path)
+    if not cache.fetch(key, out_path):
+        images_edit(ref_path, prompt, out_path)
+        cache.store(key, out_path, label="tata_nexon")
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+import openai_images
+
+# Configuration
+CACHE_DIR = Path("/Users/sohail/AutoLedger/CarImages/.results")
+MAX_CACHE_BYTES = 2 * 1024 * 1024 * 1024  # ~650 gpt-image-1 PNGs
+OUTPUT_FORMAT = "png"  # what gpt-image-1 returns unless asked otherwise
+
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key         TEXT PRIMARY KEY,
+    object      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    label       TEXT,
+    model       TEXT,
+    image_size  TEXT,
+    created_at  REAL NOT NULL,
+    last_used   REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    pinned      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_object ON results (object);
+CREATE INDEX IF NOT EXISTS results_lru ON results (pinned, last_used);
+"""
+
+
+def sha256_of(source) -> str:
+    """SHA-256 of bytes or of a file's contents."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            while chunk := f.read(HASH_CHUNK):
+                digest.update(chunk)
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def result_key(prompt: str, reference=None) -> str:
+    """Cache key for one image request; `reference` is the uploaded image (bytes or path) or None."""
+    parts = [
+        openai_images.IMAGE_MODEL,
+        openai_images.IMAGE_SIZE,
+        OUTPUT_FORMAT,
+        sha256_of(reference) if reference is not None else "",
+        prompt,
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class ResultCache:
+    """Request key -> stored image, with an LRU size cap. Safe to share across worker threads."""
+
+    def __init__(self, path: Path | None = None, max_bytes: int | None = None):
+        self.dir = Path(path or CACHE_DIR)
+        self.max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.dir / "index.sqlite3", check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.dir / "objects" / digest[:2] / f"{digest}.{OUTPUT_FORMAT}"
+
+    # -- lookups ------------------------------------------------------------
+
+    def fetch(self, key: str, out_path: Path) -> bool:
+        """Copy the cached result for `key` to `out_path`. Returns False on a miss."""
+        with self.lock:
+            row = self.db.execute("SELECT object FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        source = self._object_path(row[0])
+        out_path = Path(out_path)
+        # A copy, not a link: callers may rewrite outputs in place
+        tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            shutil.copyfile(source, tmp)
+        except FileNotFoundError:
+            with self.lock:
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            return False
+        os.replace(tmp, out_path)
+        with self.lock:
+            self.db.execute("UPDATE results SET hits = hits + 1, last_used = ? WHERE key = ?",
+                            (time.time(), key))
+        return True
+
+    def store(self, key: str, image_path: Path, label: str = ""):
+        """Record `image_path` (a fresh API result) as the answer for `key`, then enforce the cap."""
+        digest = sha256_of(image_path)
+        target = self._object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.part")
+            shutil.copyfile(image_path, tmp)
+            os.replace(tmp, target)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                """INSERT INTO results (key, object, size, label, model, image_size, created_at, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       object = excluded.object, size = excluded.size, label = excluded.label,
+                       created_at = excluded.created_at, last_used = excluded.last_used""",
+                (key, digest, target.stat().st_size, label, openai_images.IMAGE_MODEL,
+                 openai_images.IMAGE_SIZE, now, now),
+            )
+        self.evict()
+
+    # -- maintenance ----------------------------------------------------------
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT object, size FROM results)"
+            ).fetchone()
+        return row[0]
+
+    def evict(self, max_bytes: int | None = None) -> tuple[int, int]:
+        """Drop least recently used unpinned results until under the cap. Returns (results, bytes) freed."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        total = self.total_bytes()
+        removed = freed = 0
+        if total <= limit:
+            return removed, freed
+        with self.lock:
+            candidates = self.db.execute(
+                "SELECT key, object, size FROM results WHERE pinned = 0 ORDER BY last_used"
+            ).fetchall()
+            for key, digest, size in candidates:
+                if total <= limit:
+                    break
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+                removed += 1
+                # Objects are shared by identical outputs; delete once unreferenced
+                if self.db.execute("SELECT 1 FROM results WHERE object = ? LIMIT 1",
+                                   (digest,)).fetchone() is None:
+                    self._object_path(digest).unlink(missing_ok=True)
+                    total -= size
+                    freed += size
+        return removed, freed
+
+    def set_pinned(self, image_path: Path, pinned: bool = True) -> int:
+        """Pin (or unpin) every result whose output is byte-identical to `image_path`. Returns how many."""
+        digest = sha256_of(image_path)
+        with self.lock:
+            cur = self.db.execute("UPDATE results SET pinned = ? WHERE object = ?",
+                                  (int(pinned), digest))
+            return cur.rowcount
+
+    def entries(self, pinned_only: bool = False) -> list[dict]:
+        query = "SELECT key, label, size, hits, pinned, last_used FROM results"
+        if pinned_only:
+            query += " WHERE pinned = 1"
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY last_used DESC").fetchall()
+        return [dict(zip(("key", "label", "size", "hits", "pinned", "last_used"), row))
+                for row in rows]
+
+    def stats(self) -> dict:
+        with self.lock:
+            results, pinned, hits = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pinned), 0), COALESCE(SUM(hits), 0) FROM results"
+            ).fetchone()
+            objects = self.db.execute("SELECT COUNT(DISTINCT object) FROM results").fetchone()[0]
+        return {"results": results, "objects": objects, "pinned": pinned, "hits": hits,
+                "bytes": self.total_bytes()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the generation result cache.")
+    parser.add_argument("command", choices=["status", "list", "pin", "unpin", "evict"])
+    parser.add_argument("images", nargs="*", type=Path, help="output PNGs to pin/unpin")
+    parser.add_argument("--pinned", action="store_true", help="list only pinned results")
+    parser.add_argument("--max-mb", type=float, help="evict down to this size instead of the cap")
+    args = parser.parse_args()
+
+    cache = ResultCache()
+
+    if args.command == "status":
+        s = cache.stats()
+        print(f"Result cache: {cache.dir}")
+        print(f"  results  {s['results']} ({s['objects']} distinct images, {s['pinned']} pinned)")
+        print(f"  size     {s['bytes'] / (1024 * 1024):.1f} MB of {cache.max_bytes / (1024 * 1024):.0f} MB")
+        print(f"  hits     {s['hits']} API calls saved")
+
+    elif args.command == "list":
+        for e in cache.entries(args.pinned):
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_used"]))
+            print(f"  {'*' if e['pinned'] else ' '} {e['label'] or '?':<40} {e['size'] // 1024:>6}KB  "
+                  f"{e['hits']:>3} hits  {used}  {e['key'][:12]}")
+
+    elif args.command in ("pin", "unpin"):
+        if not args.images:
+            parser.error(f"{args.command} needs at least one image")
+        for image in args.images:
+            count = cache.set_pinned(image, args.command == "pin")
+            print(f"  {image.name}: " + (f"{args.command}ned {count} result(s)" if count
+                                         else "not in the cache"))
+
+    elif args.command == "evict":
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        removed, freed = cache.evict(max_bytes)
+        print(f"Evicted {removed} results, freed {freed / (1024 * 1024):.1f} MB")
+
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
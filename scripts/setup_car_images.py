@@ -5,16 +5,48 @@ Import optimized car images into Xcode Assets.xcassets catalog.
 Reads optimized JPEGs from CarImages/optimized/ and creates proper
 imageset directories in Assets.xcassets/CarImages/.
 
+When optimize_car_images.py wrote slot/scale variants (asset_variants.py),
+each car gets a hero imageset (<asset>, @2x/@3x) and a list-thumbnail
+imageset (<asset>_thumb, @2x/@3x); otherwise the single 1200x800 JPEG is
+imported as a universal image, as before. --format picks webp/avif/heic
+variants where they exist, falling back to JPEG per file.
+
+The catalog is synced, not rebuilt: each file is compared by SHA-256 (from
+the asset inventory) with its imageset copy and only changed files are
+brought over — as a reflink (copy-on-write clone, APFS/btrfs/XFS) where the
+filesystem supports it, else a hardlink, else a copy. Contents.json is
+written only when its JSON differs, so an unchanged catalog stays untouched
+and Xcode has nothing to recompile. Truncated JPEGs are reported and skipped.
+
+Imagesets of cars that are no longer in IndianVehicleData.json are reported;
+--prune deletes them (and skips importing optimized images for such cars).
+Discontinued models stay: the app still shows them for existing vehicles.
+
+Finally the "cars" section of the generated AssetIndex.json is refreshed
+(see asset_index.py), so the app knows which cars have images without
+probing the catalog.
+
 Naming convention matches CarImageService.assetName() exactly:
   "Maruti Suzuki" + "Baleno" -> "maruti_suzuki_baleno"
 
 Usage:
     python3 scripts/setup_car_images.py
+    python3 scripts/setup_car_images.py --format heic
+    python3 scripts/setup_car_images.py --prune     # also delete imagesets of dropped models
 """
 
+import os
+import sys
 import json
 import shutil
+import argparse
+import unicodedata
 from pathlib import Path
+from collections import Counter
+
+import asset_index
+from asset_inventory import Inventory, sha256_file
+from asset_variants import DEFAULT_FORMAT, FORMATS, VARIANTS, imageset_name, is_variant, variant_filename
 
 # Configuration
 IMAGES_DIR = Path("/Users/sohail/AutoLedger/CarImages/optimized")
@@ -22,34 +54,192 @@ ASSETS_DIR = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/Assets.xcassets
 DATA_FILE = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/IndianVehicleData.json")
 
 
-def create_imageset(asset_name: str, jpg_path: Path):
-    """Create an imageset directory with Contents.json for a JPEG image."""
-    imageset_dir = ASSETS_DIR / f"{asset_name}.imageset"
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".avif", ".heic")
+
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents (btrfs, XFS)
+
+
+def car_asset_name(make: str, model: str) -> str:
+    """Asset name as CarImageService.assetName() builds it."""
+    safe_make = make.lower().strip().replace(" ", "_").replace("-", "_")
+    safe_model = model.lower().strip().replace(" ", "_").replace("-", "_")
+    return f"{safe_make}_{safe_model}"
+
+
+# ---------------------------------------------------------------------------
+# Copying
+# ---------------------------------------------------------------------------
+
+def _reflink(source: Path, dest: Path):
+    """Copy-on-write clone of `source` at `dest` (which must not exist); raises OSError if unsupported."""
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(dest), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return
+    import fcntl
+    try:
+        with open(source, "rb") as src, open(dest, "xb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        dest.unlink(missing_ok=True)
+        raise
+
+
+def link_or_copy(source: Path, dest: Path) -> str:
+    """Replace `dest` with the contents of `source` as cheaply as the filesystem allows.
+
+    Tries a reflink, then a hardlink (optimize_car_images.py replaces its
+    outputs by rename, so a linked catalog file never changes under us),
+    then a plain copy. Staged next to `dest` and renamed, so a reader never
+    sees a partial file. Returns "reflink", "hardlink" or "copy".
+    """
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    for method, clone in (("reflink", _reflink), ("hardlink", os.link)):
+        try:
+            clone(source, tmp)
+            break
+        except (OSError, AttributeError, ImportError):
+            continue
+    else:
+        method = "copy"
+        shutil.copy2(source, tmp)
+    os.replace(tmp, dest)
+    return method
+
+
+def write_if_changed(path: Path, contents: dict) -> bool:
+    """Write `contents` as JSON unless `path` already holds exactly that. Returns True if written."""
+    text = json.dumps(contents, indent=2)
+    try:
+        if path.read_text() == text:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    path.write_text(text)
+    return True
+
+
+def imageset_files(asset_name: str, jpg_path: Path,
+                   fmt: str = DEFAULT_FORMAT) -> dict[str, list[tuple[Path, str | None]]]:
+    """{imageset: [(source file, scale or None)]} for one car.
+
+    Slot/scale variants next to `jpg_path` are used when every scale of a slot
+    exists (in `fmt`, else JPEG); without hero variants the base JPEG is the
+    single universal image.
+    """
+    sets = {}
+    for slot, scales in VARIANTS.items():
+        files = []
+        for scale in scales:
+            for candidate in dict.fromkeys((fmt, DEFAULT_FORMAT)):
+                path = jpg_path.with_name(variant_filename(asset_name, slot, scale, candidate))
+                if path.exists():
+                    files.append((path, f"{scale}x"))
+                    break
+        if len(files) == len(scales):
+            sets[imageset_name(asset_name, slot)] = files
+    if imageset_name(asset_name, "hero") not in sets:
+        sets[asset_name] = [(jpg_path, None)]
+    return sets
+
+
+def sync_imageset(imageset: str, files: list[tuple[Path, str | None]],
+                  inventory: Inventory | None = None) -> dict:
+    """Bring <imageset>.imageset in line with `files`: copy files whose bytes differ, delete
+    other images there, and rewrite Contents.json only if it changed.
+
+    Hashes come from `inventory` (areas "optimized" and "imagesets") when
+    given, and are kept up to date there; otherwise files are hashed directly.
+    Returns {"copied": [...], "removed": [...], "contents": bool, "methods": Counter},
+    paths relative to ASSETS_DIR.
+    """
+    imageset_dir = ASSETS_DIR / f"{imageset}.imageset"
     imageset_dir.mkdir(parents=True, exist_ok=True)
 
-    # Copy JPEG file
-    dest_file = imageset_dir / f"{asset_name}.jpg"
-    shutil.copy2(jpg_path, dest_file)
+    def digest(area: str, name: str, path: Path) -> str | None:
+        if inventory is None:
+            return sha256_file(path) if path.exists() else None
+        return inventory.sha256(area, name)
+
+    images = []
+    if any(scale for _, scale in files):
+        # Scaled imageset; the empty 1x slot is what Xcode writes itself (no 1x devices on iOS 17)
+        images.append({"idiom": "universal", "scale": "1x"})
+    change = {"copied": [], "removed": [], "contents": False, "methods": Counter()}
+    keep = set()
+    for source, scale in files:
+        # Scale variants keep their @2x/@3x filename; a universal image is <imageset>.jpg
+        filename = source.name if scale else f"{imageset}{source.suffix}"
+        dest = imageset_dir / filename
+        relative = f"{imageset}.imageset/{filename}"
+        if digest("imagesets", relative, dest) != digest("optimized", source.name, source):
+            change["methods"][link_or_copy(source, dest)] += 1
+            change["copied"].append(relative)
+            if inventory is not None:
+                inventory.update_file("imagesets", relative, dest)
+        entry = {"filename": filename, "idiom": "universal"}
+        if scale:
+            entry["scale"] = scale
+        images.append(entry)
+        keep.add(filename)
+
+    for child in imageset_dir.iterdir():
+        if child.suffix.lower() in IMAGE_SUFFIXES and child.name not in keep:
+            child.unlink()
+            relative = f"{imageset}.imageset/{child.name}"
+            change["removed"].append(relative)
+            if inventory is not None:
+                inventory.remove("imagesets", relative)
 
-    # Create Contents.json — universal, no scale specifier (800px raster)
     contents = {
-        "images": [
-            {
-                "filename": f"{asset_name}.jpg",
-                "idiom": "universal",
-            }
-        ],
+        "images": images,
         "info": {
             "author": "xcode",
             "version": 1,
         },
     }
+    change["contents"] = write_if_changed(imageset_dir / "Contents.json", contents)
+    return change
 
-    with open(imageset_dir / "Contents.json", "w") as f:
-        json.dump(contents, f, indent=2)
+
+def create_imageset(asset_name: str, jpg_path: Path, fmt: str = DEFAULT_FORMAT,
+                    inventory: Inventory | None = None) -> tuple[list[str], list[str]]:
+    """Sync the imagesets for one car image. Returns (copied, removed) paths relative to ASSETS_DIR."""
+    copied, removed = [], []
+    for imageset, files in imageset_files(asset_name, jpg_path, fmt).items():
+        change = sync_imageset(imageset, files, inventory)
+        copied += change["copied"]
+        removed += change["removed"]
+    return copied, removed
+
+
+def orphaned_imagesets(known_assets: set[str]) -> list[str]:
+    """Imagesets in the catalog that belong to no car in `known_assets`."""
+    expected = {unicodedata.normalize("NFC", imageset_name(asset, slot))
+                for asset in known_assets for slot in VARIANTS}
+    orphans = []
+    for entry in os.scandir(ASSETS_DIR):
+        if entry.is_dir() and entry.name.endswith(".imageset"):
+            name = entry.name[:-len(".imageset")]
+            # HFS+ hands back decomposed names (citroe\u0308n); compare composed
+            if unicodedata.normalize("NFC", name) not in expected:
+                orphans.append(name)
+    return sorted(orphans)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Import optimized car images into the asset catalog.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                        help="variant codec to bundle where optimize_car_images.py wrote it "
+                             "(default jpeg)")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete imagesets of cars no longer in IndianVehicleData.json")
+    args = parser.parse_args()
+
     if not IMAGES_DIR.exists():
         print(f"Error: Optimized images directory not found: {IMAGES_DIR}")
         print("Run optimize_car_images.py first.")
@@ -65,39 +255,62 @@ def main():
             "version": 1,
         },
     }
-    with open(ASSETS_DIR / "Contents.json", "w") as f:
-        json.dump(folder_contents, f, indent=2)
+    write_if_changed(ASSETS_DIR / "Contents.json", folder_contents)
 
     # Find all optimized JPEGs
-    jpg_files = {p.stem: p for p in sorted(IMAGES_DIR.glob("*.jpg"))}
+    inventory = Inventory()
+    inventory.refresh(["optimized", "imagesets"])
+    jpg_files = {Path(name).stem: IMAGES_DIR / name for name in inventory.names("optimized")
+                 if name.endswith(".jpg") and not is_variant(name)}
 
     if not jpg_files:
         print(f"No JPEG files found in {IMAGES_DIR}")
         return
 
     print(f"Found {len(jpg_files)} optimized images")
+    corrupt = inventory.corrupt("optimized")
+    if corrupt:
+        print(f"Skipping {len(corrupt)} truncated/corrupt JPEGs: {', '.join(corrupt)}")
+
+    totals = {"copied": 0, "removed": 0, "contents": 0, "methods": Counter()}
+
+    def import_image(name: str, path: Path) -> bool:
+        """Sync one car's imagesets. Returns False if they were already current."""
+        changed = False
+        for imageset, files in imageset_files(name, path, args.format).items():
+            change = sync_imageset(imageset, files, inventory)
+            totals["copied"] += len(change["copied"])
+            totals["removed"] += len(change["removed"])
+            totals["contents"] += change["contents"]
+            totals["methods"] += change["methods"]
+            changed |= bool(change["copied"] or change["removed"] or change["contents"])
+        return changed
 
     # Load vehicle data for coverage report
     with open(DATA_FILE) as f:
         data = json.load(f)
 
-    # Build expected asset names from active models
+    # Build expected asset names from active models; every model (discontinued
+    # too) keeps its imagesets when pruning
     expected_names = []
+    known_assets = set()
     for make in data["makes"]:
-        make_name = make["name"]
         for model in make["models"]:
+            name = car_asset_name(make["name"], model["name"])
+            known_assets.add(name)
             if not model.get("discontinued"):
-                safe_make = make_name.lower().strip().replace(" ", "_").replace("-", "_")
-                safe_model = model["name"].lower().strip().replace(" ", "_").replace("-", "_")
-                expected_names.append(f"{safe_make}_{safe_model}")
+                expected_names.append(name)
+    expected = set(expected_names)
 
     # Import images
     imported = 0
+    unchanged = 0
     missing = []
 
     for name in expected_names:
         if name in jpg_files:
-            create_imageset(name, jpg_files[name])
+            if not import_image(name, jpg_files[name]):
+                unchanged += 1
             imported += 1
         else:
             missing.append(name)
@@ -105,9 +318,26 @@ def main():
     # Also import any extra images not in expected list (manual additions)
     extras = 0
     for name, path in jpg_files.items():
-        if name not in expected_names:
-            create_imageset(name, path)
-            extras += 1
+        if name in expected or (args.prune and name not in known_assets):
+            continue
+        if not import_image(name, path):
+            unchanged += 1
+        extras += 1
+
+    # Imagesets of cars dropped from the data file (and not re-imported as extras)
+    orphans = orphaned_imagesets(known_assets if args.prune else known_assets | set(jpg_files))
+    if args.prune:
+        for orphan in orphans:
+            shutil.rmtree(ASSETS_DIR / f"{orphan}.imageset")
+            prefix = f"{orphan}.imageset/"
+            for name in inventory.names("imagesets", valid_only=False):
+                if name.startswith(prefix):
+                    inventory.remove("imagesets", name)
+
+    inventory.save()
+    hashes = {name: inventory.sha256("imagesets", name)
+              for name in inventory.names("imagesets", valid_only=False)}
+    index_written = asset_index.update("cars", ASSETS_DIR, hashes)
 
     # Summary
     print()
@@ -115,6 +345,15 @@ def main():
     print(f"Imported: {imported}/{len(expected_names)} active models")
     if extras > 0:
         print(f"Extras:   {extras} (images not matching active models)")
+    methods = ", ".join(f"{n} {method}" for method, n in totals["methods"].most_common())
+    print(f"Synced:   {totals['copied']} files copied" + (f" ({methods})" if methods else "")
+          + f", {totals['removed']} removed, {totals['contents']} Contents.json written, "
+          f"{unchanged} cars unchanged")
+    if orphans:
+        verb = "Pruned:  " if args.prune else "Orphaned:"
+        print(f"{verb} {len(orphans)} imagesets of cars not in {DATA_FILE.name}"
+              + ("" if args.prune else " (--prune deletes them)"))
+    print(f"Index:    {asset_index.INDEX_FILE.name} {'updated' if index_written else 'unchanged'}")
     coverage = (imported / len(expected_names) * 100) if expected_names else 0
     print(f"Coverage: {coverage:.1f}%")
 
@@ -128,8 +367,9 @@ def main():
     print(f"\nAsset catalog updated: {ASSETS_DIR}")
     print(f"Total imagesets: {imported + extras}")
     print("\nNext steps:")
-    print("1. Build Xcode project — verify no asset catalog errors")
-    print("2. Launch in simulator — check VehicleHeroCard displays images")
+    print("1. python3 scripts/asset_budget.py — check the catalog against its size budget")
+    print("2. Build Xcode project — verify no asset catalog errors")
+    print("3. Launch in simulator — check VehicleHeroCard displays images")
 
 
 if __name__ == "__main__":
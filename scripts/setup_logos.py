@@ -8,6 +8,8 @@ import json
 import shutil
 from pathlib import Path
 
+import asset_index
+
 LOGOS_SOURCE = Path("/Users/sohail/AutoLedger/CarLogos")
 ASSETS_DIR = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/Assets.xcassets/CarLogos")
 
@@ -103,11 +105,13 @@ def main():
             print(f"✗ {brand} - PNG not found")
             missing.append(brand)
 
+    asset_index.update("logos", ASSETS_DIR)
     print(f"\n{found}/{len(BRANDS)} logos added")
     if missing:
         print(f"\nMissing logos ({len(missing)}):")
         for m in missing:
             print(f"  - {m}")
+    print("\nNext: python3 scripts/asset_budget.py — check the catalog against its size budget")
 
 if __name__ == "__main__":
     main()
@@ -9,6 +9,8 @@ import json
 import shutil
 from pathlib import Path
 
+import asset_index
+
 LOGOS_SOURCE = Path("/Users/sohail/AutoLedger/CarLogos")
 ASSETS_DIR = Path("/Users/sohail/AutoLedger/AutoLedger/Resources/Assets.xcassets/CarLogos")
 
@@ -188,9 +190,11 @@ def main():
             failed.append(brand)
             print(f"[FAIL] {brand}")
 
+    asset_index.update("logos", ASSETS_DIR)
     print(f"\n{svg_count} SVG, {png_count} PNG, {len(failed)} failed")
     if failed:
         print(f"Failed: {', '.join(failed)}")
+    print("Next: python3 scripts/asset_budget.py — check the catalog against its size budget")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Trim the studio backdrop and frame every car at the same scale.
+
+Generated images are 1536x1024 with wide, empty dark-gray margins, and the
+car's size within the frame varies from one generation to the next, so
+optimize_car_images.py spent bytes and decode time on backdrop and
+VehicleHeroCard showed some cars noticeably smaller than others.
+
+car_box() finds the car against the studio gradient with NumPy:
+
+1. work on a grayscale copy ANALYSIS_WIDTH pixels wide
+2. model the backdrop as a quadratic surface in x and y, fitted by least
+   squares with the car masked out (two refits, dropping pixels that stand
+   out from the previous fit), which follows both linear gradients and
+   the soft vignette around the car
+3. car pixels are those more than THRESHOLD gray levels from the
+   backdrop; the box spans the rows and columns where at least
+   MIN_LINE_SHARE of pixels are car, so noise and dust don't stretch it
+
+frame() then picks a FRAME_ASPECT crop centred on the car, sized so the
+car spans CAR_WIDTH of the frame's width (or CAR_HEIGHT of its height,
+whichever is tighter). That gives uniform padding and the same car scale
+everywhere. A crop that would leave the image is shifted back inside; where
+it is larger than the image (a car too big for the standard scale) it
+covers the whole image on that side and trim() extends the backdrop by
+repeating its edge pixels. The framed image is then resized to the
+requested output size, so every output has the same dimensions. When no
+plausible car is found the whole image is padded to FRAME_ASPECT instead.
+
+Usage:
+    from studio_framing import trim
+    img = trim(img, (1200, 800))    # framed car at exactly 1200x800
+
+    python3 scripts/studio_framing.py CarImages/tata_nexon.png [...]   # show the boxes
+
+Dependencies: pip3 install Pillow numpy
+"""
+
+import sys
+import argparse
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+FRAMING_VERSION = 2  # bump when the detector or framing changes, to rebuild outputs
+ANALYSIS_WIDTH = 384
+THRESHOLD = 14          # gray levels from the backdrop model that count as car
+MIN_LINE_SHARE = 0.02   # share of a row/column that must be car to be inside the box
+MIN_CAR_AREA = 0.05     # smaller boxes are probably not a car — don't trim
+FRAME_ASPECT = 3 / 2
+CAR_WIDTH = 0.86        # car width / frame width
+CAR_HEIGHT = 0.72       # car height / frame height, for unusually tall cars
+
+
+def available() -> bool:
+    return np is not None
+
+
+def settings() -> dict:
+    """Everything that changes the crop, for build caches."""
+    return {
+        "version": FRAMING_VERSION,
+        "threshold": THRESHOLD,
+        "aspect": round(FRAME_ASPECT, 4),
+        "car_width": CAR_WIDTH,
+        "car_height": CAR_HEIGHT,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Detection
+# ---------------------------------------------------------------------------
+
+def _backdrop(gray):
+    """Quadratic-surface model of the backdrop behind `gray`, fitted around the car."""
+    h, w = gray.shape
+    y, x = np.mgrid[0:h, 0:w]
+    x = x.ravel() / w - 0.5
+    y = y.ravel() / h - 0.5
+    basis = np.stack([np.ones_like(x), x, y, x * x, y * y, x * y], axis=1)
+    values = gray.ravel()
+    keep = np.ones(values.shape, dtype=bool)
+    for _ in range(3):
+        coef, *_ = np.linalg.lstsq(basis[keep], values[keep], rcond=None)
+        model = basis @ coef
+        keep = np.abs(values - model) <= THRESHOLD
+    return model.reshape(h, w)
+
+
+def _span(counts, length: int) -> tuple[int, int] | None:
+    lines = np.flatnonzero(counts >= MIN_LINE_SHARE * length)
+    if len(lines) < 2:
+        return None
+    return int(lines[0]), int(lines[-1]) + 1
+
+
+def car_box(img: "Image.Image") -> tuple[int, int, int, int] | None:
+    """(left, top, right, bottom) of the car in `img`'s pixels, or None if there's no clear subject."""
+    scale = min(1.0, ANALYSIS_WIDTH / img.width)
+    small = img.convert("L")
+    if scale < 1:
+        small = small.resize((ANALYSIS_WIDTH, max(1, round(img.height * scale))), Image.BOX)
+    gray = np.asarray(small, dtype=np.float32)
+    mask = np.abs(gray - _backdrop(gray)) > THRESHOLD
+
+    rows = _span(mask.sum(axis=1), mask.shape[1])
+    cols = _span(mask.sum(axis=0), mask.shape[0])
+    if rows is None or cols is None:
+        return None
+    area = (rows[1] - rows[0]) * (cols[1] - cols[0]) / mask.size
+    if area < MIN_CAR_AREA:
+        return None
+    sx, sy = img.width / mask.shape[1], img.height / mask.shape[0]
+    return (int(cols[0] * sx), int(rows[0] * sy),
+            min(img.width, round(cols[1] * sx)), min(img.height, round(rows[1] * sy)))
+
+
+# ---------------------------------------------------------------------------
+# Framing
+# ---------------------------------------------------------------------------
+
+def _place(start: float, length: float, limit: int) -> float:
+    """Shift a crop's start so it stays inside [0, limit], or covers all of it when longer."""
+    low, high = sorted((0.0, limit - length))
+    return min(max(low, start), high)
+
+
+def frame(box: tuple[int, int, int, int], size: tuple[int, int]) -> tuple[int, int, int, int]:
+    """FRAME_ASPECT crop of an image of `size` that puts the car in `box` at the standard scale.
+
+    The crop reaches past the image where the car is too large to fit; trim() pads those parts.
+    """
+    left, top, right, bottom = box
+    width = max((right - left) / CAR_WIDTH, (bottom - top) / CAR_HEIGHT * FRAME_ASPECT)
+    height = width / FRAME_ASPECT
+    x0 = _place((left + right) / 2 - width / 2, width, size[0])
+    y0 = _place((top + bottom) / 2 - height / 2, height, size[1])
+    return round(x0), round(y0), round(x0 + width), round(y0 + height)
+
+
+def _crop_padded(img: "Image.Image", crop: tuple[int, int, int, int]) -> "Image.Image":
+    """`img` cropped to `crop`, with any part outside the image filled by repeating its edge pixels."""
+    x0, y0, x1, y1 = crop
+    pad = (max(0, -y0), max(0, y1 - img.height)), (max(0, -x0), max(0, x1 - img.width))
+    if not any(pad[0] + pad[1]):
+        return img.crop(crop)
+    # The studio backdrop is smooth at the border, so edge repetition leaves no seam
+    inside = np.asarray(img.crop((max(0, x0), max(0, y0), min(img.width, x1), min(img.height, y1))))
+    return Image.fromarray(np.pad(inside, (*pad, (0, 0)), mode="edge"))
+
+
+def trim(img: "Image.Image", size: tuple[int, int] | None = None) -> "Image.Image":
+    """`img` framed around the car and, with `size`, resized to exactly `size`."""
+    box = car_box(img)
+    if box is None:
+        # No car: just pad to the frame's aspect ratio
+        width = max(img.width, img.height * FRAME_ASPECT)
+        height = width / FRAME_ASPECT
+        x0, y0 = (img.width - width) / 2, (img.height - height) / 2
+        crop = round(x0), round(y0), round(x0 + width), round(y0 + height)
+    else:
+        crop = frame(box, img.size)
+    if crop != (0, 0, img.width, img.height):
+        img = _crop_padded(img.convert("RGB"), crop)
+    if size and img.size != tuple(size):
+        img = img.resize(size, Image.LANCZOS)
+    return img
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the detected car box and framing crop.")
+    parser.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    if not available():
+        print("Error: Pillow and NumPy are required. pip3 install Pillow numpy")
+        sys.exit(1)
+
+    for path in args.images:
+        with Image.open(path) as src:
+            img = src.convert("RGB")
+        box = car_box(img)
+        if box is None:
+            print(f"  {path}: no car found, left as is")
+            continue
+        crop = frame(box, img.size)
+        share = (crop[2] - crop[0]) * (crop[3] - crop[1]) / (img.width * img.height)
+        padded = crop[0] < 0 or crop[1] < 0 or crop[2] > img.width or crop[3] > img.height
+        print(f"  {path}: car {box}, crop {crop} ({share * 100:.0f}% of the frame"
+              f"{', backdrop padded' if padded else ''})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+End-to-end check for image_batch.py: write a batch file, answer it with the
+local stand-in (simulate), ingest the results. Also checks that a results
+file can't write outside the output directory or for jobs nobody asked for.
+
+Usage:
+    python3 scripts/test_image_batch.py
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import image_batch
+
+
+class FakeStore:
+    def __init__(self):
+        self.finished, self.failed = [], {}
+
+    def finish(self, name, method=None):
+        self.finished.append(name)
+
+    def fail(self, name, error):
+        self.failed[name] = error
+
+
+class BatchRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.refs = self.root / "refs"
+        self.out = self.root / "out" / "CarImages"
+        self.out.mkdir(parents=True)
+        self.batch = self.root / "batch.jsonl"
+        self.results = self.root / "results.jsonl"
+
+        self.ref = self.root / "tata_nexon.png"
+        self.ref.write_bytes(image_batch.placeholder_png(24, 16, gray=90))
+        with image_batch.BatchWriter(self.batch, refs_dir=self.refs) as writer:
+            writer.add_edit("tata_nexon", self.ref, "restyle")
+            writer.add_generation("tata_sierra", "a Tata Sierra")
+
+    def append_results(self, *lines):
+        with open(self.results, "a") as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+    def test_write_simulate_ingest(self):
+        self.assertEqual(image_batch.simulate(self.batch, self.results, self.refs), 2)
+        store = FakeStore()
+        result = image_batch.ingest_results(self.results, self.out, image_batch.batch_ids(self.batch), store)
+
+        self.assertEqual(sorted(result["done"]), ["tata_nexon", "tata_sierra"])
+        self.assertEqual(result["failed"], {})
+        self.assertEqual(result["rejected"], {})
+        self.assertEqual(sorted(store.finished), ["tata_nexon", "tata_sierra"])
+        # Edits echo their reference in the stand-in
+        self.assertEqual((self.out / "tata_nexon.png").read_bytes(), self.ref.read_bytes())
+        self.assertEqual((self.out / "tata_sierra.png").read_bytes(), image_batch.placeholder_png())
+        self.assertEqual(sorted(p.name for p in self.out.iterdir()), ["tata_nexon.png", "tata_sierra.png"])
+
+    def test_unsafe_and_unexpected_ids_are_rejected(self):
+        image_batch.simulate(self.batch, self.results, self.refs)
+        with open(self.results) as f:
+            good = json.loads(f.readline())
+        crafted = [dict(good, custom_id=name) for name in ("../../x", "..", "a/b", ".hidden", "mg_hector")]
+        self.append_results(*crafted, "{not json")
+        store = FakeStore()
+        expected = image_batch.batch_ids(self.batch) | {"../../x", "a/b", ".hidden"}
+        result = image_batch.ingest_results(self.results, self.out, expected, store)
+
+        self.assertEqual(sorted(result["done"]), ["tata_nexon", "tata_sierra"])
+        self.assertEqual(set(result["rejected"]),
+                         {"../../x", "..", "a/b", ".hidden", "mg_hector", "line 8"})
+        self.assertEqual(store.failed, {})
+        self.assertFalse((self.root / "x.png").exists())
+        self.assertFalse((self.out.parent / "x.png").exists())
+        written = [p for p in self.root.rglob("*.png") if p.parent not in (self.out, self.refs)]
+        self.assertEqual(written, [self.ref])
+
+    def test_malformed_image_fails_without_writing(self):
+        self.append_results(
+            {"custom_id": "tata_nexon", "error": None,
+             "response": {"status_code": 200, "body": {"data": [{"url": "https://example.com"}]}}},
+            {"custom_id": "tata_sierra", "error": None,
+             "response": {"status_code": 400, "body": {"error": {"message": "rejected prompt"}}}},
+        )
+        store = FakeStore()
+        result = image_batch.ingest_results(self.results, self.out, image_batch.batch_ids(self.batch), store)
+
+        self.assertEqual(result["done"], [])
+        self.assertIn("malformed result", result["failed"]["tata_nexon"])
+        self.assertEqual(result["failed"]["tata_sierra"], "HTTP 400: rejected prompt")
+        self.assertEqual(set(store.failed), {"tata_nexon", "tata_sierra"})
+        self.assertEqual(list(self.out.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Checks for reference_prep.py: a reference is only uploaded as-is when it is
+PNG, JPEG or WebP, and anything else is converted or rejected, never sent
+with a guessed MIME type.
+
+Usage:
+    python3 scripts/test_reference_prep.py
+"""
+
+import io
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import reference_prep
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+
+def encoded(fmt: str, size=(64, 40), **params) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, fmt, **params)
+    return buf.getvalue()
+
+
+class PrepareReferenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(reference_prep, "CACHE_DIR", Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_sniff_extension_rejects_unknown_formats(self):
+        self.assertEqual(reference_prep.sniff_extension(b"\x89PNG\r\n\x1a\n"), ".png")
+        self.assertEqual(reference_prep.sniff_extension(b"\xff\xd8\xff\xe0"), ".jpg")
+        self.assertEqual(reference_prep.sniff_extension(b"RIFF\0\0\0\0WEBPVP8 "), ".webp")
+        self.assertIsNone(reference_prep.sniff_extension(b"\0\0\0\x1cftypavif"))
+        self.assertIsNone(reference_prep.sniff_extension(b"GIF89a"))
+
+    @unittest.skipUnless(Image is not None and features.check("avif"), "needs Pillow with AVIF")
+    def test_small_avif_is_converted_to_jpeg(self):
+        data = encoded("AVIF", quality=20)
+        out = reference_prep.prepare_reference(data)
+        self.assertEqual(out.suffix, ".jpg")
+        self.assertTrue(out.read_bytes().startswith(b"\xff\xd8"))
+
+    @unittest.skipUnless(Image is not None, "needs Pillow")
+    def test_unknown_format_is_never_kept_as_is(self):
+        # Smaller than any JPEG Pillow would write, so only the format check keeps it out
+        data = encoded("GIF", size=(8, 8))
+        out = reference_prep.prepare_reference(data)
+        self.assertEqual(out.suffix, ".jpg")
+        self.assertTrue(out.read_bytes().startswith(b"\xff\xd8"))
+
+    def test_unknown_format_without_pillow_raises(self):
+        with mock.patch.object(reference_prep, "Image", None):
+            with self.assertRaises(ValueError):
+                reference_prep.prepare_reference(b"\0\0\0\x1cftypavif" + b"\0" * 64)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_supported_format_without_pillow_is_kept(self):
+        data = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+        with mock.patch.object(reference_prep, "Image", None):
+            out = reference_prep.prepare_reference(data)
+        self.assertEqual(out.suffix, ".png")
+        self.assertEqual(out.read_bytes(), data)
+
+    def test_concurrent_identical_references(self):
+        # Baleno / Baleno RS: ref workers normalize the same download at once
+        data = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+        workers = 4
+        barrier = threading.Barrier(workers, timeout=5)
+        real_replace = reference_prep.os.replace
+
+        def replace_together(src, dst):
+            barrier.wait()  # every worker has written its temp file
+            real_replace(src, dst)
+
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(reference_prep.prepare_reference(data))
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(reference_prep, "Image", None), \
+                mock.patch.object(reference_prep.os, "replace", replace_together):
+            threads = [threading.Thread(target=worker) for _ in range(workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(results[0].read_bytes(), data)
+        self.assertEqual([p.name for p in Path(self.tmp.name).iterdir()], [results[0].name])
+
+
+if __name__ == "__main__":
+    unittest.main()